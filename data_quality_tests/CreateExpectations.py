@@ -164,6 +164,19 @@ class CreateExpectations:
                                                                       ,"sub_project":subproject})
                                                                 )
 
+    def _approximate_options(self, col):
+        '''
+        Splits the optional trailing options of a cardinality tuple, e.g.
+        ("trip_id", 1000, None, False, False, {"approximate": True, "relative_error": 0.02}).
+            :returns: the tuple without the options and the meta entries they add
+        '''
+        if not col or not isinstance(col[-1], dict):
+            return col, {}
+        options = col[-1]
+        if not options.get("approximate"):
+            return col[:-1], {}
+        return col[:-1], {"approximate": {"method": "hyperloglog", "relative_error": options.get("relative_error", 0.01)}}
+
     def add_cardinality_expectations(self,cardinality_expectations:dict, ge : object, suite: object, project: str, source: str, stage: str,subproject:str):
         '''
         Adds data integrity expectations to a Great Expectations suite based on provided dictionary.
@@ -175,12 +188,15 @@ class CreateExpectations:
                         - max_value (float or None): The maximum proportion of unique values (Proportions are on the range 0 to 1).
                         - strict_min (boolean): If True, the minimum proportion of unique values must be strictly larger than min_value. default=False
                         - strict_max (boolean): If True, the maximum proportion of unique values must be strictly smaller than max_value. default=False
+                        - options (dict, optional, last item): {"approximate": True, "relative_error": 0.01} counts the unique values with a
+                          HyperLogLog sketch of that relative standard error instead of exactly (chunked validation only).
                     - "ExpectColumnUniqueValueCountToBeBetween": List of tuples, each containing:
                         - column (str): The column name.
                         - min_value (int or None): The minimum number of unique values allowed.
                         - max_value (int or None): The maximum number of unique values allowed.
                         - strict_min (bool): If True, the column must have strictly more unique value count than min_value to pass.
                         - strict_max (bool): If True, the column must have strictly fewer unique value count than max_value to pass.
+                        - options (dict, optional, last item): same as in ExpectColumnProportionOfUniqueValuesToBeBetween.
                     - "ExpectColumnValuesToBeUnique"
                         - column (str): The column name.
                     - "ExpectCompoundColumnsToBeUnique"
@@ -195,7 +211,9 @@ class CreateExpectations:
                                 # Expect the values ​​in the "payment_type" column to have a proportion between 0 to 0.01 cn with respect to the total values
                                  "ExpectColumnProportionOfUniqueValuesToBeBetween":[("payment_type",0,0.01)],
                                 # Expect the values ​​in the "pickup_location_id" column to be between 1 and 250 values ​​relative to the total values
-                                 "ExpectColumnUniqueValueCountToBeBetween":[("pickup_location_id",1,250,False,True)],
+                                # and between 1000 and 5000000 trip ids, counted approximately with a 2% error
+                                 "ExpectColumnUniqueValueCountToBeBetween":[("pickup_location_id",1,250,False,True),
+                                                                            ("trip_id",1000,5000000,{"approximate": True, "relative_error": 0.02})],
                                 # Expect values ​​in the "pickup_datatime" column to be unique
                                  "ExpectColumnValuesToBeUnique":[(["pickup_datetime"])],
                                 # Expect the values ​​in the "pickup_datatime" and "dropoff_datatime" columns to be unique for each row
@@ -208,25 +226,27 @@ class CreateExpectations:
         #Check validates that the proportion of unique values in a column falls within a specified range.
         if "ExpectColumnProportionOfUniqueValuesToBeBetween" in cardinality_expectations.keys() and cardinality_expectations["ExpectColumnProportionOfUniqueValuesToBeBetween"]:
             for col in cardinality_expectations["ExpectColumnProportionOfUniqueValuesToBeBetween"]:
+                col, approximate_meta = self._approximate_options(col)
                 suite.add_expectation(
                     ge.expectations.ExpectColumnProportionOfUniqueValuesToBeBetween(column=col[0],min_value=col[1],max_value=col[2],strict_min=col[3] if len(col) > 3 else False,strict_max=col[4]if len(col) > 4 else False, 
                                                                                     meta={"expectation_type": "cardinality", 
                                                                                           "project":project, "source":source, "stage":stage,
                                                                                           "is_critical":self.categorized_expectations_dict['ExpectColumnProportionOfUniqueValuesToBeBetween']['is_critical']
                                                                                           ,"dama_dimension":self.categorized_expectations_dict['ExpectColumnProportionOfUniqueValuesToBeBetween']['dimension']
-                                                                                          ,"sub_project":subproject})
+                                                                                          ,"sub_project":subproject, **approximate_meta})
                                                                                     )
         
         #Check expectation validates that the number of unique values in a column falls within a specified range.
         if "ExpectColumnUniqueValueCountToBeBetween" in cardinality_expectations.keys() and  cardinality_expectations["ExpectColumnUniqueValueCountToBeBetween"]:
             for col in cardinality_expectations["ExpectColumnUniqueValueCountToBeBetween"]:
+                col, approximate_meta = self._approximate_options(col)
                 suite.add_expectation(
                     ge.expectations.ExpectColumnUniqueValueCountToBeBetween(column=col[0],min_value=col[1],max_value=col[2],strict_min=col[3] if len(col) > 3 else False,strict_max=col[4]if len(col) > 4 else False,
                                                                              meta={"expectation_type": "cardinality", 
                                                                                    "project":project, "source":source, "stage":stage,
                                                                                   "is_critical":self.categorized_expectations_dict['ExpectColumnUniqueValueCountToBeBetween']['is_critical']
                                                                                   ,"dama_dimension":self.categorized_expectations_dict['ExpectColumnUniqueValueCountToBeBetween']['dimension']
-                                                                                  ,"sub_project":subproject})
+                                                                                  ,"sub_project":subproject, **approximate_meta})
                                                                              )
         
         #checks for duplicate values in a column, flagging any duplicates as exceptions.
@@ -414,7 +434,8 @@ class CreateExpectations:
         - "ExpectColumnQuantileValuesToBeBetween": List of dictionaries, each containing:
             - column (str): The column name.
             - quantile_ranges (dict): A dictionary mapping quantile ranges to minimum and maximum values.
-            - allow_relative_error (str): Optional error margin allowed when calculating quantiles.
+            - allow_relative_error (str): Optional error margin allowed when calculating quantiles. A number between 0 and 1 is
+              also the rank error of the quantile sketch used by chunked validation (1.33% otherwise).
             - Expectation: The values for the specified quantiles should fall between the provided ranges.
 
     :param ge: module of Great Expectations.
@@ -0,0 +1,778 @@
+import re
+from datetime import datetime, timezone
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from sketches import HyperLogLog, KLLSketch
+
+"""
+Chunked (and native) validation engine.
+
+Evaluates a compiled suite over a sequence of DataFrame chunks. Every
+expectation keeps a small partial state (counts, sums, min/max, distinct
+values...) that is updated chunk by chunk and can be merged with the state of
+another shard, so memory depends on the chunk size and not on the size of the
+source. The expectations over a column share one ColumnView per chunk, so
+the column is converted and scanned once for all of them. Validating a whole
+DataFrame as a single chunk is the native engine, used instead of Great
+Expectations for datasets configured with engine: native. The outcome is a
+dictionary shaped like a Great Expectations validation result, the one
+Utils.parse_validation_results reads.
+"""
+
+DEFAULT_CHUNK_SIZE = 100000
+# Unexpected values kept per expectation, as partial_unexpected_list in GE.
+PARTIAL_UNEXPECTED_COUNT = 20
+
+
+def _within(value, min_value=None, max_value=None, strict_min=False, strict_max=False) -> bool:
+    if value is None:
+        return False
+    if min_value is not None and (value <= min_value if strict_min else value < min_value):
+        return False
+    if max_value is not None and (value >= max_value if strict_max else value > max_value):
+        return False
+    return True
+
+
+def _python(value):
+    # numpy scalars are not JSON serializable, missing values are reported
+    # as None
+    value = value.item() if isinstance(value, np.generic) else value
+    return None if isinstance(value, float) and value != value else value
+
+
+class ColumnView:
+    """
+    One column of a chunk and the arrays derived from it, each computed the
+    first time an expectation asks for it. The expectations over a column
+    share its view, so the missing mask and the numeric, text and length
+    conversions are done once per column and chunk whatever the number of
+    checks.
+    """
+    def __init__(self, values: pd.Series):
+        self.values = values
+
+    @cached_property
+    def missing(self) -> pd.Series:
+        return self.values.isna()
+
+    @cached_property
+    def present(self) -> pd.Series:
+        return self.values[~self.missing]
+
+    @cached_property
+    def numbers(self) -> pd.Series:
+        return pd.to_numeric(self.present, errors="coerce")
+
+    @cached_property
+    def strings(self) -> pd.Series:
+        return self.present.astype(str)
+
+    @cached_property
+    def lengths(self) -> pd.Series:
+        return self.strings.str.len()
+
+
+class ExpectationState:
+    """
+    Partial state of one expectation over the chunks seen so far.
+
+    Parameters
+    ----------
+    config : dict
+        Expectation configuration with type, kwargs and meta
+    """
+    def __init__(self, config: dict):
+        self.config = config
+        self.kwargs = config["kwargs"]
+
+    def start(self, header: list, shared: dict):
+        """
+        Called once before any chunk with the column names of the source and
+        a dictionary shared by the expectations of the shard, for state
+        several of them read (see QuantileState and view).
+        """
+        self.header = header
+        self.shared = shared
+
+    def view(self, chunk: pd.DataFrame, column: str) -> ColumnView:
+        """The ColumnView of a column of the chunk, shared within the shard."""
+        views = self.shared.get("views")
+        if views is None or views[0] is not chunk:
+            views = self.shared["views"] = (chunk, {})
+        if column not in views[1]:
+            views[1][column] = ColumnView(chunk[column])
+        return views[1][column]
+
+    def update(self, chunk: pd.DataFrame):
+        """Adds the rows of a chunk."""
+
+    def merge(self, other: "ExpectationState"):
+        """Adds the state of the same expectation computed over other rows."""
+
+    def result(self) -> tuple:
+        """Returns (success, result dict) over every row seen."""
+        raise NotImplementedError
+
+
+class MapState(ExpectationState):
+    """
+    Row-level expectations (GE map expectations): counts rows, missing
+    (ignored) rows and unexpected rows, and applies mostly to the share of
+    unexpected rows among the non-missing ones.
+    """
+    # expect_column_values_to_(not_)be_null count against every row
+    counts_missing = False
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.element_count = 0
+        self.missing_count = 0
+        self.unexpected_count = 0
+        self.partial_unexpected_list = []
+
+    def add(self, element_count: int, missing_count: int, unexpected_count: int, unexpected_values):
+        """Adds the counts of a chunk and the first of its unexpected values."""
+        self.element_count += element_count
+        self.missing_count += missing_count
+        self.unexpected_count += unexpected_count
+        room = PARTIAL_UNEXPECTED_COUNT - len(self.partial_unexpected_list)
+        if room > 0 and unexpected_count:
+            self.partial_unexpected_list.extend(unexpected_values(room))
+
+    def merge(self, other: "MapState"):
+        self.element_count += other.element_count
+        self.missing_count += other.missing_count
+        self.unexpected_count += other.unexpected_count
+        room = PARTIAL_UNEXPECTED_COUNT - len(self.partial_unexpected_list)
+        self.partial_unexpected_list.extend(other.partial_unexpected_list[:max(room, 0)])
+
+    def result(self) -> tuple:
+        nonmissing = self.element_count - self.missing_count
+        total = self.element_count if self.counts_missing else nonmissing
+        unexpected_percent = 100 * self.unexpected_count / total if total else None
+        mostly = self.kwargs.get("mostly", 1)
+        success = total == 0 or (1 - self.unexpected_count / total) >= mostly
+        return success, {
+            "element_count": self.element_count,
+            "missing_count": self.missing_count,
+            "missing_percent": 100 * self.missing_count / self.element_count if self.element_count else None,
+            "unexpected_count": self.unexpected_count,
+            "unexpected_percent": unexpected_percent,
+            "unexpected_percent_nonmissing": (100 * self.unexpected_count / nonmissing
+                                              if nonmissing else None),
+            "partial_unexpected_list": self.partial_unexpected_list,
+        }
+
+
+class ColumnMapState(MapState):
+    """Map expectations over the non-missing values of one column."""
+    def unexpected(self, view: ColumnView) -> pd.Series:
+        """Boolean mask of the unexpected values among view.present."""
+        raise NotImplementedError
+
+    def update(self, chunk: pd.DataFrame):
+        view = self.view(chunk, self.kwargs["column"])
+        if self.counts_missing:
+            unexpected = self.unexpected_rows(view)
+        else:
+            unexpected = view.present[np.asarray(self.unexpected(view), dtype=bool)]
+        self.add(len(view.values), int(view.missing.sum()), len(unexpected),
+                 lambda room: [_python(value) for value in unexpected.head(room)])
+
+    def unexpected_rows(self, view: ColumnView) -> pd.Series:
+        raise NotImplementedError
+
+
+class NotNullState(ColumnMapState):
+    counts_missing = True
+
+    def unexpected_rows(self, view):
+        return view.values[view.missing]
+
+
+class NullState(ColumnMapState):
+    counts_missing = True
+
+    def unexpected_rows(self, view):
+        return view.present
+
+
+class BetweenState(ColumnMapState):
+    def unexpected(self, view):
+        numbers = view.numbers
+        expected = numbers.notna()
+        min_value, max_value = self.kwargs.get("min_value"), self.kwargs.get("max_value")
+        if min_value is not None:
+            expected &= numbers > min_value if self.kwargs.get("strict_min") else numbers >= min_value
+        if max_value is not None:
+            expected &= numbers < max_value if self.kwargs.get("strict_max") else numbers <= max_value
+        return ~expected
+
+
+class InSetState(ColumnMapState):
+    def unexpected(self, view):
+        return ~view.present.isin(self.kwargs["value_set"])
+
+
+class NotInSetState(ColumnMapState):
+    def unexpected(self, view):
+        return view.present.isin(self.kwargs["value_set"])
+
+
+class LengthState(ColumnMapState):
+    def unexpected(self, view):
+        lengths = view.lengths
+        if self.config["type"] == "expect_column_value_lengths_to_equal":
+            return lengths != self.kwargs["value"]
+        expected = pd.Series(True, index=lengths.index)
+        min_value, max_value = self.kwargs.get("min_value"), self.kwargs.get("max_value")
+        if min_value is not None:
+            expected &= lengths > min_value if self.kwargs.get("strict_min") else lengths >= min_value
+        if max_value is not None:
+            expected &= lengths < max_value if self.kwargs.get("strict_max") else lengths <= max_value
+        return ~expected
+
+
+def _like_regex(pattern: str) -> str:
+    # SQL LIKE: % is any text, _ any single character, the rest is literal.
+    return "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern)
+
+
+class PatternState(ColumnMapState):
+    """
+    Regex (searched anywhere in the value, as GE does) and SQL LIKE (matching
+    the whole value) expectations, single pattern or list, over the values
+    as text.
+    """
+    def unexpected(self, view):
+        kind = self.config["type"]
+        if "like_pattern" in kind:
+            patterns = self.kwargs.get("like_pattern_list") or [self.kwargs.get("like_pattern")]
+            matches = [view.strings.str.fullmatch(_like_regex(pattern), flags=re.DOTALL)
+                       for pattern in patterns]
+        else:
+            patterns = self.kwargs.get("regex_list") or [self.kwargs.get("regex")]
+            matches = [view.strings.str.contains(pattern, regex=True) for pattern in patterns]
+        if "not_match" in kind:
+            # Unexpected when any of the patterns matches
+            return np.logical_or.reduce(matches)
+        if self.kwargs.get("match_on", "any") == "all":
+            return ~np.logical_and.reduce(matches)
+        return ~np.logical_or.reduce(matches)
+
+
+class MulticolumnMapState(MapState):
+    """
+    Map expectations over the rows of several columns. Rows are ignored
+    (counted as missing) following ignore_row_if, with GE's default for each
+    expectation.
+    """
+    default_ignore_row_if = "all_values_are_missing"
+
+    def columns(self) -> list:
+        return list(self.kwargs.get("column_list") or [self.kwargs["column_A"], self.kwargs["column_B"]])
+
+    def unexpected(self, rows: pd.DataFrame) -> pd.Series:
+        """Boolean mask of the unexpected rows among the ones not ignored."""
+        raise NotImplementedError
+
+    def update(self, chunk: pd.DataFrame):
+        columns = self.columns()
+        rows = chunk[columns]
+        missing = pd.concat([self.view(chunk, column).missing for column in columns], axis=1)
+        ignore_row_if = self.kwargs.get("ignore_row_if") or self.default_ignore_row_if
+        if ignore_row_if in ("all_values_are_missing", "both_values_are_missing"):
+            ignored = missing.all(axis=1)
+        elif ignore_row_if in ("any_value_is_missing", "either_value_is_missing"):
+            ignored = missing.any(axis=1)
+        else:
+            ignored = pd.Series(False, index=rows.index)
+        rows = rows[~ignored.to_numpy()]
+        unexpected = rows[np.asarray(self.unexpected(rows), dtype=bool)]
+        self.add(len(chunk), int(ignored.sum()), len(unexpected),
+                 lambda room: [{column: _python(value) for column, value in row.items()}
+                               for row in unexpected.head(room).to_dict("records")])
+
+
+class PairEqualState(MulticolumnMapState):
+    default_ignore_row_if = "both_values_are_missing"
+
+    def unexpected(self, rows):
+        column_a, column_b = self.columns()
+        return (rows[column_a] != rows[column_b]).to_numpy()
+
+
+class MulticolumnSumState(MulticolumnMapState):
+    def unexpected(self, rows):
+        numbers = rows.apply(pd.to_numeric, errors="coerce")
+        return (numbers.sum(axis=1, skipna=False) != self.kwargs["sum_total"]).to_numpy()
+
+
+class UniqueWithinRecordState(MulticolumnMapState):
+    def unexpected(self, rows):
+        # A row is unexpected when two of its columns hold the same value
+        # (two missing values count as the same, as in GE).
+        columns = self.columns()
+        repeated = np.zeros(len(rows), dtype=bool)
+        for i, column_a in enumerate(columns):
+            for column_b in columns[i + 1:]:
+                a, b = rows[column_a], rows[column_b]
+                repeated |= ((a == b) | (a.isna() & b.isna())).to_numpy()
+        return repeated
+
+
+class UniqueState(MapState):
+    """
+    Values (expect_column_values_to_be_unique) or row combinations
+    (expect_compound_columns_to_be_unique) that must not repeat. The state is
+    the count of every distinct value, duplicates across chunks and shards are
+    found when they are merged.
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, chunk: pd.DataFrame):
+        if "column" in self.kwargs:
+            view = self.view(chunk, self.kwargs["column"])
+            element_count, ignored, counts = len(view.values), int(view.missing.sum()), view.present.value_counts()
+        else:
+            rows = chunk[list(self.kwargs["column_list"])]
+            ignored = rows.isna().all(axis=1)
+            element_count, counts = len(rows), rows[~ignored.to_numpy()].value_counts(dropna=False)
+            ignored = int(ignored.sum())
+        self.element_count += element_count
+        self.missing_count += ignored
+        self.counts = self.counts.add(counts, fill_value=0) if len(self.counts) else counts
+
+    def merge(self, other: "UniqueState"):
+        self.element_count += other.element_count
+        self.missing_count += other.missing_count
+        if len(other.counts):
+            self.counts = self.counts.add(other.counts, fill_value=0) if len(self.counts) else other.counts
+
+    def result(self) -> tuple:
+        repeated = self.counts[self.counts > 1]
+        self.unexpected_count = int(repeated.sum())
+        self.partial_unexpected_list = []
+        for value, count in repeated.items():
+            room = PARTIAL_UNEXPECTED_COUNT - len(self.partial_unexpected_list)
+            if room <= 0:
+                break
+            value = list(map(_python, value)) if isinstance(value, tuple) else _python(value)
+            self.partial_unexpected_list.extend([value] * min(int(count), room))
+        return super().result()
+
+
+class ColumnAggregateState(ExpectationState):
+    """
+    min, max, sum, mean and standard deviation of a column, kept as count,
+    sum, min, max and the sum of squared deviations (merged with Chan's
+    parallel formula) so any of them is exact over all the chunks.
+    """
+    statistic = None
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, chunk: pd.DataFrame):
+        values = self.view(chunk, self.kwargs["column"]).numbers.dropna().to_numpy(dtype=float)
+        if not len(values):
+            return
+        other = type(self)(self.config)
+        other.count = len(values)
+        other.sum = float(values.sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        other.mean = other.sum / other.count
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        self.merge(other)
+
+    def merge(self, other: "ColumnAggregateState"):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count = count
+
+    def observed_value(self):
+        if not self.count:
+            return None
+        if self.statistic == "stdev":
+            # Sample standard deviation, as pandas and GE compute it
+            return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None
+        return getattr(self, self.statistic)
+
+    def result(self) -> tuple:
+        observed_value = self.observed_value()
+        success = _within(observed_value, self.kwargs.get("min_value"), self.kwargs.get("max_value"),
+                          self.kwargs.get("strict_min", False), self.kwargs.get("strict_max", False))
+        return success, {"observed_value": observed_value}
+
+
+def _aggregate_state(statistic):
+    return type(f"Column{statistic.title()}State", (ColumnAggregateState,), {"statistic": statistic})
+
+
+class DistinctValuesState(ExpectationState):
+    """
+    Distinct values of a column compared with value_set. The state is the set
+    of distinct values, bounded by the column cardinality.
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.values = set()
+
+    def update(self, chunk: pd.DataFrame):
+        self.values.update(_python(value) for value in self.view(chunk, self.kwargs["column"]).present.unique())
+
+    def merge(self, other: "DistinctValuesState"):
+        self.values |= other.values
+
+    def result(self) -> tuple:
+        value_set = set(self.kwargs.get("value_set") or [])
+        success = {
+            "expect_column_distinct_values_to_be_in_set": self.values <= value_set,
+            "expect_column_distinct_values_to_contain_set": value_set <= self.values,
+            "expect_column_distinct_values_to_equal_set": self.values == value_set,
+        }[self.config["type"]]
+        return success, {"observed_value": sorted(self.values, key=str)}
+
+
+class UniqueValuesState(ExpectationState):
+    """
+    Number (or proportion among the non-missing values) of distinct values of
+    a column. Exact by default, keeping the set of distinct values; with
+    meta.approximate the distinct values are counted by a HyperLogLog sketch
+    of fixed size and the result details report its relative standard error.
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        approximate = (config.get("meta") or {}).get("approximate")
+        self.sketch = HyperLogLog(approximate.get("relative_error")) if approximate else None
+        self.values = set()
+        self.nonmissing_count = 0
+
+    def update(self, chunk: pd.DataFrame):
+        values = self.view(chunk, self.kwargs["column"]).present
+        self.nonmissing_count += len(values)
+        if self.sketch is not None:
+            self.sketch.update(values)
+        else:
+            self.values.update(_python(value) for value in values.unique())
+
+    def merge(self, other: "UniqueValuesState"):
+        self.nonmissing_count += other.nonmissing_count
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+        else:
+            self.values |= other.values
+
+    def result(self) -> tuple:
+        unique_count = self.sketch.estimate() if self.sketch is not None else len(self.values)
+        if self.config["type"] == "expect_column_proportion_of_unique_values_to_be_between":
+            observed_value = (min(unique_count / self.nonmissing_count, 1.0)
+                              if self.nonmissing_count else None)
+        else:
+            observed_value = unique_count
+        success = _within(observed_value, self.kwargs.get("min_value"), self.kwargs.get("max_value"),
+                          self.kwargs.get("strict_min", False), self.kwargs.get("strict_max", False))
+        result = {"observed_value": observed_value}
+        if self.sketch is not None:
+            result["details"] = {"approximate": True, "method": "hyperloglog",
+                                 "relative_standard_error": self.sketch.relative_standard_error,
+                                 "registers": len(self.sketch.registers)}
+        return success, result
+
+
+# Quantile interpolations of pandas, an allow_relative_error GE accepts on
+# in-memory data.
+INTERPOLATIONS = ("linear", "lower", "higher", "midpoint", "nearest")
+
+
+class QuantileState(ExpectationState):
+    """
+    Median and quantile expectations, answered from a KLL sketch of the
+    column (see sketches.KLLSketch for its rank error). The expectations of
+    a shard over the same column share one sketch: the first of them updates
+    and merges it, the others only read it. allow_relative_error, when it is
+    a number, is the rank error wanted; the sketch is sized for the
+    smallest one asked over the column.
+
+    For an exact validator (a single in-memory frame) the values are kept and
+    answered as GE does on pandas: Series.median, and Series.quantile with
+    the allow_relative_error interpolation ("nearest" by default).
+    """
+    def start(self, header: list, shared: dict):
+        super().start(header, shared)
+        self.exact = shared.get("exact", False)
+        if self.exact:
+            self.values = []
+            return
+        self.key = ("quantiles", self.kwargs["column"])
+        # A number, also given as an int or numeric text; the interpolation
+        # names GE takes on pandas leave the default size.
+        try:
+            rank_error = float(self.kwargs.get("allow_relative_error"))
+        except (TypeError, ValueError):
+            rank_error = None
+        k = KLLSketch.k_for_rank_error(rank_error) if rank_error is not None and 0 < rank_error < 1 else None
+        self.owner = self.key not in shared
+        if self.owner or KLLSketch(k).k > shared[self.key].k:
+            shared[self.key] = KLLSketch(k)
+
+    @property
+    def sketch(self) -> KLLSketch:
+        return self.shared[self.key]
+
+    def update(self, chunk: pd.DataFrame):
+        if self.exact:
+            self.values.append(self.view(chunk, self.kwargs["column"]).numbers.dropna())
+        elif self.owner:
+            self.sketch.update(self.view(chunk, self.kwargs["column"]).numbers)
+
+    def merge(self, other: "QuantileState"):
+        if self.exact:
+            self.values.extend(other.values)
+        elif self.owner:
+            self.sketch.merge(other.sketch)
+
+    def _exact_result(self) -> tuple:
+        values = pd.concat(self.values) if self.values else pd.Series(dtype=float)
+        if self.config["type"] == "expect_column_median_to_be_between":
+            observed_value = _python(values.median()) if len(values) else None
+            return _within(observed_value, self.kwargs.get("min_value"), self.kwargs.get("max_value"),
+                           self.kwargs.get("strict_min", False), self.kwargs.get("strict_max", False)), \
+                {"observed_value": observed_value}
+        quantile_ranges = self.kwargs["quantile_ranges"]
+        interpolation = self.kwargs.get("allow_relative_error")
+        if interpolation not in INTERPOLATIONS:
+            interpolation = "nearest"
+        quantiles = [float(quantile) for quantile in quantile_ranges["quantiles"]]
+        observed = (values.quantile(quantiles, interpolation=interpolation).tolist() if len(values)
+                    else [None] * len(quantiles))
+        observed = [_python(value) for value in observed]
+        success_details = [_within(value, *value_range)
+                           for value, value_range in zip(observed, quantile_ranges["value_ranges"])]
+        return all(success_details), {
+            "observed_value": {"quantiles": quantile_ranges["quantiles"], "values": observed},
+            "details": {"success_details": success_details},
+        }
+
+    def result(self) -> tuple:
+        if self.exact:
+            return self._exact_result()
+        details = {"approximate": True, "method": "kll", "rank_error": self.sketch.rank_error(),
+                   "count": self.sketch.count}
+        if self.config["type"] == "expect_column_median_to_be_between":
+            observed_value = self.sketch.quantiles([0.5])[0]
+            return _within(observed_value, self.kwargs.get("min_value"), self.kwargs.get("max_value"),
+                           self.kwargs.get("strict_min", False), self.kwargs.get("strict_max", False)), \
+                {"observed_value": observed_value, "details": details}
+        quantile_ranges = self.kwargs["quantile_ranges"]
+        values = self.sketch.quantiles(quantile_ranges["quantiles"])
+        details["success_details"] = [_within(value, *value_range)
+                                      for value, value_range in zip(values, quantile_ranges["value_ranges"])]
+        return all(details["success_details"]), {
+            "observed_value": {"quantiles": quantile_ranges["quantiles"], "values": values},
+            "details": details,
+        }
+
+
+class RowCountState(ExpectationState):
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.count = 0
+
+    def update(self, chunk: pd.DataFrame):
+        self.count += len(chunk)
+
+    def merge(self, other: "RowCountState"):
+        self.count += other.count
+
+    def result(self) -> tuple:
+        if self.config["type"] == "expect_table_row_count_to_equal":
+            return self.count == self.kwargs["value"], {"observed_value": self.count}
+        return _within(self.count, self.kwargs.get("min_value"), self.kwargs.get("max_value"),
+                       self.kwargs.get("strict_min", False), self.kwargs.get("strict_max", False)), \
+            {"observed_value": self.count}
+
+
+class HeaderState(ExpectationState):
+    """Table-level schema expectations, answered from the column names."""
+    def result(self) -> tuple:
+        kind, header = self.config["type"], list(self.header)
+        if kind == "expect_column_to_exist":
+            return self.kwargs["column"] in header, {}
+        if kind == "expect_table_column_count_to_equal":
+            return len(header) == self.kwargs["value"], {"observed_value": len(header)}
+        if kind == "expect_table_column_count_to_be_between":
+            return _within(len(header), self.kwargs.get("min_value"), self.kwargs.get("max_value")), \
+                {"observed_value": len(header)}
+        if kind == "expect_table_columns_to_match_ordered_list":
+            return header == list(self.kwargs["column_list"]), {"observed_value": header}
+        column_set = set(self.kwargs["column_set"])
+        if self.kwargs.get("exact_match", True):
+            return set(header) == column_set, {"observed_value": header}
+        return column_set <= set(header), {"observed_value": header}
+
+
+def expectation_result(config: dict, success: bool, result: dict) -> dict:
+    """Result entry of one expectation, as in a Great Expectations result."""
+    return {
+        "success": bool(success),
+        "expectation_config": config,
+        "result": result,
+        "exception_info": {"raised_exception": False, "exception_traceback": None,
+                           "exception_message": None},
+    }
+
+
+def suite_result(suite_name: str, results: list, started_at: datetime = None) -> dict:
+    """
+    Builds a validation result from the entries of its expectations.
+
+    Returns
+    -------
+    dict
+        success, results (one per expectation with expectation_config,
+        success and result), statistics and meta.batch_markers.ge_load_time
+    """
+    started_at = started_at or datetime.now(timezone.utc)
+    successful = sum(bool(result["success"]) for result in results)
+    return {
+        "success": successful == len(results),
+        "suite_name": suite_name,
+        "results": results,
+        "statistics": {
+            "evaluated_expectations": len(results),
+            "successful_expectations": successful,
+            "unsuccessful_expectations": len(results) - successful,
+            "success_percent": 100 * successful / len(results) if results else None,
+        },
+        "meta": {"batch_markers": {"ge_load_time": started_at.strftime("%Y%m%dT%H%M%S.%fZ")}},
+    }
+
+
+# Expectation types the engine evaluates and the state class of each.
+STATES = {
+    "expect_column_values_to_not_be_null": NotNullState,
+    "expect_column_values_to_be_null": NullState,
+    "expect_column_values_to_be_between": BetweenState,
+    "expect_column_values_to_be_in_set": InSetState,
+    "expect_column_values_to_not_be_in_set": NotInSetState,
+    "expect_column_value_lengths_to_be_between": LengthState,
+    "expect_column_value_lengths_to_equal": LengthState,
+    "expect_column_values_to_match_regex": PatternState,
+    "expect_column_values_to_match_regex_list": PatternState,
+    "expect_column_values_to_not_match_regex": PatternState,
+    "expect_column_values_to_not_match_regex_list": PatternState,
+    "expect_column_values_to_match_like_pattern": PatternState,
+    "expect_column_values_to_match_like_pattern_list": PatternState,
+    "expect_column_values_to_not_match_like_pattern": PatternState,
+    "expect_column_values_to_not_match_like_pattern_list": PatternState,
+    "expect_column_values_to_be_unique": UniqueState,
+    "expect_compound_columns_to_be_unique": UniqueState,
+    "expect_select_column_values_to_be_unique_within_record": UniqueWithinRecordState,
+    "expect_column_pair_values_to_be_equal": PairEqualState,
+    "expect_multicolumn_sum_to_equal": MulticolumnSumState,
+    "expect_column_min_to_be_between": _aggregate_state("min"),
+    "expect_column_max_to_be_between": _aggregate_state("max"),
+    "expect_column_sum_to_be_between": _aggregate_state("sum"),
+    "expect_column_mean_to_be_between": _aggregate_state("mean"),
+    "expect_column_stdev_to_be_between": _aggregate_state("stdev"),
+    "expect_column_median_to_be_between": QuantileState,
+    "expect_column_quantile_values_to_be_between": QuantileState,
+    "expect_column_distinct_values_to_be_in_set": DistinctValuesState,
+    "expect_column_distinct_values_to_contain_set": DistinctValuesState,
+    "expect_column_distinct_values_to_equal_set": DistinctValuesState,
+    "expect_column_unique_value_count_to_be_between": UniqueValuesState,
+    "expect_column_proportion_of_unique_values_to_be_between": UniqueValuesState,
+    "expect_table_row_count_to_be_between": RowCountState,
+    "expect_table_row_count_to_equal": RowCountState,
+    "expect_column_to_exist": HeaderState,
+    "expect_table_column_count_to_equal": HeaderState,
+    "expect_table_column_count_to_be_between": HeaderState,
+    "expect_table_columns_to_match_ordered_list": HeaderState,
+    "expect_table_columns_to_match_set": HeaderState,
+}
+
+
+class ChunkedValidator:
+    """
+    Validates an expectation suite chunk by chunk.
+
+    Parameters
+    ----------
+    expectation_configs : list
+        Expectation configurations (type, kwargs, meta) of the suite
+    suite_name : str
+        Name reported in the result
+    exact : bool, optional
+        Keeps the values of median and quantile expectations instead of a
+        sketch, for a single frame already in memory (the native engine)
+
+    Raises
+    ------
+    ValueError
+        If the suite has expectations the engine can not evaluate
+    """
+    def __init__(self, expectation_configs: list, suite_name: str, exact: bool = False):
+        unsupported = sorted({config["type"] for config in expectation_configs
+                              if config["type"] not in STATES})
+        if unsupported:
+            raise ValueError(f"Not supported in chunked validation: {', '.join(unsupported)}")
+        self.expectation_configs = expectation_configs
+        self.suite_name = suite_name
+        self.exact = exact
+
+    def new_states(self, header: list) -> list:
+        """Empty partial states of every expectation, one per shard."""
+        states = [STATES[config["type"]](config) for config in self.expectation_configs]
+        shared = {"exact": self.exact}
+        for state in states:
+            state.start(header, shared)
+        return states
+
+    def update(self, states: list, chunk: pd.DataFrame):
+        for state in states:
+            state.update(chunk)
+
+    def merge(self, states: list, others: list) -> list:
+        """Merges the states of another shard into states."""
+        for state, other in zip(states, others):
+            state.merge(other)
+        return states
+
+    def result(self, states: list, started_at: datetime = None) -> dict:
+        """
+        Builds the validation result of the merged states, see
+        suite_result.
+        """
+        return suite_result(self.suite_name,
+                            [expectation_result(state.config, *state.result()) for state in states],
+                            started_at)
+
+    def validate(self, chunks, header: list) -> dict:
+        """
+        Validates an iterable of DataFrame chunks holding the columns of
+        header (or a projection of them).
+        """
+        started_at = datetime.now(timezone.utc)
+        states = self.new_states(header)
+        for chunk in chunks:
+            self.update(states, chunk)
+        return self.result(states, started_at)
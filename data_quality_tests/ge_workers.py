@@ -0,0 +1,144 @@
+import logging
+import multiprocessing as mp
+import os
+import signal
+import threading
+import great_expectations as ge
+from suite_compiler import SuiteCompiler, suite_key
+
+logger = logging.getLogger(__name__)
+
+"""
+Per-process Great Expectations state.
+
+Every process (the main one or a pool worker) builds a single in-memory
+(ephemeral) Data Context and keeps the expectation suites it has built, so
+datasets and configs validated later by the same process reuse both instead
+of starting Great Expectations again.
+"""
+
+_state = {"pid": None, "context": None, "suites": {}}
+_lock = threading.RLock()
+
+
+def get_context():
+    """
+    Returns the ephemeral Data Context of the current process, created on the
+    first call.
+
+    Returns
+    -------
+    great_expectations.data_context.EphemeralDataContext
+        Context shared by every validation run in this process
+    """
+    with _lock:
+        # A forked worker inherits the parent's state, it must not share the
+        # parent's context objects.
+        if _state["pid"] != os.getpid():
+            _state.update(pid=os.getpid(), context=None, suites={})
+        if _state["context"] is None:
+            _state["context"] = ge.get_context(mode="ephemeral")
+        return _state["context"]
+
+
+def get_suite(ge_utils_instance, expectation_suite_name: str, suite_config: dict, project: str,
+              sub_project: str, stage: str, source: str, create_expectations_instance,
+              cache_path: str = None):
+    """
+    Returns the suite for a dataset, compiled (or loaded from the compiled
+    suites cache) and added to the context only the first time this process
+    sees its key.
+
+    Parameters
+    ----------
+    ge_utils_instance : geutils
+        Holds the expectation dictionaries of the suite
+    expectation_suite_name : str
+        Suite name in the configuration file
+    suite_config : dict
+        Configuration of the suite (config["expectation_suites"][name])
+    project, sub_project, stage, source : str
+        Metadata written into every expectation
+    create_expectations_instance : CreateExpectations
+        Adds the expectations to the suite
+    cache_path : str, optional
+        Directory of the compiled suites, see SuiteCompiler
+
+    Returns
+    -------
+    tuple
+        (suite, registered suite name)
+    """
+    key = suite_key(expectation_suite_name, suite_config, project, sub_project, stage, source)
+    context = get_context()
+    with _lock:
+        if key not in _state["suites"]:
+            suite, _ = SuiteCompiler(cache_path).compile(
+                ge_utils_instance, expectation_suite_name, suite_config, project=project,
+                sub_project=sub_project, stage=stage, source=source,
+                create_expectations_instance=create_expectations_instance
+            )
+            # The key changes with the configuration, a suite already in the
+            # context under it has the same expectations and is never added to.
+            try:
+                suite = context.suites.add(suite)
+            except Exception:
+                suite = context.suites.get(name=key)
+            _state["suites"][key] = suite
+            logger.info(f"Loaded suite {key} in process {os.getpid()}")
+        return _state["suites"][key], key
+
+
+def warm_worker():
+    """
+    Pool initializer: ignores SIGINT (the parent handles it) and creates the
+    Data Context before the first task arrives.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    get_context()
+
+
+class ValidationWorkerPool:
+    """
+    Process pool whose workers are started and warmed once and then validate
+    datasets of any number of configs.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of worker processes, defaults to the number of CPUs
+    """
+    def __init__(self, processes: int = None):
+        self.processes = processes or mp.cpu_count()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            logger.info(f"Starting {self.processes} warm validation workers")
+            self._pool = mp.Pool(processes=self.processes, initializer=warm_worker)
+        return self._pool
+
+    def apply_async(self, function, args):
+        return self.pool.apply_async(function, args)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
@@ -31,8 +31,6 @@ from pathlib import Path
 import multiprocessing as mp
 from pathlib import Path
 import logging
-import contextlib
-import signal
 
 
 #Auxiliar classes
@@ -40,6 +38,8 @@ sys.path.append("src")
 from CreateExpectations import CreateExpectations
 from utils import Utils
 from ge_utils import geutils
+from ge_workers import ValidationWorkerPool, get_context, get_suite
+from suite_compiler import referenced_columns
 
 """
 Great Expectations Data Validation Framework
@@ -66,9 +66,6 @@ Required Custom Classes:
 """
 
 
-
-context = ge.get_context()
-
 def run_validation_dataset(config, source_config: Dict[str, Any], 
                            dataset: Dict[str, Any], utils: object,
                            create_expectations_instance: object,
@@ -103,6 +100,19 @@ def run_validation_dataset(config, source_config: Dict[str, Any],
         - table_name or name: Name of the dataset
         - expectations_suite: Name of the expectations suite
         - path: File path (required for file/cloud storage sources)
+        - query: Optional SELECT validated instead of the whole table (db/bigquery
+          sources), lets partitioned tables be checked one day at a time
+        - chunk_size: Optional rows per chunk (file/cloud storage sources), the
+          file is then validated in chunks by the chunked engine (whole, by
+          Great Expectations, when the suite has expectations the chunked
+          engine does not support); a global.chunk_size applies to every
+          file dataset
+        - engine: Optional "native" validates file/cloud storage datasets with
+          the native engine instead of Great Expectations, which is used
+          anyway when the suite has expectations the native engine does not
+          support, and db/bigquery datasets with a single SQL query for every
+          aggregate-expressible expectation (Great Expectations checks the
+          rest); a global.engine applies to every dataset
     utils : object
         Utility class instance containing helper methods for validation.
     create_expectations_instance : object
@@ -154,7 +164,9 @@ def run_validation_dataset(config, source_config: Dict[str, Any],
     - Validation results are saved in CSV format
     - The script supports multiple data source types
     - Process-parallel execution includes proper cleanup
-    - Thread-parallel execution is best for I/O-bound operations"""
+    - Thread-parallel execution is best for I/O-bound operations
+    - The Data Context and the built suites are kept per process (ge_workers),
+      later datasets with the same suite configuration reuse them"""
     try:
 
         
@@ -175,10 +187,7 @@ def run_validation_dataset(config, source_config: Dict[str, Any],
                                   schema_dict, volume_dict, pattern_matching_dict,
                                   create_expectations_instance)
 
-        suite = ge_utils_instance.create_expectation_suite(
-            expectation_suite_name=dataset["expectations_suite"], 
-            context=context
-        )
+        context = get_context()
 
         # Determine source type and add expectations
         source_type = source_config["type"]
@@ -188,32 +197,69 @@ def run_validation_dataset(config, source_config: Dict[str, Any],
         elif source_type == "bigquery":
             source_identifier += f"_{source_config['credentials']['schema']}"
 
-        ge_utils_instance.add_expectations_to_suite(
-            suite=suite, ge=ge, project=project,
-            source=source_identifier, stage=stage,
-            subproject=sub_project,
-            create_expectation_instance=create_expectations_instance
+        # Compiled once per suite configuration (and cached on disk), added
+        # to the context once per process
+        suite, suite_name = get_suite(
+            ge_utils_instance, dataset["expectations_suite"],
+            config["expectation_suites"][dataset["expectations_suite"]],
+            project=project, sub_project=sub_project, stage=stage,
+            source=source_identifier,
+            create_expectations_instance=create_expectations_instance,
+            cache_path=config["global"].get("suite_cache_path")
         )
 
         logger.info(f"Starting validation for {asset_name}")
 
         # Run validation based on source type
+        engine = dataset.get("engine") or config["global"].get("engine")
+        validation_results = None
         if source_type in ["file", "gcp_cloud_storage"]:
-            validation_results, elapsed_time = ge_utils_instance.run_validation(
-                context=context, config=source_config,
-                suite=suite, dataset_name=asset_name,
-                validation_definition_name=f"{asset_name}_validation_{dataset['expectations_suite']}",
-                expectation_suite_name=dataset["expectations_suite"],
-                path=dataset["path"]
-            )
+            # Only the columns the suite reads are loaded
+            columns, needs_rows = referenced_columns(suite)
+            chunk_size = dataset.get("chunk_size") or config["global"].get("chunk_size")
+            if chunk_size:
+                # Larger than memory files, read and validated in row chunks
+                try:
+                    validation_results, elapsed_time = ge_utils_instance.run_chunked_validation(
+                        config=source_config, suite=suite, path=dataset["path"],
+                        columns=columns, chunk_size=chunk_size, needs_rows=needs_rows
+                    )
+                except ValueError as e:
+                    logger.warning(f"{asset_name} validated with Great Expectations: {str(e)}")
+            elif engine == "native":
+                try:
+                    validation_results, elapsed_time = ge_utils_instance.run_native_validation(
+                        config=source_config, suite=suite, path=dataset["path"],
+                        columns=columns, needs_rows=needs_rows
+                    )
+                except ValueError as e:
+                    logger.warning(f"{asset_name} validated with Great Expectations: {str(e)}")
+            if validation_results is None:
+                validation_results, elapsed_time = ge_utils_instance.run_validation(
+                    context=context, config=source_config,
+                    suite=suite, dataset_name=asset_name,
+                    validation_definition_name=f"{asset_name}_validation_{suite_name}",
+                    expectation_suite_name=suite_name,
+                    path=dataset["path"], columns=columns, needs_rows=needs_rows
+                )
             file_name = utils.get_name(dataset["path"])
         else:  # db or bigquery
-            validation_results, elapsed_time = ge_utils_instance.run_validation(
-                context=context, config=source_config,
-                suite=suite, dataset_name=asset_name,
-                validation_definition_name=f"{asset_name}_validation_{dataset['expectations_suite']}",
-                expectation_suite_name=dataset["expectations_suite"]
-            )
+            if engine == "native":
+                try:
+                    validation_results, elapsed_time = ge_utils_instance.run_sql_validation(
+                        context=context, config=source_config, suite=suite,
+                        dataset_name=asset_name, query=dataset.get("query")
+                    )
+                except ValueError as e:
+                    logger.warning(f"{asset_name} validated with Great Expectations: {str(e)}")
+            if validation_results is None:
+                validation_results, elapsed_time = ge_utils_instance.run_validation(
+                    context=context, config=source_config,
+                    suite=suite, dataset_name=asset_name,
+                    validation_definition_name=f"{asset_name}_validation_{suite_name}",
+                    expectation_suite_name=suite_name,
+                    query=dataset.get("query")
+                )
             file_name = asset_name
 
         logger.info(f"{asset_name} validation completed")
@@ -230,7 +276,7 @@ def run_validation_dataset(config, source_config: Dict[str, Any],
         else:
             raise ValueError("Not supported process")
     except Exception as e:
-        logger.error(f"Error validating {dataset.get('name', 'unknown dataset')}: {str(e)}")
+        logger.error(f"Error validating {dataset.get('table_name') or dataset.get('name', 'unknown dataset')}: {str(e)}")
         return False
     
 
@@ -412,10 +458,6 @@ def thread_parallel_validation(sources,config,utils,create_expectations_instance
     end_time = time.time()
     logger.info(f"Total execution time: {end_time - start_time}")
 
-def init_worker():
-    """Initialize worker process to ignore SIGINT"""
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
-
 def worker_function(config, source_config, dataset,utils,create_expectations_instance,
                    sources,project ,sub_project,stage, path_logs,data_source_info,expectations,
                                    parallelize,method):
@@ -446,7 +488,7 @@ def worker_function(config, source_config, dataset,utils,create_expectations_ins
 
 def processes_parallel_validation(sources,config,utils,create_expectations_instance,
                                     project ,sub_project,stage, path_logs,data_source_info,expectations,
-                                   parallelize,method,timeout_per_dataset=3600):
+                                   parallelize,method,timeout_per_dataset=3600,pool=None):
     """
     Executes validation tasks in parallel using process-based parallelization.
 
@@ -482,6 +524,10 @@ def processes_parallel_validation(sources,config,utils,create_expectations_insta
         timeout_per_dataset :int (optional)
             Maximum execution time per dataset in seconds. 
                                            Defaults to 3600 (1 hour)
+        pool :ValidationWorkerPool (optional)
+            Warm worker pool to run the tasks on, kept open afterwards so the
+            next config reuses its workers. A pool for this call only is
+            started when not given.
         
                                            
     Returns:
@@ -489,6 +535,8 @@ def processes_parallel_validation(sources,config,utils,create_expectations_insta
 
     Notes:
         - Uses Python's multiprocessing Pool for parallel processing
+        - Workers create their Data Context once when they start and keep their
+          suites between tasks
         - Implements proper process initialization and signal handling
         - Includes timeout handling per dataset
         - Handles keyboard interrupts gracefully
@@ -530,50 +578,47 @@ def processes_parallel_validation(sources,config,utils,create_expectations_insta
     logger.info(f"Found {len(tasks)} tasks to process")
     
     # Set up multiprocessing
-    num_processes = min(mp.cpu_count(), len(tasks))
-    logger.info(f"Using {num_processes} processes")
+    own_pool = pool is None
+    if own_pool:
+        pool = ValidationWorkerPool(processes=min(mp.cpu_count(), len(tasks)))
+    logger.info(f"Using {pool.processes} processes")
     
     results = []
     
     try:
-        # Using Pool with context manager for proper cleanup
-        with contextlib.closing(mp.Pool(processes=num_processes, initializer=init_worker)) as pool:
-            # Create async result object
-            async_results = []
-            
-            # Submit all tasks
-            for task in tasks:
-                async_result = pool.apply_async(worker_function, task)
-                async_results.append((task[2], async_result))  # Store dataset name with async result
-            # Collect results with timeout
-            for dataset, async_result in async_results:
-                try:
-                    result = async_result.get(timeout=timeout_per_dataset)
-                    if result[0] is not None:  # If we have a valid result
-                        results.append(result)
-                        logger.info(f"Successfully processed dataset: {dataset}")
-                    else:
-                        logger.warning(f"Failed to process dataset: {dataset}")
-                except mp.TimeoutError:
-                    logger.error(f"Timeout occurred for dataset: {dataset}")
-                except Exception as e:
-                    logger.error(f"Error processing dataset {dataset}: {str(e)}")
-            
-            # Explicitly close and join pool
+        # Submit all tasks
+        async_results = []
+        for task in tasks:
+            async_result = pool.apply_async(worker_function, task)
+            async_results.append((task[2], async_result))  # Store dataset name with async result
+        # Collect results with timeout
+        for dataset, async_result in async_results:
+            try:
+                result = async_result.get(timeout=timeout_per_dataset)
+                if result[0] is not None:  # If we have a valid result
+                    results.append(result)
+                    logger.info(f"Successfully processed dataset: {dataset}")
+                else:
+                    logger.warning(f"Failed to process dataset: {dataset}")
+            except mp.TimeoutError:
+                logger.error(f"Timeout occurred for dataset: {dataset}")
+            except Exception as e:
+                logger.error(f"Error processing dataset {dataset}: {str(e)}")
+
+        # A pool given by the caller stays warm for its next config
+        if own_pool:
             pool.close()
-            pool.join()
-            
+
     except KeyboardInterrupt:
         logger.warning("Received keyboard interrupt, terminating processes...")
-        if 'pool' in locals():
+        # A pool given by the caller is torn down by its owner
+        if own_pool:
             pool.terminate()
-            pool.join()
         raise
     except Exception as e:
         logger.error(f"Unexpected error in parallel processing: {str(e)}")
-        if 'pool' in locals():
+        if own_pool:
             pool.terminate()
-            pool.join()
         raise
     finally:
         # Save successful results even if we had some failures
@@ -616,30 +661,33 @@ if __name__ == "__main__":
     ge_logger = logging.getLogger('great_expectations')
     ge_logger.setLevel(logging.WARNING)  # This will only show WARNING and above
 
-    logger.info("Loading configuration file")
-    #load configuration file
-    path_config_file = sys.argv[1]#"../config_templates/multiple_datasets_prueba.yml"
-    with open(path_config_file) as f:
-                config = yaml.load(f, Loader=yaml.FullLoader)
-    logger.info("Configuration loaded")
     create_expectations_instance= CreateExpectations()
     utils = Utils()
-
-    (project ,sub_project,stage, path_logs,data_source_info,expectations,sources,parallelize,method) = utils.define_global_parameters(config)
-
-    
-    if parallelize == True and method == "ThreadPoolExecutor":
-        thread_parallel_validation(sources,config,utils,create_expectations_instance,
-                                    project ,sub_project,stage, path_logs,data_source_info,expectations,
-                                   parallelize,method) 
-    elif parallelize == True and method == "ProcessPoolExecutor":  
-        processes_parallel_validation(sources,config,utils,create_expectations_instance,
-                                    project ,sub_project,stage, path_logs,data_source_info,expectations,
-                                   parallelize,method)
-    elif parallelize == False:
-        run_sequential_validation(sources,config,utils,create_expectations_instance,
-                                    project ,sub_project,stage, path_logs,data_source_info,expectations,
-                                   parallelize,method)
-        
-    else:
-            raise ValueError("Not supported process")
\ No newline at end of file
+    # Several config files can be given, the process workers (and their
+    # contexts and suites) are shared by all of them, closed after the last
+    # one or terminated when a config fails
+    with ValidationWorkerPool() as worker_pool:
+        for path_config_file in sys.argv[1:]:#"../config_templates/multiple_datasets_prueba.yml"
+            logger.info(f"Loading configuration file {path_config_file}")
+            #load configuration file
+            with open(path_config_file) as f:
+                        config = yaml.load(f, Loader=yaml.FullLoader)
+            logger.info("Configuration loaded")
+
+            (project ,sub_project,stage, path_logs,data_source_info,expectations,sources,parallelize,method) = utils.define_global_parameters(config)
+
+            if parallelize == True and method == "ThreadPoolExecutor":
+                thread_parallel_validation(sources,config,utils,create_expectations_instance,
+                                            project ,sub_project,stage, path_logs,data_source_info,expectations,
+                                           parallelize,method) 
+            elif parallelize == True and method == "ProcessPoolExecutor":  
+                processes_parallel_validation(sources,config,utils,create_expectations_instance,
+                                            project ,sub_project,stage, path_logs,data_source_info,expectations,
+                                           parallelize,method,pool=worker_pool)
+            elif parallelize == False:
+                run_sequential_validation(sources,config,utils,create_expectations_instance,
+                                            project ,sub_project,stage, path_logs,data_source_info,expectations,
+                                           parallelize,method)
+                
+            else:
+                    raise ValueError("Not supported process")
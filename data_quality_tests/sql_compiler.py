@@ -0,0 +1,370 @@
+import math
+import logging
+from datetime import datetime, timezone
+from chunked_validation import STATES, _within, expectation_result, suite_result
+
+logger = logging.getLogger(__name__)
+
+"""
+Single-query SQL compilation of expectation suites.
+
+Every expectation of a suite whose answer is an aggregate of the table
+(counts of missing and unexpected rows, min, max, sum, mean, standard
+deviation, distinct counts, row count) becomes one or more conditional
+aggregates of a single SELECT, so a db or bigquery dataset is scanned (and
+billed) once instead of once per metric. Aggregates shared by several
+expectations (COUNT(*), the null count of a column...) are computed once.
+The answers are mapped back into result entries shaped like those of Great
+Expectations, the others are left to Great Expectations.
+"""
+
+# SQL of each supported dialect. regex is None where the database has no
+# regular expressions in plain SQL, stdev None where it has no sample
+# standard deviation (it is then computed from sums).
+DIALECTS = {
+    "bigquery": {"quote": "`{}`", "text": "STRING", "float": "FLOAT64", "length": "LENGTH",
+                 "countif": True, "regex": "REGEXP_CONTAINS({value}, {pattern})",
+                 "stdev": "STDDEV_SAMP", "approx_count_distinct": "APPROX_COUNT_DISTINCT",
+                 # HyperLogLog++ precision of APPROX_COUNT_DISTINCT, fixed by BigQuery
+                 "approx_precision": 15},
+    "mysql": {"quote": "`{}`", "text": "CHAR", "float": "DOUBLE", "length": "CHAR_LENGTH",
+              "countif": False, "regex": "{value} REGEXP {pattern}", "stdev": "STDDEV_SAMP",
+              "approx_count_distinct": None},
+    "mssql": {"quote": "[{}]", "text": "NVARCHAR(MAX)", "float": "FLOAT", "length": "LEN",
+              "countif": False, "regex": None, "stdev": "STDEV", "approx_count_distinct": None},
+    "sqlite": {"quote": '"{}"', "text": "TEXT", "float": "REAL", "length": "LENGTH",
+               "countif": False, "regex": None, "stdev": None, "approx_count_distinct": None},
+}
+
+
+def _number(value):
+    # Decimal, integer and float answers alike
+    return None if value is None else float(value)
+
+
+def _comparable(value, kwargs: dict):
+    # MIN/MAX of a date or timestamp column against bounds written as ISO
+    # text (min_value: "2024-01-01") are compared as ISO text.
+    bounds = (kwargs.get("min_value"), kwargs.get("max_value"))
+    if any(isinstance(bound, str) for bound in bounds) and hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class SqlSuiteCompiler:
+    """
+    Compiles the expectations of a suite into one SELECT of conditional
+    aggregates and maps its answer back to expectation results.
+
+    Map expectations report their element, missing and unexpected counts;
+    partial_unexpected_list is always empty, the query returns no rows. LIKE
+    patterns follow the case rules of the database, as they do when Great
+    Expectations validates SQL sources.
+
+    Parameters
+    ----------
+    expectation_configs : list
+        Expectation configurations (type, kwargs, meta) of the suite
+    suite_name : str
+        Name reported in the result
+    dialect : str
+        One of DIALECTS
+
+    Raises
+    ------
+    ValueError
+        If the dialect is not supported
+    """
+    def __init__(self, expectation_configs: list, suite_name: str, dialect: str):
+        if dialect not in DIALECTS:
+            raise ValueError(f"Not supported SQL dialect: {dialect}")
+        self.dialect = DIALECTS[dialect]
+        self.suite_name = suite_name
+        self.params = {}
+        self.aggregates = {}
+        self.compiled = []
+        self.remaining = []
+        compilers = {
+            "expect_column_values_to_not_be_null": self._null,
+            "expect_column_values_to_be_null": self._null,
+            "expect_column_values_to_be_between": self._between,
+            "expect_column_values_to_be_in_set": self._in_set,
+            "expect_column_values_to_not_be_in_set": self._in_set,
+            "expect_column_value_lengths_to_be_between": self._length,
+            "expect_column_value_lengths_to_equal": self._length,
+            "expect_column_values_to_match_regex": self._pattern,
+            "expect_column_values_to_match_regex_list": self._pattern,
+            "expect_column_values_to_not_match_regex": self._pattern,
+            "expect_column_values_to_not_match_regex_list": self._pattern,
+            "expect_column_values_to_match_like_pattern": self._pattern,
+            "expect_column_values_to_match_like_pattern_list": self._pattern,
+            "expect_column_values_to_not_match_like_pattern": self._pattern,
+            "expect_column_values_to_not_match_like_pattern_list": self._pattern,
+            "expect_column_pair_values_to_be_equal": self._multicolumn,
+            "expect_multicolumn_sum_to_equal": self._multicolumn,
+            "expect_select_column_values_to_be_unique_within_record": self._multicolumn,
+            "expect_column_min_to_be_between": self._aggregate_statistic,
+            "expect_column_max_to_be_between": self._aggregate_statistic,
+            "expect_column_sum_to_be_between": self._aggregate_statistic,
+            "expect_column_mean_to_be_between": self._aggregate_statistic,
+            "expect_column_stdev_to_be_between": self._aggregate_statistic,
+            "expect_column_unique_value_count_to_be_between": self._unique_values,
+            "expect_column_proportion_of_unique_values_to_be_between": self._unique_values,
+            "expect_table_row_count_to_be_between": self._row_count,
+            "expect_table_row_count_to_equal": self._row_count,
+        }
+        for config in expectation_configs:
+            answer = compilers[config["type"]](config) if config["type"] in compilers else None
+            if answer is None:
+                self.remaining.append(config)
+            else:
+                self.compiled.append((config, answer))
+
+    # SQL building blocks
+
+    def _quote(self, name: str) -> str:
+        return self.dialect["quote"].format(name)
+
+    def _param(self, value) -> str:
+        name = f"p{len(self.params)}"
+        self.params[name] = value
+        return f":{name}"
+
+    def _text(self, column: str) -> str:
+        return f"CAST({self._quote(column)} AS {self.dialect['text']})"
+
+    def _count_if(self, condition: str) -> str:
+        if self.dialect["countif"]:
+            return f"COUNTIF({condition})"
+        return f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)"
+
+    def _aggregate(self, sql: str) -> str:
+        # Returns the alias of an aggregate, added to the SELECT once
+        if sql not in self.aggregates:
+            self.aggregates[sql] = f"a{len(self.aggregates)}"
+        return self.aggregates[sql]
+
+    def _range(self, value: str, min_value, max_value, strict_min=False, strict_max=False) -> str:
+        conditions = []
+        if min_value is not None:
+            conditions.append(f"{value} {'>' if strict_min else '>='} {self._param(min_value)}")
+        if max_value is not None:
+            conditions.append(f"{value} {'<' if strict_max else '<='} {self._param(max_value)}")
+        return " AND ".join(conditions) or "1 = 1"
+
+    # Map expectations
+
+    def _map(self, config: dict, missing: str, unexpected: str, exclude_missing: bool = True):
+        element_alias = self._aggregate("COUNT(*)")
+        missing_alias = self._aggregate(self._count_if(missing))
+        if exclude_missing:
+            unexpected = f"NOT ({missing}) AND ({unexpected})"
+        unexpected_alias = self._aggregate(self._count_if(unexpected))
+
+        def answer(row):
+            state = STATES[config["type"]](config)
+            state.add(int(row[element_alias] or 0), int(row[missing_alias] or 0),
+                      int(row[unexpected_alias] or 0), lambda room: [])
+            return state.result()
+        return answer
+
+    def _null(self, config: dict):
+        column = self._quote(config["kwargs"]["column"])
+        unexpected = (f"{column} IS NULL" if config["type"] == "expect_column_values_to_not_be_null"
+                      else f"{column} IS NOT NULL")
+        return self._map(config, f"{column} IS NULL", unexpected, exclude_missing=False)
+
+    def _between(self, config: dict):
+        kwargs, column = config["kwargs"], self._quote(config["kwargs"]["column"])
+        expected = self._range(column, kwargs.get("min_value"), kwargs.get("max_value"),
+                               kwargs.get("strict_min", False), kwargs.get("strict_max", False))
+        return self._map(config, f"{column} IS NULL", f"NOT ({expected})")
+
+    def _in_set(self, config: dict):
+        column = self._quote(config["kwargs"]["column"])
+        value_set = list(config["kwargs"].get("value_set") or [])
+        in_set = (f"{column} IN ({', '.join(self._param(value) for value in value_set)})"
+                  if value_set else "1 = 0")
+        unexpected = in_set if config["type"] == "expect_column_values_to_not_be_in_set" else f"NOT ({in_set})"
+        return self._map(config, f"{column} IS NULL", unexpected)
+
+    def _length(self, config: dict):
+        kwargs = config["kwargs"]
+        length = f"{self.dialect['length']}({self._text(kwargs['column'])})"
+        if config["type"] == "expect_column_value_lengths_to_equal":
+            expected = f"{length} = {self._param(kwargs['value'])}"
+        else:
+            expected = self._range(length, kwargs.get("min_value"), kwargs.get("max_value"),
+                                   kwargs.get("strict_min", False), kwargs.get("strict_max", False))
+        return self._map(config, f"{self._quote(kwargs['column'])} IS NULL", f"NOT ({expected})")
+
+    def _pattern(self, config: dict):
+        kind, kwargs = config["type"], config["kwargs"]
+        value = self._text(kwargs["column"])
+        if "like_pattern" in kind:
+            patterns = kwargs.get("like_pattern_list") or [kwargs.get("like_pattern")]
+            matches = [f"{value} LIKE {self._param(pattern)}" for pattern in patterns]
+        elif self.dialect["regex"] is None:
+            return None
+        else:
+            patterns = kwargs.get("regex_list") or [kwargs.get("regex")]
+            matches = [self.dialect["regex"].format(value=value, pattern=self._param(pattern))
+                       for pattern in patterns]
+        any_match = " OR ".join(f"({match})" for match in matches)
+        if "not_match" in kind:
+            unexpected = any_match
+        elif kwargs.get("match_on", "any") == "all":
+            unexpected = f"NOT ({' AND '.join(f'({match})' for match in matches)})"
+        else:
+            unexpected = f"NOT ({any_match})"
+        return self._map(config, f"{self._quote(kwargs['column'])} IS NULL", unexpected)
+
+    def _multicolumn(self, config: dict):
+        kind, kwargs = config["type"], config["kwargs"]
+        columns = [self._quote(column) for column in
+                   (kwargs.get("column_list") or [kwargs["column_A"], kwargs["column_B"]])]
+        default = STATES[kind].default_ignore_row_if
+        ignore_row_if = kwargs.get("ignore_row_if") or default
+        if ignore_row_if in ("all_values_are_missing", "both_values_are_missing"):
+            missing = " AND ".join(f"{column} IS NULL" for column in columns)
+        elif ignore_row_if in ("any_value_is_missing", "either_value_is_missing"):
+            missing = " OR ".join(f"{column} IS NULL" for column in columns)
+        else:
+            missing = "1 = 0"
+        any_missing = " OR ".join(f"{column} IS NULL" for column in columns)
+        if kind == "expect_column_pair_values_to_be_equal":
+            unexpected = f"{any_missing} OR {columns[0]} <> {columns[1]}"
+        elif kind == "expect_multicolumn_sum_to_equal":
+            unexpected = f"{any_missing} OR {' + '.join(columns)} <> {self._param(kwargs['sum_total'])}"
+        else:
+            unexpected = " OR ".join(f"({a} = {b} OR ({a} IS NULL AND {b} IS NULL))"
+                                     for i, a in enumerate(columns) for b in columns[i + 1:]) or "1 = 0"
+        return self._map(config, missing, unexpected)
+
+    # Aggregate expectations
+
+    def _aggregate_statistic(self, config: dict):
+        kind, kwargs = config["type"], config["kwargs"]
+        column = self._quote(kwargs["column"])
+        number = f"CAST({column} AS {self.dialect['float']})"
+        statistic = STATES[kind].statistic
+        if statistic == "stdev" and self.dialect["stdev"] is None:
+            # Sample standard deviation from the count, sum and sum of squares
+            count, total, squares = (self._aggregate(f"COUNT({column})"), self._aggregate(f"SUM({number})"),
+                                     self._aggregate(f"SUM({number} * {number})"))
+
+            def observed_value(row):
+                n = int(row[count] or 0)
+                if n < 2:
+                    return None
+                variance = (_number(row[squares]) - _number(row[total]) ** 2 / n) / (n - 1)
+                return max(variance, 0.0) ** 0.5
+        else:
+            sql = {"min": f"MIN({column})", "max": f"MAX({column})", "sum": f"SUM({column})",
+                   "mean": f"AVG({number})", "stdev": f"{self.dialect['stdev']}({number})"}[statistic]
+            alias = self._aggregate(sql)
+
+            def observed_value(row):
+                # MIN and MAX of text or date columns are not numbers, they
+                # are reported as the driver returns them.
+                if statistic in ("min", "max"):
+                    return row[alias]
+                return _number(row[alias])
+
+        def answer(row):
+            value = observed_value(row)
+            return _within(_comparable(value, kwargs), kwargs.get("min_value"), kwargs.get("max_value"),
+                           kwargs.get("strict_min", False), kwargs.get("strict_max", False)), \
+                {"observed_value": value}
+        return answer
+
+    def _unique_values(self, config: dict):
+        kwargs = config["kwargs"]
+        column = self._quote(kwargs["column"])
+        approximate = (config.get("meta") or {}).get("approximate") and self.dialect["approx_count_distinct"]
+        distinct = self._aggregate(f"{approximate}({column})" if approximate else f"COUNT(DISTINCT {column})")
+        nonmissing = self._aggregate(f"COUNT({column})")
+
+        def answer(row):
+            unique_count, count = int(row[distinct] or 0), int(row[nonmissing] or 0)
+            if config["type"] == "expect_column_proportion_of_unique_values_to_be_between":
+                value = min(unique_count / count, 1.0) if count else None
+            else:
+                value = unique_count
+            result = {"observed_value": value}
+            if approximate:
+                # Same details as the chunked engine's HyperLogLog sketch
+                registers = 2 ** self.dialect["approx_precision"]
+                result["details"] = {"approximate": True, "method": "hyperloglog++",
+                                     "relative_standard_error": 1.04 / math.sqrt(registers),
+                                     "registers": registers}
+            return _within(value, kwargs.get("min_value"), kwargs.get("max_value"),
+                           kwargs.get("strict_min", False), kwargs.get("strict_max", False)), result
+        return answer
+
+    def _row_count(self, config: dict):
+        alias = self._aggregate("COUNT(*)")
+
+        def answer(row):
+            state = STATES[config["type"]](config)
+            state.count = int(row[alias] or 0)
+            return state.result()
+        return answer
+
+    # Query and results
+
+    def source(self, table: str = None, schema: str = None, query: str = None) -> str:
+        """FROM clause of a table (optionally in a schema) or of a query."""
+        if query:
+            return f"({query}) AS source"
+        return f"{self._quote(schema)}.{self._quote(table)}" if schema else self._quote(table)
+
+    def query(self, table: str = None, schema: str = None, query: str = None) -> tuple:
+        """
+        Builds the single SELECT answering every compiled expectation.
+
+        Parameters
+        ----------
+        table : str, optional
+            Validated table
+        schema : str, optional
+            Schema (BigQuery dataset) of the table
+        query : str, optional
+            SELECT validated instead of the whole table
+
+        Returns
+        -------
+        tuple
+            (sql, params): the statement with :name placeholders and their
+            values, for sqlalchemy.text or a DB-API named paramstyle
+        """
+        columns = ",\n       ".join(f"{sql} AS {alias}" for sql, alias in self.aggregates.items())
+        return f"SELECT {columns}\nFROM {self.source(table, schema, query)}", dict(self.params)
+
+    def results(self, row: dict) -> list:
+        """Result entries of the compiled expectations from the answer row."""
+        return [expectation_result(config, *answer(row)) for config, answer in self.compiled]
+
+    def validate(self, execute, table: str = None, schema: str = None, query: str = None) -> dict:
+        """
+        Runs the single query and builds the validation result of the
+        compiled expectations.
+
+        Parameters
+        ----------
+        execute : callable
+            Takes (sql, params) and returns the answer row as a dict keyed by
+            column alias
+        table, schema, query : str, optional
+            Source, see query()
+
+        Returns
+        -------
+        dict
+            Validation result with the layout of a Great Expectations result
+        """
+        started_at = datetime.now(timezone.utc)
+        sql, params = self.query(table, schema, query)
+        logger.info(f"Validating {len(self.compiled)} expectations of {self.suite_name} with "
+                    f"{len(self.aggregates)} aggregates in a single query")
+        return suite_result(self.suite_name, self.results(execute(sql, params)), started_at)
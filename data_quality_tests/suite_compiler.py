@@ -0,0 +1,212 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import tempfile
+import great_expectations as ge
+from great_expectations.expectations.expectation_configuration import ExpectationConfiguration
+from CreateExpectations import CreateExpectations
+
+logger = logging.getLogger(__name__)
+
+"""
+Expectation suite compiler.
+
+A suite built from an expectation_suites entry of the configuration file is
+stored as JSON under a cache directory, named after a hash of everything it
+was built from. Later runs with the same hash load the stored expectations
+instead of calling the nine CreateExpectations.add_* methods again.
+"""
+
+# Bump when the stored layout changes, older cache files are then ignored.
+COMPILER_VERSION = 1
+DEFAULT_CACHE_PATH = ".suite_cache"
+
+
+def _builder_digest():
+    # Editing CreateExpectations changes what a configuration compiles to,
+    # its source is part of every hash.
+    source = inspect.getsource(CreateExpectations)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+_BUILDER_DIGEST = _builder_digest()
+
+
+def suite_key(expectation_suite_name: str, suite_config: dict, project: str, sub_project: str,
+              stage: str, source: str) -> str:
+    """
+    Identifies a compiled suite: its name plus a digest of its configuration,
+    the metadata written into its expectations, the Great Expectations
+    version and the expectation builder code.
+
+    Returns
+    -------
+    str
+        <expectation_suite_name>_<digest>, the cache file name and the suite
+        name registered in the Data Context
+    """
+    payload = json.dumps([COMPILER_VERSION, ge.__version__, _BUILDER_DIGEST,
+                          suite_config, project, sub_project, stage, source],
+                         sort_keys=True, default=str)
+    return f"{expectation_suite_name}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _expectation_config(expectation) -> dict:
+    # type, kwargs and meta are what defines an expectation, ids and rendered
+    # content are left out.
+    config = expectation.configuration.to_json_dict()
+    return {"type": config["type"], "kwargs": config["kwargs"], "meta": config.get("meta") or {}}
+
+
+def expectation_configs(suite) -> list:
+    """
+    Returns the expectations of a compiled suite as plain dictionaries with
+    type, kwargs and meta, the input of the native engines.
+    """
+    return [_expectation_config(expectation) for expectation in suite.expectations]
+
+
+def _unique(expectation_configs: list) -> list:
+    # Keeps the first of expectations with the same type and kwargs.
+    seen, unique = set(), []
+    for config in expectation_configs:
+        identity = json.dumps([config["type"], config["kwargs"]], sort_keys=True, default=str)
+        if identity not in seen:
+            seen.add(identity)
+            unique.append(config)
+    return unique
+
+
+# Table-level expectations answered from the column names alone.
+HEADER_ONLY_EXPECTATIONS = {
+    "expect_column_to_exist",
+    "expect_table_column_count_to_be_between",
+    "expect_table_column_count_to_equal",
+    "expect_table_columns_to_match_ordered_list",
+    "expect_table_columns_to_match_set",
+}
+# Table-level expectations that need the rows but none of their values.
+ROW_COUNT_EXPECTATIONS = {
+    "expect_table_row_count_to_be_between",
+    "expect_table_row_count_to_equal",
+    "expect_table_row_count_to_equal_other_table",
+}
+COLUMN_KWARGS = ("column", "column_A", "column_B")
+
+
+def referenced_columns(suite) -> tuple:
+    """
+    Works out which columns the data of a suite's expectations come from.
+
+    Parameters
+    ----------
+    suite : great_expectations.ExpectationSuite
+        Compiled suite
+
+    Returns
+    -------
+    tuple
+        (columns, needs_rows): the set of columns whose values are read, None
+        when some expectation could use any column, and whether the number of
+        rows matters. Columns only named by header-only expectations are not
+        in the set.
+    """
+    columns, needs_rows = set(), False
+    for config in expectation_configs(suite):
+        if config["type"] in HEADER_ONLY_EXPECTATIONS:
+            continue
+        needs_rows = True
+        if config["type"] in ROW_COUNT_EXPECTATIONS:
+            continue
+        kwargs = config["kwargs"]
+        named = [kwargs[key] for key in COLUMN_KWARGS if key in kwargs]
+        named += list(kwargs.get("column_list") or [])
+        if not named:
+            return None, True
+        columns.update(named)
+    return columns, needs_rows
+
+
+def build_suite(name: str, expectation_configs: list):
+    """
+    Returns a suite (not added to any Data Context) holding the given
+    expectation configurations (type, kwargs, meta).
+    """
+    expectations = [ExpectationConfiguration(**config).to_domain_obj() for config in expectation_configs]
+    return ge.ExpectationSuite(name=name, expectations=expectations)
+
+
+class SuiteCompiler:
+    """
+    Builds expectation suites from their configuration once and caches them
+    on disk.
+
+    Parameters
+    ----------
+    cache_path : str, optional
+        Directory of the compiled suites, DEFAULT_CACHE_PATH by default
+    """
+    def __init__(self, cache_path: str = None):
+        self.cache_path = cache_path or DEFAULT_CACHE_PATH
+
+    def _cache_file(self, key: str) -> str:
+        return os.path.join(self.cache_path, f"{key}.json")
+
+    def _load(self, key: str):
+        try:
+            with open(self._cache_file(key)) as f:
+                return json.load(f)["expectations"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable compiled suite {key}: {str(e)}")
+            return None
+
+    def _store(self, key: str, expectation_configs: list):
+        # Written to a temporary file and renamed, concurrent workers
+        # compiling the same suite never read a partial file.
+        os.makedirs(self.cache_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"name": key, "expectations": expectation_configs}, f, indent=2, default=str)
+        os.replace(tmp_path, self._cache_file(key))
+
+    def compile(self, ge_utils_instance, expectation_suite_name: str, suite_config: dict, project: str,
+                sub_project: str, stage: str, source: str, create_expectations_instance):
+        """
+        Returns the suite of a configuration entry, not yet added to any
+        Data Context, loaded from the cache when its key matches and built
+        (then stored) otherwise. Duplicated expectations are dropped.
+
+        Parameters
+        ----------
+        ge_utils_instance : geutils
+            Holds the expectation dictionaries of the suite
+        expectation_suite_name : str
+            Suite name in the configuration file
+        suite_config : dict
+            Configuration of the suite (config["expectation_suites"][name])
+        project, sub_project, stage, source : str
+            Metadata written into every expectation
+        create_expectations_instance : CreateExpectations
+            Adds the expectations while building
+
+        Returns
+        -------
+        tuple
+            (great_expectations.ExpectationSuite, key)
+        """
+        key = suite_key(expectation_suite_name, suite_config, project, sub_project, stage, source)
+        expectation_configs = self._load(key)
+        if expectation_configs is None:
+            built = ge.ExpectationSuite(name=key)
+            ge_utils_instance.add_expectations_to_suite(
+                suite=built, ge=ge, project=project, source=source, stage=stage,
+                subproject=sub_project, create_expectation_instance=create_expectations_instance
+            )
+            expectation_configs = _unique([_expectation_config(e) for e in built.expectations])
+            self._store(key, expectation_configs)
+            logger.info(f"Compiled suite {key} with {len(expectation_configs)} expectations")
+        return build_suite(key, expectation_configs), key
@@ -1,50 +1,274 @@
-import requests
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, round, lit
+import json
 import utils
+import backends
+import engine
+import metrics as metrics_module
+import rules
+import schema_registry
+import warehouse
 import logging
 from datetime import datetime
 import uuid
 
 LOGGER: logging.Logger = logging.getLogger("dataproc_processor")
 
-def run_job(project, process_date):
-    spark = SparkSession.builder.appName("ETLJob")\
-        .getOrCreate()
-    #.config("spark.jars.packages", "com.google.cloud.spark:spark-bigquery-with-dependencies_2.12:0.32.2") \
-    LOGGER.info("spark.version")
-    LOGGER.info(spark.version)
+DATASET_RAW = 'raw_sales'
+KEYS_CURRENCY = ('fecha', 'moneda')
+# Registry table describing the ingested records before any cast (STRING
+# fecha/process_datetime), used for both layouts.
+INPUT_SCHEMA = f'{DATASET_RAW}.tb_currency'
 
-    dataset_raw = 'raw_sales'
+def _currency_layout(layout, ingestion_mode, datalake_path):
+    """
+    Returns (table, base path, partition_by, column_types) of a layout. Flat
+    tables get a per-run directory below the base path, partitioned ones
+    write to the base path itself.
+    """
+    file_format = 'parquet' if ingestion_mode == "parquet" else 'json'
+    path = f'{datalake_path}/ingested/transactions/{file_format}'
+    if layout == "partitioned":
+        # DATE partitioned, moneda clustered table: readers filtering on fecha
+        # only scan their days, and the files land under <table>/dt=YYYY-MM-DD.
+        table_currency = 'tb_currency_daily'
+        return (table_currency, f'{path}/{table_currency}', 'fecha',
+                {'fecha': 'date', 'process_datetime': 'timestamp'})
+    if layout == "flat":
+        return 'tb_currency', path, None, None
+    raise ValueError(f"Not supported layout: {layout}")
 
-    date_obj = datetime.strptime(process_date, '%Y-%m-%d')
-    date_str = date_obj.strftime('%Y%m%d')
-    process_date_str = date_obj.strftime('%Y-%m-%d')
+def _load_control_counts(sink, written, dataset, control_table, datetime_str, write_mode="append"):
+    # Counts observed by the write itself, reconciliation reads them instead
+    # of scanning the fact table.
+    n_control = backends._load_control_counts(sink, written['counts'], KEYS_CURRENCY, dataset,
+                                              control_table, datetime_str, write_mode)
+    LOGGER.warning(f"recorded {n_control} control counts into {dataset}.{control_table}")
+
+def _spark_version(spark):
+    # (major, minor) of the running Spark, e.g. (3, 1) on Dataproc 2.0.
+    return tuple(int(part) for part in spark.version.split('.')[:2])
+
+@metrics_module.instrumented("01_ingest_currency")
+def run_job(project, process_date=None, start_date=None, end_date=None,
+            api_url=utils.SUNAT_URL, max_workers=utils.HTTP_MAX_WORKERS,
+            cache_path=None, use_cache=True, show=False,
+            backend="auto", local_max_rows=utils.LOCAL_BACKEND_MAX_ROWS,
+            ingestion_mode="direct", datalake_path=None,
+            write_mode="append", warehouse_uri=None, layout="flat",
+            apply_rules=True, rejected_table="tb_currency_rejected",
+            control_counts=True, control_table="tb_currency_cc", target_file_mb=None,
+            state_path=None, force=False, schemas_path=None, metrics=None):
+    """
+    Loads the exchange rates of the requested dates. Every run emits a
+    metrics record (phase timings, rows and bytes written, Spark stage
+    totals) to metrics_path and, when set, the metrics_uri gs:// prefix.
+    """
+    dataset_raw = DATASET_RAW
+
+    process_dates = utils._process_dates(process_date, start_date, end_date)
+    datalake_path = datalake_path or f'gs://{project}-datalake'
+    keys_currency = KEYS_CURRENCY
+    table_currency, path, partition_by, column_types = _currency_layout(layout, ingestion_mode, datalake_path)
+    # Dates loaded by a previous run are skipped before any API call, only the
+    # gaps are fetched and written.
+    manifest = utils.LoadManifest(f'{state_path or f"{datalake_path}/state"}/{dataset_raw}.{table_currency}.json')
+    if not force:
+        requested = process_dates
+        with metrics.phase("manifest"):
+            process_dates = manifest.missing(requested)
+        if len(process_dates) < len(requested):
+            LOGGER.warning(f"skipping {len(requested) - len(process_dates)} already loaded dates "
+                           f"(watermark {manifest.watermark()})")
+        if not process_dates:
+            LOGGER.warning(f"every date from {requested[0]} to {requested[-1]} is already loaded")
+            return "PySpark Job Finished"
+    date_str = utils._dates_label(process_dates)
     datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     uuid_4dig = str(uuid.uuid4().hex)[:4]
-    path = f'gs://{project}-datalake/ingested/transactions/json'
-
-    url_currency = f'https://api.apis.net.pe/v1/tipo-cambio-sunat?fecha={process_date_str}'
-    table_currency = 'tb_currency'
-    path_table_currency = f'{path}/{date_str}/{table_currency}_{uuid_4dig}.json.gz'
-    currency = utils._get_currency(url_currency)
-    df_currency = spark.createDataFrame([currency])
-    df_currency = df_currency.withColumn("process_datetime", lit(datetime_str))
-    df_currency.show()
-    LOGGER.warning("df_currency count: ")
-    LOGGER.warning(df_currency.count())
-    utils._load_bigquery(df_currency, project, dataset_raw, table_currency)
-    LOGGER.warning("loaded to bigquery")
-    utils._load_gcs(df_currency,path_table_currency)
-    LOGGER.warning("loaded to gcs")    
+    if partition_by:
+        path_table_currency = path
+    else:
+        extension = 'parquet' if ingestion_mode == "parquet" else 'json.gz'
+        path_table_currency = f'{path}/{date_str}/{table_currency}_{uuid_4dig}.{extension}'
+    cache = None
+    if use_cache:
+        cache = utils.CurrencyCache(cache_path or f'{datalake_path}/cache/tipo-cambio-sunat')
+    with metrics.phase("fetch"):
+        currencies = utils._get_currencies_by_date(process_dates, api_url,
+                                                   max_workers=max_workers, cache=cache)
+    LOGGER.warning(f"fetched {len(currencies)} days from {process_dates[0]} to {process_dates[-1]}")
+    if cache is not None:
+        LOGGER.warning(f"currency cache: {cache.stats()}")
+        metrics.add(cache_hits=cache.hits, cache_misses=cache.misses)
+    records = [dict(currency, process_datetime=datetime_str) for currency in currencies]
+    with metrics.phase("schema"):
+        input_schema = schema_registry._get_registry(schemas_path, project).get(INPUT_SCHEMA)
+    # Spark is only started when the batch is big enough to need it.
+    sink = warehouse._get_warehouse(project, warehouse_uri)
+    with metrics.phase("backend_start"):
+        writer = backends._select_backend(backend, len(records), sink, local_max_rows)
+    if writer.name == "spark":
+        metrics.attach_spark(writer.spark)
+    LOGGER.warning(f"writing with the {writer.name} backend ({write_mode} into {sink.name})")
+    # Rows failing the rules go to the rejected table with their messages
+    # instead of the fact table.
+    written = writer.write(records, dataset_raw, table_currency,
+                           path_table_currency, show=show,
+                           ingestion_mode=ingestion_mode,
+                           write_mode=write_mode, keys=keys_currency,
+                           partition_by=partition_by, column_types=column_types,
+                           rules=rules.CURRENCY_RULES if apply_rules else None,
+                           rejected_table=rejected_table,
+                           count_by=keys_currency if control_counts else None,
+                           target_file_bytes=target_file_mb * 1024 * 1024 if target_file_mb else None,
+                           schema=input_schema, metrics=metrics)
+    # Spark reports the bytes of its file writes in the stage totals instead.
+    metrics.add(rows_written=written['rows'], rows_rejected=written['rejected'],
+                bytes_written=written.get('bytes'))
+    LOGGER.warning(f"loaded {written['rows']} rows to bigquery and gcs")
+    if written['rejected']:
+        LOGGER.warning(f"rejected {written['rejected']} rows into {dataset_raw}.{rejected_table}")
+    if control_counts:
+        with metrics.phase("control_counts"):
+            _load_control_counts(sink, written, dataset_raw, control_table, datetime_str, write_mode)
+    with metrics.phase("manifest"):
+        manifest.mark_loaded(process_dates)
 
     return "PySpark Job Finished"
 
+@metrics_module.instrumented("01_ingest_currency_stream")
+def run_stream(project, landing_path, checkpoint_path=None, datalake_path=None,
+               trigger_seconds=utils.STREAM_TRIGGER_SECONDS, available_now=False,
+               max_files_per_trigger=utils.STREAM_MAX_FILES_PER_TRIGGER,
+               ingestion_mode="direct", layout="flat", warehouse_uri=None,
+               apply_rules=True, rejected_table="tb_currency_rejected",
+               control_counts=True, control_table="tb_currency_cc", target_file_mb=None,
+               schemas_path=None, metrics=None):
+    """
+    Structured Streaming counterpart of run_job: rate payloads (JSON lines
+    with the API fields) dropped under landing_path are loaded in
+    micro-batches.
+
+    Each micro-batch is upserted on (fecha, moneda) and its files go to a path
+    derived from the batch id, overwritten on replay, so a batch Spark runs
+    again after a failure leaves the same data behind. Its process_datetime
+    is kept in a pending marker and reused by a replay, whose rejected rows
+    (inserted unless already there) and control counts (upserted) are then
+    the same as the first attempt's. Once every sink is done the commit
+    marker is written and replays of a committed batch are skipped.
+
+    available_now drains what is already landed and stops; before Spark 3.3
+    the single batch of trigger(once=True) does the same, without
+    max_files_per_trigger.
+
+    The metrics record of the query, emitted when it stops, sums the phases
+    and rows of all its micro-batches.
+    """
+    from pyspark.sql.functions import lit
+    dataset_raw = DATASET_RAW
+    datalake_path = datalake_path or f'gs://{project}-datalake'
+    table_currency, path, partition_by, column_types = _currency_layout(layout, ingestion_mode, datalake_path)
+    checkpoint_path = checkpoint_path or f'{datalake_path}/checkpoints/{table_currency}'
+    sink = warehouse._get_warehouse(project, warehouse_uri)
+    writer = backends.SparkBackend(sink, app_name="ETLJobStreaming")
+    metrics.attach_spark(writer.spark)
+
+    def process_batch(batch_df, batch_id):
+        marker = f'{checkpoint_path}/_sink_commits/{batch_id}'
+        if utils._read_bytes(marker) is not None:
+            LOGGER.warning(f"micro-batch {batch_id} already committed, skipping its replay")
+            return
+        pending = utils._read_bytes(f'{marker}.pending')
+        if pending is not None:
+            datetime_str = json.loads(pending)["process_datetime"]
+            LOGGER.warning(f"micro-batch {batch_id} replayed, reusing process_datetime {datetime_str}")
+        else:
+            datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            utils._write_bytes(f'{marker}.pending',
+                               json.dumps({"process_datetime": datetime_str}).encode("utf-8"))
+        path_table_currency = path if partition_by else f'{path}/stream/{table_currency}/batch_id={batch_id}'
+        written = writer.write_frame(batch_df.withColumn("process_datetime", lit(datetime_str)),
+                                     dataset_raw, table_currency, path_table_currency,
+                                     ingestion_mode=ingestion_mode, write_mode="upsert",
+                                     keys=KEYS_CURRENCY, partition_by=partition_by,
+                                     column_types=column_types,
+                                     rules=rules.CURRENCY_RULES if apply_rules else None,
+                                     rejected_table=rejected_table,
+                                     count_by=KEYS_CURRENCY if control_counts else None,
+                                     overwrite=True,
+                                     target_file_bytes=target_file_mb * 1024 * 1024 if target_file_mb else None,
+                                     schema=input_schema, metrics=metrics)
+        if control_counts:
+            with metrics.phase("control_counts"):
+                _load_control_counts(sink, written, dataset_raw, control_table, datetime_str, "upsert")
+        metrics.add(batches=1, rows_written=written['rows'], rows_rejected=written['rejected'])
+        # Written after every sink, a failure before it replays the whole batch.
+        utils._write_bytes(marker, json.dumps({"rows": written['rows'], "rejected": written['rejected'],
+                                               "process_datetime": datetime_str}).encode("utf-8"))
+        LOGGER.warning(f"micro-batch {batch_id}: loaded {written['rows']} rows, rejected {written['rejected']}")
+
+    input_schema = schema_registry._get_registry(schemas_path, project).get(INPUT_SCHEMA)
+    # Read as received, write_frame casts after the rejected rows keep their
+    # raw values.
+    stream = (writer.spark.readStream.schema(input_schema.spark_raw())
+              .option("maxFilesPerTrigger", max_files_per_trigger)
+              .json(landing_path))
+    query = (stream.writeStream.foreachBatch(process_batch)
+             .option("checkpointLocation", checkpoint_path))
+    if available_now:
+        # Drains what is already landed and stops, for catch-up runs.
+        if _spark_version(writer.spark) >= (3, 3):
+            query = query.trigger(availableNow=True)
+        else:
+            query = query.trigger(once=True)
+    else:
+        query = query.trigger(processingTime=f'{trigger_seconds} seconds')
+    LOGGER.warning(f"streaming {landing_path} into {dataset_raw}.{table_currency} (checkpoint {checkpoint_path})")
+    query.start().awaitTermination()
+
+    return "PySpark Streaming Job Finished"
+
 if __name__ == '__main__':
     args = utils._parse_args()
     print('args:', args)
     project_gcp = 'gcp-arquitecture-space'
     process_date = args['process_date']
     print('process_date:', process_date)
-    result = run_job(project_gcp, process_date)
-    print(result)
\ No newline at end of file
+    if args['config']:
+        result = engine.run_engine(project_gcp, args['config'],
+                                   utils._process_dates(process_date, args['start_date'], args['end_date']),
+                                   datalake_path=args['datalake_path'],
+                                   warehouse_uri=args['warehouse'], backend=args['backend'],
+                                   state_path=args['state_path'], force=args['force'],
+                                   schemas_path=args['schemas_path'],
+                                   metrics_path=args['metrics_path'], metrics_uri=args['metrics_uri'])
+    elif args['landing_path']:
+        result = run_stream(project_gcp, args['landing_path'],
+                            checkpoint_path=args['checkpoint_path'],
+                            datalake_path=args['datalake_path'],
+                            trigger_seconds=args['trigger_seconds'],
+                            available_now=args['available_now'],
+                            max_files_per_trigger=args['max_files_per_trigger'],
+                            ingestion_mode=args['ingestion_mode'], layout=args['layout'],
+                            warehouse_uri=args['warehouse'], apply_rules=args['apply_rules'],
+                            rejected_table=args['rejected_table'],
+                            control_counts=args['control_counts'], control_table=args['control_table'],
+                            target_file_mb=args['target_file_mb'],
+                            schemas_path=args['schemas_path'],
+                            metrics_path=args['metrics_path'], metrics_uri=args['metrics_uri'])
+    else:
+        result = run_job(project_gcp, process_date,
+                         start_date=args['start_date'], end_date=args['end_date'],
+                         api_url=args['api_url'], max_workers=args['max_workers'],
+                         cache_path=args['cache_path'], use_cache=args['use_cache'],
+                         show=args['show'], backend=args['backend'],
+                         local_max_rows=args['local_max_rows'],
+                         ingestion_mode=args['ingestion_mode'], datalake_path=args['datalake_path'],
+                         write_mode=args['write_mode'], warehouse_uri=args['warehouse'],
+                         layout=args['layout'], apply_rules=args['apply_rules'],
+                         rejected_table=args['rejected_table'],
+                         control_counts=args['control_counts'], control_table=args['control_table'],
+                         target_file_mb=args['target_file_mb'],
+                         state_path=args['state_path'], force=args['force'],
+                         schemas_path=args['schemas_path'],
+                         metrics_path=args['metrics_path'], metrics_uri=args['metrics_uri'])
+    print(result)
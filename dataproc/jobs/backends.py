@@ -0,0 +1,369 @@
+import gzip
+import json
+from collections import Counter
+import logging
+import uuid
+import metrics as metrics_module
+import rules as rules_module
+import utils
+
+LOGGER: logging.Logger = logging.getLogger("dataproc_processor")
+REJECTED = rules_module.REJECTED_COLUMN
+
+class SparkBackend:
+    """
+    Writes ingested records through a SparkSession and the BigQuery connector.
+    """
+    name = "spark"
+
+    def __init__(self, warehouse, app_name="ETLJob", conf=None):
+        from pyspark.sql import SparkSession
+        self.warehouse = warehouse
+        builder = SparkSession.builder.appName(app_name)
+        for key, value in (conf or {}).items():
+            builder = builder.config(key, value)
+        self.spark = builder.getOrCreate()
+        #.config("spark.jars.packages", "com.google.cloud.spark:spark-bigquery-with-dependencies_2.12:0.32.2") \
+        LOGGER.info("spark.version")
+        LOGGER.info(self.spark.version)
+
+    def write(self, records, dataset, table, gcs_path, show=False,
+              ingestion_mode="direct", write_mode="append", keys=(),
+              partition_by=None, column_types=None, rules=None, rejected_table=None,
+              count_by=None, target_file_bytes=None, schema=None, metrics=None):
+        with metrics_module._phase(metrics, "dataframe"):
+            # The rules judge the records as received, before conform nulls
+            # what does not convert, and rejected rows are built as in the
+            # local backend.
+            rejected = []
+            if rules:
+                records, rejected = rules_module._split_records(records, rules)
+                rejected = rules_module._rejected_rows(rejected, schema)
+            if schema is not None:
+                # Rows already conform to the registry schema, Spark neither
+                # infers nor verifies them.
+                df = self.spark.createDataFrame(schema.conform(records), schema.spark(), verifySchema=False)
+            elif records:
+                df = self.spark.createDataFrame(records)
+        written = {"rows": 0}
+        if records:
+            written = self.write_frame(df, dataset, table, gcs_path,
+                                       show=show, ingestion_mode=ingestion_mode, write_mode=write_mode,
+                                       keys=keys, partition_by=partition_by, column_types=column_types,
+                                       count_by=count_by, records=records,
+                                       target_file_bytes=target_file_bytes, metrics=metrics)
+        elif count_by:
+            written["counts"] = {}
+        if rejected and rejected_table:
+            _load_rejected(self.warehouse, rejected, dataset, rejected_table, metrics, write_mode)
+        written["rejected"] = len(rejected)
+        return written
+
+    def write_frame(self, df, dataset, table, gcs_path, show=False,
+                    ingestion_mode="direct", write_mode="append", keys=(),
+                    partition_by=None, column_types=None, rules=None, rejected_table=None,
+                    count_by=None, records=None, overwrite=False, target_file_bytes=None,
+                    schema=None, metrics=None):
+        """
+        Same as write for a DataFrame (e.g. a streaming micro-batch). records,
+        when given, back the counts on Spark versions without observe, and
+        overwrite replaces gcs_path instead of failing when it already exists.
+        target_file_bytes compacts a flat output into objects of about that
+        size listed in a manifest. schema, when given, is the registry schema
+        of a frame of raw string values (TableSchema.spark_raw). metrics, a
+        metrics.RunMetrics, times every sink and load step.
+
+        An upsert also leaves the rejected table idempotent: its rows are
+        inserted unless the table already holds the same raw_record, so a
+        replayed micro-batch does not load them twice.
+        """
+        from pyspark.sql.functions import col, collect_set, count, lit, when
+        # The rule messages are one more column of the same projection, the
+        # persisted frame is then split into both tables without another pass.
+        if rules:
+            df = rules_module._with_rejected_message(rules_module._with_raw_record(df, schema), rules)
+        else:
+            if schema is not None:
+                df = df.select(*[col(field.name).cast(field.dataType) for field in schema.spark().fields])
+            df = df.withColumn(REJECTED, lit(None).cast("string"))
+        if show:
+            df.show()
+        is_accepted = col(REJECTED).isNull()
+
+        def accepted(df):
+            df = df.filter(is_accepted).drop(REJECTED, rules_module.RAW_RECORD_COLUMN)
+            # Rejected rows keep their raw values, a bad fecha can not be cast.
+            for column, column_type in (column_types or {}).items():
+                df = df.withColumn(column, col(column).cast(column_type))
+            return df
+
+        def accepted_files(df):
+            if partition_by:
+                # Hive-style dt=YYYY-MM-DD directories for the GCS copy only.
+                return accepted(df).withColumn(utils.PARTITION_COLUMN, col(partition_by).cast("string"))
+            return accepted(df)
+
+        files_partition = utils.PARTITION_COLUMN if partition_by else None
+        load_table = _load_table(self.warehouse, dataset, table, write_mode)
+        # Objects of a compacted output, the parquet load takes them as is.
+        outputs = {}
+        if ingestion_mode == "parquet":
+            # Single serialization: BigQuery loads the staged files themselves.
+            sinks = [_timed(metrics, "gcs_write", lambda df: outputs.update(objects=utils._load_gcs_parquet(
+                accepted_files(df), gcs_path, files_partition, overwrite, target_file_bytes)))]
+        else:
+            sinks = [
+                _timed(metrics, "bigquery_write", lambda df: utils._load_bigquery(
+                    accepted(df), self.warehouse.project, dataset, load_table)),
+                _timed(metrics, "gcs_write", lambda df: outputs.update(objects=utils._load_gcs(
+                    accepted_files(df), gcs_path, files_partition, overwrite, target_file_bytes))),
+            ]
+        rejected_load = None
+        if rules and rejected_table:
+            rejected_load = rejected_table
+            if write_mode == "upsert":
+                rejected_load = self.warehouse.create_staging(dataset, rejected_table)
+            # Same columns, in table order, as the rows of rules._rejected_rows.
+            rejected_columns = [name for name in df.columns if name != rules_module.RAW_RECORD_COLUMN]
+            sinks.append(_timed(metrics, "rejected_write", lambda df: utils._load_bigquery(
+                df.filter(~is_accepted).select(*rejected_columns, rules_module.RAW_RECORD_COLUMN),
+                self.warehouse.project, dataset, rejected_load)))
+        counts = {}
+        if count_by:
+            # Read from the persisted frame, no second pass over the source.
+            sinks.append(_timed(metrics, "control_counts", lambda df: counts.update(
+                utils._count_by(df.filter(is_accepted), count_by))))
+        observed = {"rows": count(when(is_accepted, 1)), "rejected": count(when(~is_accepted, 1))}
+        if partition_by:
+            observed["partitions"] = collect_set(when(is_accepted, col(partition_by).cast("string")))
+        fallback = None
+        if records is not None:
+            fallback = lambda: _split_stats(records, rules, partition_by)
+        stats = utils._write_once(df, sinks, observed, fallback=fallback)
+        if ingestion_mode == "parquet":
+            uris = outputs.get("objects") or _parquet_uris(gcs_path, stats.get("partitions"),
+                                                           partitioned=bool(partition_by))
+            with metrics_module._phase(metrics, "bigquery_load"):
+                self.warehouse.load_files(uris, dataset, load_table)
+        with metrics_module._phase(metrics, "merge"):
+            _finish_load(self.warehouse, dataset, load_table, table, write_mode, keys)
+            if rejected_load not in (None, rejected_table):
+                try:
+                    self.warehouse.insert_missing(dataset, rejected_load, rejected_table,
+                                                  (rules_module.RAW_RECORD_COLUMN,))
+                finally:
+                    self.warehouse.drop(dataset, rejected_load)
+        written = {"rows": stats.get("rows"), "rejected": stats.get("rejected")}
+        if count_by:
+            written["counts"] = counts
+        return written
+
+class LocalBackend:
+    """
+    Writes ingested records with pandas in the driver process, no JVM involved.
+
+    The GCS output keeps the layout Spark produces for gcs_path (a directory
+    holding a gzip JSON lines or zstd Parquet part file and a _SUCCESS marker)
+    and BigQuery is loaded from the same bytes through a load job.
+    """
+    name = "local"
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        # Bytes of the files written by the last write.
+        self.bytes_written = 0
+
+    def write(self, records, dataset, table, gcs_path, show=False,
+              ingestion_mode="direct", write_mode="append", keys=(),
+              partition_by=None, column_types=None, rules=None, rejected_table=None,
+              count_by=None, target_file_bytes=None, schema=None, metrics=None):
+        self.bytes_written = 0
+        with metrics_module._phase(metrics, "dataframe"):
+            if rules:
+                records, rejected = rules_module._split_records(records, rules)
+                rejected = rules_module._rejected_rows(rejected, schema)
+            else:
+                rejected = []
+            if schema is not None:
+                records = [dict(zip(schema.names, row)) for row in schema.conform(records)]
+        if records:
+            self._write_accepted(records, dataset, table, gcs_path, show, ingestion_mode,
+                                 write_mode, keys, partition_by, column_types,
+                                 compact=bool(target_file_bytes) and not partition_by,
+                                 arrow_schema=schema.arrow() if schema is not None else None,
+                                 metrics=metrics)
+        if rejected and rejected_table:
+            _load_rejected(self.warehouse, rejected, dataset, rejected_table, metrics, write_mode)
+        written = {"rows": len(records), "rejected": len(rejected), "bytes": self.bytes_written}
+        if count_by:
+            written["counts"] = dict(Counter(tuple(record[column] for column in count_by)
+                                             for record in records))
+        return written
+
+    def _write_accepted(self, records, dataset, table, gcs_path, show, ingestion_mode,
+                        write_mode, keys, partition_by, column_types, compact=False,
+                        arrow_schema=None, metrics=None):
+        import pandas as pd
+        df = pd.DataFrame.from_records(records)
+        if show:
+            print(df.to_string())
+        load_table = _load_table(self.warehouse, dataset, table, write_mode)
+        if compact:
+            # Local batches are bounded by local_max_rows, they always fit a
+            # single object.
+            if ingestion_mode == "parquet":
+                name = utils._compacted_names(gcs_path, '.parquet', 1)[0]
+                data = self._parquet_bytes(df, column_types, arrow_schema)
+            else:
+                payload = df.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+                with metrics_module._phase(metrics, "bigquery_write"):
+                    self.warehouse.load_json(payload, dataset, load_table)
+                name = utils._compacted_names(gcs_path, '.json.gz', 1)[0]
+                data = gzip.compress(payload)
+            with metrics_module._phase(metrics, "gcs_write"):
+                self._write(name, data)
+                utils._write_manifest(gcs_path, [(name, len(data))],
+                                      "parquet" if ingestion_mode == "parquet" else "json")
+            if ingestion_mode == "parquet":
+                with metrics_module._phase(metrics, "bigquery_load"):
+                    self.warehouse.load_files([name], dataset, load_table)
+        elif ingestion_mode == "parquet":
+            part_paths = []
+            with metrics_module._phase(metrics, "gcs_write"):
+                for directory, part in self._partitions(df, gcs_path, partition_by):
+                    part_paths.append(self._write_part(
+                        directory, self._parquet_bytes(part, column_types, arrow_schema), 'parquet'))
+                utils._write_bytes(f'{gcs_path}/_SUCCESS', b"")
+            with metrics_module._phase(metrics, "bigquery_load"):
+                self.warehouse.load_files(part_paths, dataset, load_table)
+        else:
+            payload = df.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+            with metrics_module._phase(metrics, "bigquery_write"):
+                self.warehouse.load_json(payload, dataset, load_table)
+            with metrics_module._phase(metrics, "gcs_write"):
+                for directory, part in self._partitions(df, gcs_path, partition_by):
+                    if partition_by:
+                        part_payload = part.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+                    else:
+                        part_payload = payload
+                    self._write_part(directory, gzip.compress(part_payload), 'json.gz',
+                                     content_type="application/gzip")
+                utils._write_bytes(f'{gcs_path}/_SUCCESS', b"")
+        with metrics_module._phase(metrics, "merge"):
+            _finish_load(self.warehouse, dataset, load_table, table, write_mode, keys)
+
+    def _partitions(self, df, gcs_path, partition_by):
+        if not partition_by:
+            return [(gcs_path, df)]
+        return [(f'{gcs_path}/{utils.PARTITION_COLUMN}={value}', part)
+                for value, part in df.groupby(df[partition_by].astype(str), sort=True)]
+
+    def _write_part(self, directory, data, extension, content_type=None):
+        # Partition directories are shared across runs, a fixed part name
+        # makes a rerun replace the day instead of adding a second copy.
+        if f'/{utils.PARTITION_COLUMN}=' in directory:
+            name = f'part-00000-c000.{extension}'
+        else:
+            name = f'part-00000-{uuid.uuid4()}-c000.{extension}'
+        if extension == 'parquet':
+            name = name.replace('.parquet', f'.{utils.PARQUET_COMPRESSION}.parquet')
+        self._write(f'{directory}/{name}', data, content_type=content_type)
+        return f'{directory}/{name}'
+
+    def _write(self, path, data, content_type=None):
+        utils._write_bytes(path, data, content_type=content_type)
+        self.bytes_written += len(data)
+
+    def _parquet_bytes(self, df, column_types, arrow_schema=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Same Spark SQL type names the SparkBackend casts with.
+        arrow_types = {"date": pa.date32(), "timestamp": pa.timestamp("us")}
+        table = pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False)
+        for column, column_type in (column_types or {}).items():
+            table = table.set_column(table.schema.get_field_index(column), column,
+                                     table[column].cast(arrow_types[column_type]))
+        buffer = pa.BufferOutputStream()
+        pq.write_table(table, buffer, compression=utils.PARQUET_COMPRESSION,
+                       coerce_timestamps='us')
+        return buffer.getvalue().to_pybytes()
+
+def _timed(metrics, phase, sink):
+    # A write sink whose time is added to phase.
+    def timed(df):
+        with metrics_module._phase(metrics, phase):
+            return sink(df)
+    return timed
+
+def _load_rejected(warehouse, rejected, dataset, rejected_table, metrics=None, write_mode="append"):
+    # Rows of rules._rejected_rows, loaded the same way by both backends. An
+    # upsert inserts only the raw records the table does not hold yet, as
+    # write_frame does, so a rerun of a date does not duplicate them.
+    payload = "\n".join(json.dumps(row, default=str) for row in rejected).encode("utf-8")
+    with metrics_module._phase(metrics, "rejected_write"):
+        if write_mode != "upsert":
+            warehouse.load_json(payload, dataset, rejected_table)
+            return
+        staging = warehouse.create_staging(dataset, rejected_table)
+        try:
+            warehouse.load_json(payload, dataset, staging)
+            warehouse.insert_missing(dataset, staging, rejected_table, (rules_module.RAW_RECORD_COLUMN,))
+        finally:
+            warehouse.drop(dataset, staging)
+
+def _load_control_counts(warehouse, counts, keys, dataset, control_table, process_datetime,
+                         write_mode="append"):
+    """
+    Loads the control rows of counts, the "counts" of a write keyed by keys.
+    They follow the write mode of the fact table: an upsert merges them on
+    keys, so a rerun of a date replaces its counts instead of adding a second
+    set. Returns the number of control rows.
+    """
+    control = utils._control_records(counts, keys, process_datetime)
+    if control:
+        load_table = _load_table(warehouse, dataset, control_table, write_mode)
+        warehouse.load_json("\n".join(json.dumps(row) for row in control).encode("utf-8"),
+                            dataset, load_table)
+        _finish_load(warehouse, dataset, load_table, control_table, write_mode, keys)
+    return len(control)
+
+def _load_table(warehouse, dataset, table, write_mode):
+    # Upserts land in a staging table first and are merged afterwards.
+    if write_mode == "append":
+        return table
+    if write_mode == "upsert":
+        return warehouse.create_staging(dataset, table)
+    raise ValueError(f"Not supported write mode: {write_mode}")
+
+def _parquet_uris(gcs_path, partitions=None, partitioned=False):
+    # Only the partitions of this batch, older days live under the same path.
+    if not partitioned:
+        return [f'{gcs_path}/*.parquet']
+    if partitions is None:
+        # Every dt= directory, BigQuery takes a single wildcard per uri.
+        return [f'{gcs_path}/{utils.PARTITION_COLUMN}=*']
+    return [f'{gcs_path}/{utils.PARTITION_COLUMN}={value}/*.parquet' for value in sorted(partitions)]
+
+def _split_stats(records, rules, partition_by):
+    # Driver-side counterpart of the observed write metrics.
+    accepted, rejected = rules_module._split_records(records, rules or [])
+    stats = {"rows": len(accepted), "rejected": len(rejected)}
+    if partition_by:
+        stats["partitions"] = {str(record[partition_by]) for record in accepted}
+    return stats
+
+def _finish_load(warehouse, dataset, load_table, table, write_mode, keys):
+    if write_mode == "upsert":
+        try:
+            warehouse.merge(dataset, load_table, table, keys)
+        finally:
+            warehouse.drop(dataset, load_table)
+
+def _select_backend(name, n_rows, warehouse, local_max_rows=utils.LOCAL_BACKEND_MAX_ROWS):
+    if name == "auto":
+        name = "local" if n_rows <= local_max_rows else "spark"
+    if name == "spark":
+        return SparkBackend(warehouse)
+    if name == "local":
+        return LocalBackend(warehouse)
+    raise ValueError(f"Not supported backend: {name}")
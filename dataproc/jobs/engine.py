@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import backends
+import metrics as metrics_module
+import rules
+import schema_registry
+import utils
+import warehouse
+
+LOGGER: logging.Logger = logging.getLogger("dataproc_processor")
+
+# Settings of the config file and their defaults.
+ENGINE_DEFAULTS = {
+    "max_concurrent_feeds": 4,
+    # Shared by the API calls of every feed.
+    "max_fetch_workers": utils.HTTP_MAX_WORKERS,
+    "scheduler_allocation_file": None,
+    "backend": "auto",
+    "local_max_rows": utils.LOCAL_BACKEND_MAX_ROWS,
+    "use_cache": True,
+    # Loaded-dates manifests, <datalake path>/state by default.
+    "state_path": None,
+    "force": False,
+    # CREATE TABLE files of the feed schemas (schema_registry defaults).
+    "schemas_path": None,
+}
+# Keys of a feed besides the required name, url and table.
+FEED_DEFAULTS = {
+    "date_param": "fecha",
+    "dataset": "raw_sales",
+    "path": "ingested/transactions",
+    "keys": [],
+    "rules": None,
+    "rejected_table": None,
+    "control_table": None,
+    "partition_by": None,
+    "column_types": None,
+    "ingestion_mode": "direct",
+    "write_mode": "append",
+    # Compacts flat outputs into objects of about this size plus a manifest.
+    "target_file_mb": None,
+    # dataset.table of the registry describing the fetched records, their
+    # types are inferred when unset.
+    "schema": None,
+}
+
+def _load_config(path):
+    """
+    Reads the engine config (a local path or gs:// uri): a settings mapping
+    and a feeds list, each feed at least {name, url, table}. Raises
+    ValueError on incomplete or duplicated feeds.
+    """
+    import yaml
+    data = utils._read_bytes(path)
+    if data is None:
+        raise ValueError(f"Config file not found: {path}")
+    config = yaml.safe_load(data) or {}
+    settings = dict(ENGINE_DEFAULTS, **(config.get("settings") or {}))
+    feeds = []
+    for feed in config.get("feeds") or []:
+        missing = [key for key in ("name", "url", "table") if not feed.get(key)]
+        if missing:
+            raise ValueError(f"Feed {feed} is missing {', '.join(missing)}")
+        if feed.get("rules") and feed["rules"] not in rules.RULE_SETS:
+            raise ValueError(f"Feed {feed['name']}: unknown rule set {feed['rules']}")
+        feeds.append(dict(FEED_DEFAULTS, **feed))
+    names = [feed["name"] for feed in feeds]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicated feed names in {path}")
+    if not feeds:
+        raise ValueError(f"No feeds in {path}")
+    return settings, feeds
+
+def _pinned_threads(spark):
+    # Local properties follow the Python thread only when Py4J pins every
+    # Python thread to a JVM thread of its own: the default from Spark 3.2,
+    # PYSPARK_PIN_THREAD=true in the driver environment on Spark 3.1.
+    from py4j.clientserver import ClientServer
+    return isinstance(spark.sparkContext._gateway, ClientServer)
+
+class IngestionEngine:
+    """
+    Loads every feed of a config in one process. Feeds run concurrently, each
+    in its own FAIR scheduler pool of a single SparkSession (started only if
+    some feed needs it), and all of their API calls go through one bounded
+    fetch pool and HTTP session.
+
+    Pools need pinned threads. On Spark 3.1 (Dataproc 2.0) the cluster sets
+    spark-env:PYSPARK_PIN_THREAD=true (cloudbuild.yaml); without it the feeds
+    share the default pool and a warning is logged.
+    """
+    def __init__(self, project, settings, datalake_path=None, warehouse_uri=None, metrics=None):
+        self.project = project
+        # Phases of every feed are recorded as <feed>.<phase>.
+        self.metrics = metrics
+        self.settings = settings
+        self.datalake_path = datalake_path or f'gs://{project}-datalake'
+        self.sink = warehouse._get_warehouse(project, warehouse_uri)
+        self._spark_backend = None
+        # Whether feeds get their own scheduler pool, see _pinned_threads.
+        self._pools = False
+        self._lock = threading.Lock()
+
+    def _spark(self):
+        with self._lock:
+            if self._spark_backend is None:
+                conf = {"spark.scheduler.mode": "FAIR"}
+                if self.settings["scheduler_allocation_file"]:
+                    conf["spark.scheduler.allocation.file"] = self.settings["scheduler_allocation_file"]
+                # Only read when this process starts the JVM itself, under
+                # spark-submit it comes from the driver environment.
+                os.environ.setdefault("PYSPARK_PIN_THREAD", "true")
+                self._spark_backend = backends.SparkBackend(self.sink, app_name="ETLIngestionEngine",
+                                                            conf=conf)
+                self._pools = _pinned_threads(self._spark_backend.spark)
+                if not self._pools:
+                    LOGGER.warning("PYSPARK_PIN_THREAD is not enabled, every feed runs in the "
+                                   "default scheduler pool")
+                if self.metrics is not None:
+                    self.metrics.attach_spark(self._spark_backend.spark)
+            return self._spark_backend
+
+    def _writer(self, feed, n_rows):
+        backend = self.settings["backend"]
+        if backend == "auto":
+            backend = "local" if n_rows <= self.settings["local_max_rows"] else "spark"
+        if backend == "local":
+            return backends.LocalBackend(self.sink)
+        if backend != "spark":
+            raise ValueError(f"Not supported backend: {backend}")
+        writer = self._spark()
+        if self._pools:
+            # Local properties are per (pinned) thread, every job this feed
+            # submits from now on is scheduled in its own pool.
+            writer.spark.sparkContext.setLocalProperty("spark.scheduler.pool", feed["name"])
+        return writer
+
+    def _gcs_path(self, feed, process_dates):
+        file_format = 'parquet' if feed["ingestion_mode"] == "parquet" else 'json'
+        path = f'{self.datalake_path}/{feed["path"]}/{file_format}'
+        if feed["partition_by"]:
+            return f'{path}/{feed["table"]}'
+        extension = 'parquet' if feed["ingestion_mode"] == "parquet" else 'json.gz'
+        return f'{path}/{utils._dates_label(process_dates)}/{feed["table"]}_{uuid.uuid4().hex[:4]}.{extension}'
+
+    def run_feed(self, feed, process_dates, datetime_str, session, fetch_executor):
+        state_path = self.settings["state_path"] or f'{self.datalake_path}/state'
+        manifest = utils.LoadManifest(f'{state_path}/{feed["dataset"]}.{feed["table"]}.json')
+        if not self.settings["force"]:
+            with metrics_module._phase(self.metrics, f'{feed["name"]}.manifest'):
+                process_dates = manifest.missing(process_dates)
+            if not process_dates:
+                LOGGER.warning(f"feed {feed['name']}: every date is already loaded "
+                               f"(watermark {manifest.watermark()})")
+                return {"rows": 0, "rejected": 0}
+        cache = None
+        if self.settings["use_cache"]:
+            cache = utils.CurrencyCache(f'{self.datalake_path}/cache/{feed["name"]}')
+        with metrics_module._phase(self.metrics, f'{feed["name"]}.fetch'):
+            payloads = utils._get_currencies_by_date(process_dates, feed["url"],
+                                                     max_workers=self.settings["max_fetch_workers"],
+                                                     cache=cache, date_param=feed["date_param"],
+                                                     session=session, executor=fetch_executor)
+        records = [dict(payload, process_datetime=datetime_str) for payload in payloads]
+        schema = None
+        if feed["schema"]:
+            schema = schema_registry._get_registry(self.settings["schemas_path"], self.project).get(feed["schema"])
+        writer = self._writer(feed, len(records))
+        keys = tuple(feed["keys"])
+        # Backend phases of concurrent feeds add up under shared names, the
+        # <feed>.write phase is each feed's own wall time.
+        with metrics_module._phase(self.metrics, f'{feed["name"]}.write'):
+            written = writer.write(records, feed["dataset"], feed["table"],
+                                   self._gcs_path(feed, process_dates),
+                                   ingestion_mode=feed["ingestion_mode"],
+                                   write_mode=feed["write_mode"], keys=keys,
+                                   partition_by=feed["partition_by"],
+                                   column_types=feed["column_types"],
+                                   rules=rules.RULE_SETS[feed["rules"]] if feed["rules"] else None,
+                                   rejected_table=feed["rejected_table"],
+                                   count_by=keys if feed["control_table"] and keys else None,
+                                   target_file_bytes=(feed["target_file_mb"] * 1024 * 1024
+                                                      if feed["target_file_mb"] else None),
+                                   schema=schema, metrics=self.metrics)
+        if "counts" in written:
+            with metrics_module._phase(self.metrics, f'{feed["name"]}.control_counts'):
+                backends._load_control_counts(self.sink, written["counts"], keys, feed["dataset"],
+                                              feed["control_table"], datetime_str, feed["write_mode"])
+        if self.metrics is not None:
+            self.metrics.add(rows_written=written['rows'], rows_rejected=written['rejected'],
+                             bytes_written=written.get('bytes'))
+        LOGGER.warning(f"feed {feed['name']}: loaded {written['rows']} rows into "
+                       f"{feed['dataset']}.{feed['table']} with the {writer.name} backend, "
+                       f"rejected {written['rejected']}")
+        manifest.mark_loaded(process_dates)
+        return written
+
+    def run(self, feeds, process_dates):
+        """
+        Runs every feed over process_dates. A failing feed does not stop the
+        others, the failures are raised together once all feeds finished.
+        """
+        datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        max_fetch_workers = self.settings["max_fetch_workers"]
+        session = utils._build_session(pool_size=max_fetch_workers)
+        results, errors = {}, {}
+        try:
+            with ThreadPoolExecutor(max_workers=max_fetch_workers) as fetch_executor, \
+                    ThreadPoolExecutor(max_workers=self.settings["max_concurrent_feeds"]) as feed_executor:
+                futures = {feed["name"]: feed_executor.submit(self.run_feed, feed, process_dates,
+                                                              datetime_str, session, fetch_executor)
+                           for feed in feeds}
+                for name, future in futures.items():
+                    try:
+                        results[name] = future.result()
+                    except Exception as error:
+                        LOGGER.error(f"feed {name} failed: {error}")
+                        errors[name] = error
+        finally:
+            session.close()
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(feeds)} feeds failed: {', '.join(errors)}")
+        return results
+
+@metrics_module.instrumented("ingestion_engine")
+def run_engine(project, config_path, process_dates, datalake_path=None,
+               warehouse_uri=None, backend=None, state_path=None, force=False,
+               schemas_path=None, metrics=None):
+    settings, feeds = _load_config(config_path)
+    if schemas_path:
+        settings["schemas_path"] = schemas_path
+    if state_path:
+        settings["state_path"] = state_path
+    settings["force"] = settings["force"] or force
+    if backend and backend != "auto":
+        settings["backend"] = backend
+    LOGGER.warning(f"ingesting {len(feeds)} feeds from {config_path}: {', '.join(f['name'] for f in feeds)}")
+    IngestionEngine(project, settings, datalake_path, warehouse_uri, metrics).run(feeds, process_dates)
+    return "PySpark Ingestion Engine Finished"
@@ -0,0 +1,154 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+import utils
+
+LOGGER: logging.Logger = logging.getLogger("dataproc_processor")
+
+# Local directory every run writes its metrics record to.
+METRICS_PATH = 'metrics'
+# Stage fields summed from the Spark monitoring API.
+SPARK_STAGE_FIELDS = ("executorRunTime", "executorCpuTime", "inputBytes", "inputRecords",
+                      "outputBytes", "outputRecords", "shuffleReadBytes", "shuffleWriteBytes",
+                      "memoryBytesSpilled", "diskBytesSpilled")
+
+class RunMetrics:
+    """
+    Wall and CPU time per phase, counters (rows, bytes...) and Spark stage
+    totals of one run, emitted as a single JSON record.
+    """
+    def __init__(self, job, params=None):
+        self.job = job
+        self.run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.params = params or {}
+        self.started_at = time.time()
+        self.status = "running"
+        self.error = None
+        self.phases = {}
+        self.counters = {}
+        self.spark = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        # Repeated phases add up. CPU time is the whole process', threads
+        # running at the same time are all counted.
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+                entry["wall_s"] += time.perf_counter() - wall
+                entry["cpu_s"] += time.process_time() - cpu
+                entry["calls"] += 1
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                if value is not None:
+                    self.counters[name] = self.counters.get(name, 0) + value
+
+    def attach_spark(self, spark):
+        self.spark = spark
+
+    def spark_stages(self):
+        """
+        Totals of the completed stages of the attached SparkSession from its
+        monitoring API, or only the stage count from the status tracker when
+        the UI is disabled.
+        """
+        if self.spark is None:
+            return None
+        context = self.spark.sparkContext
+        if context.uiWebUrl:
+            try:
+                import requests
+                stages = requests.get(
+                    f'{context.uiWebUrl}/api/v1/applications/{context.applicationId}/stages',
+                    params={"status": "complete"}, timeout=10).json()
+                totals = {field: sum(stage.get(field, 0) for stage in stages) for field in SPARK_STAGE_FIELDS}
+                totals["stages"] = len(stages)
+                totals["tasks"] = sum(stage.get("numCompleteTasks", 0) for stage in stages)
+                return totals
+            except Exception as error:
+                LOGGER.warning(f"spark monitoring api unavailable: {error}")
+        tracker = context.statusTracker()
+        stage_ids = [stage_id for job_id in tracker.getJobIdsForGroup()
+                     for stage_id in (tracker.getJobInfo(job_id).stageIds if tracker.getJobInfo(job_id) else [])]
+        return {"stages": len(stage_ids)}
+
+    def record(self):
+        finished_at = time.time()
+        return {
+            "job": self.job,
+            "run_id": self.run_id,
+            "status": self.status,
+            "error": self.error,
+            "started_at": datetime.fromtimestamp(self.started_at).strftime('%Y-%m-%d %H:%M:%S'),
+            "finished_at": datetime.fromtimestamp(finished_at).strftime('%Y-%m-%d %H:%M:%S'),
+            "wall_s": round(finished_at - self.started_at, 6),
+            "params": self.params,
+            "phases": {name: {key: round(value, 6) for key, value in entry.items()}
+                       for name, entry in self.phases.items()},
+            "counters": self.counters,
+            "spark": self.spark_stages(),
+        }
+
+    def emit(self, path=METRICS_PATH, uri=None):
+        """
+        Writes the record as <path>/<job>_<run_id>.json and, with uri (a
+        gs:// prefix), as the same object name under it. Returns the record.
+        """
+        record = self.record()
+        data = json.dumps(record, indent=2, default=str).encode("utf-8")
+        name = f'{self.job}_{self.run_id}.json'
+        for root in (path, uri):
+            if root:
+                utils._write_bytes(f"{root.rstrip('/')}/{name}", data, content_type="application/json")
+        LOGGER.warning(f"metrics {name}: {json.dumps(record['phases'], default=str)}")
+        return record
+
+@contextmanager
+def _phase(metrics, name):
+    # metrics.phase(name), or nothing when the caller runs uninstrumented.
+    if metrics is None:
+        yield
+    else:
+        with metrics.phase(name):
+            yield
+
+def instrumented(job):
+    """
+    Runs the decorated job with a RunMetrics passed as its metrics keyword
+    and emits it when the job ends, failed runs included. The wrapper takes
+    metrics_path (local directory) and metrics_uri (optional gs:// prefix).
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, metrics_path=METRICS_PATH, metrics_uri=None, **kwargs):
+            arguments = inspect.signature(function).bind_partial(*args, **kwargs).arguments
+            metrics = RunMetrics(job, params={key: value for key, value in arguments.items()
+                                              if isinstance(value, (str, int, float, bool, type(None)))})
+            try:
+                result = function(*args, metrics=metrics, **kwargs)
+                metrics.status = "succeeded"
+                return result
+            except Exception as error:
+                metrics.status = "failed"
+                metrics.error = repr(error)
+                raise
+            finally:
+                try:
+                    metrics.emit(metrics_path or METRICS_PATH, metrics_uri)
+                except Exception as error:
+                    # Losing a metrics record must not fail the load itself.
+                    LOGGER.warning(f"could not emit metrics: {error}")
+        return wrapper
+    return decorator
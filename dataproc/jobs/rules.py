@@ -0,0 +1,127 @@
+import json
+import re
+from datetime import datetime
+
+REJECTED_COLUMN = 'mensaje_rejected'
+REJECTED_SEPARATOR = '; '
+# The rejected record as received, JSON text without its null values.
+RAW_RECORD_COLUMN = 'raw_record'
+# Set by the job on every run and kept out of the raw record, a rerun of the
+# same payload then has the same raw_record and an upsert loads it once.
+RUN_COLUMNS = ('process_datetime',)
+
+class Rule:
+    """
+    A row check with a Spark SQL predicate (evaluated inside the job's own
+    plan) and the same check as a Python callable over a record dict for the
+    local backend. Rows failing it are rejected with message.
+    """
+    def __init__(self, message, condition, check):
+        self.message = message
+        self.condition = condition
+        self.check = check
+
+    def passes(self, record):
+        try:
+            return bool(self.check(record))
+        except (TypeError, ValueError):
+            return False
+
+def _is_date(value):
+    return datetime.strptime(value, '%Y-%m-%d') is not None
+
+def _is_positive(value):
+    return value is not None and float(value) > 0
+
+CURRENCY_RULES = [
+    Rule("fecha vacia o sin formato YYYY-MM-DD",
+         "fecha RLIKE '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' AND to_date(fecha, 'yyyy-MM-dd') IS NOT NULL",
+         lambda r: re.fullmatch(r'\d{4}-\d{2}-\d{2}', r['fecha']) and _is_date(r['fecha'])),
+    Rule("moneda vacia o no es un codigo ISO de 3 letras",
+         "moneda RLIKE '^[A-Z]{3}$'",
+         lambda r: re.fullmatch(r'[A-Z]{3}', r['moneda'])),
+    Rule("compra nula o no positiva",
+         "compra > 0",
+         lambda r: _is_positive(r['compra'])),
+    Rule("venta nula o no positiva",
+         "venta > 0",
+         lambda r: _is_positive(r['venta'])),
+    Rule("venta menor que compra",
+         "venta >= compra",
+         lambda r: float(r['venta']) >= float(r['compra'])),
+    Rule("origen vacio",
+         "origen IS NOT NULL AND trim(origen) <> ''",
+         lambda r: r['origen'] is not None and r['origen'].strip() != ''),
+]
+
+# Rule sets a feed of the ingestion engine config can name.
+RULE_SETS = {
+    "currency": CURRENCY_RULES,
+}
+
+def _rejected_message(record, rules):
+    # None when every rule passes, otherwise all failed messages joined.
+    messages = [rule.message for rule in rules if not rule.passes(record)]
+    return REJECTED_SEPARATOR.join(messages) or None
+
+def _split_records(records, rules):
+    """
+    Splits records into (accepted, rejected), rejected records carry the
+    failed rule messages in REJECTED_COLUMN.
+    """
+    accepted, rejected = [], []
+    for record in records:
+        message = _rejected_message(record, rules)
+        if message is None:
+            accepted.append(record)
+        else:
+            rejected.append(dict(record, **{REJECTED_COLUMN: message}))
+    return accepted, rejected
+
+def _raw_record(record):
+    return json.dumps({name: value for name, value in record.items()
+                       if name != REJECTED_COLUMN and name not in RUN_COLUMNS
+                       and value is not None}, default=str)
+
+def _rejected_rows(rejected, schema=None):
+    """
+    Rows of the rejected table for the rejected records of _split_records:
+    the record columns conformed to schema (a compra "abc" is null, the typed
+    columns of the table can not hold it), the rule messages and the raw
+    record in RAW_RECORD_COLUMN, so no rejected value is lost.
+    """
+    if schema is None:
+        typed = [{name: value for name, value in record.items() if name != REJECTED_COLUMN}
+                 for record in rejected]
+    else:
+        typed = [dict(zip(schema.names, row)) for row in schema.conform(rejected)]
+    return [dict(row, **{REJECTED_COLUMN: record[REJECTED_COLUMN],
+                         RAW_RECORD_COLUMN: _raw_record(record)})
+            for row, record in zip(typed, rejected)]
+
+def _with_rejected_message(df, rules):
+    """
+    Adds REJECTED_COLUMN to df in the same projection: null for accepted rows,
+    the failed rule messages otherwise. A predicate evaluating to null counts
+    as failed.
+    """
+    from pyspark.sql.functions import coalesce, concat_ws, expr, lit, when
+    messages = concat_ws(REJECTED_SEPARATOR, *[
+        when(~coalesce(expr(rule.condition), lit(False)), lit(rule.message))
+        for rule in rules
+    ])
+    return df.withColumn(REJECTED_COLUMN, when(messages != "", messages))
+
+def _with_raw_record(df, schema=None):
+    """
+    Spark counterpart of _rejected_rows for a frame of raw values (read as
+    strings): RAW_RECORD_COLUMN holds every row as JSON text and the columns
+    are cast to schema, null where a value does not convert, so the rules
+    then judge what the table would hold.
+    """
+    from pyspark.sql.functions import col, struct, to_json
+    raw = to_json(struct(*[name for name in df.columns if name not in RUN_COLUMNS])).alias(RAW_RECORD_COLUMN)
+    if schema is None:
+        return df.select("*", raw)
+    return df.select(*[col(field.name).cast(field.dataType).alias(field.name)
+                       for field in schema.spark().fields], raw)
@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+import utils
+
+LOGGER: logging.Logger = logging.getLogger("dataproc_processor")
+
+# schemas/ of the repository when running from a checkout, the job falls back
+# to the copy cloudbuild uploads next to the other resources.
+LOCAL_SCHEMAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schemas')
+
+_CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?([\w.-]+)`?\s*\(', re.I)
+
+def _to_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def _to_timestamp(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+# BigQuery type -> Spark / pyarrow type, imported lazily so the module loads
+# without pyspark or pyarrow.
+def _spark_type(bq_type):
+    from pyspark.sql import types
+    return {
+        "STRING": types.StringType(), "FLOAT64": types.DoubleType(), "FLOAT": types.DoubleType(),
+        "INT64": types.LongType(), "INTEGER": types.LongType(), "NUMERIC": types.DecimalType(38, 9),
+        "BOOL": types.BooleanType(), "BOOLEAN": types.BooleanType(), "DATE": types.DateType(),
+        "TIMESTAMP": types.TimestampType(), "DATETIME": types.TimestampType(), "BYTES": types.BinaryType(),
+    }[bq_type]
+
+def _arrow_type(bq_type):
+    import pyarrow as pa
+    return {
+        "STRING": pa.string(), "FLOAT64": pa.float64(), "FLOAT": pa.float64(),
+        "INT64": pa.int64(), "INTEGER": pa.int64(), "NUMERIC": pa.decimal128(38, 9),
+        "BOOL": pa.bool_(), "BOOLEAN": pa.bool_(), "DATE": pa.date32(),
+        "TIMESTAMP": pa.timestamp("us", tz="UTC"), "DATETIME": pa.timestamp("us"), "BYTES": pa.binary(),
+    }[bq_type]
+
+_CONVERTERS = {
+    "STRING": str, "FLOAT64": float, "FLOAT": float, "INT64": int, "INTEGER": int,
+    "BOOL": bool, "BOOLEAN": bool, "DATE": _to_date, "TIMESTAMP": _to_timestamp,
+    "DATETIME": _to_timestamp,
+}
+
+def _convert(convert, value):
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return None
+
+class TableSchema:
+    """
+    Columns of one CREATE TABLE statement as (name, BigQuery type, nullable),
+    with the matching Spark StructType and pyarrow schema built once.
+    """
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self._spark = None
+        self._arrow = None
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.columns]
+
+    def spark(self):
+        if self._spark is None:
+            from pyspark.sql.types import StructField, StructType
+            self._spark = StructType([StructField(name, _spark_type(bq_type), nullable)
+                                      for name, bq_type, nullable in self.columns])
+        return self._spark
+
+    def spark_raw(self):
+        """
+        The same columns all typed STRING: the JSON reader keeps every value
+        as received (a compra "abc" is not nulled before the rules see it).
+        """
+        from pyspark.sql.types import StringType, StructField, StructType
+        return StructType([StructField(name, StringType(), True) for name in self.names])
+
+    def arrow(self):
+        if self._arrow is None:
+            import pyarrow as pa
+            self._arrow = pa.schema([pa.field(name, _arrow_type(bq_type), nullable)
+                                     for name, bq_type, nullable in self.columns])
+        return self._arrow
+
+    def conform(self, records):
+        """
+        Records as tuples in column order with every value converted to its
+        column type (an int compra becomes a float), ready for
+        createDataFrame(rows, self.spark()) without inference or verification.
+        Keys outside the schema are dropped, missing ones and values that do
+        not convert are None (the ingestion rules then reject them).
+        """
+        converters = [(name, _CONVERTERS.get(bq_type, lambda value: value))
+                      for name, bq_type, _ in self.columns]
+        return [tuple(_convert(convert, record.get(name)) for name, convert in converters)
+                for record in records]
+
+def _split_columns(body):
+    # Top-level comma split, commas inside NUMERIC(10, 2) or STRUCT<...> stay.
+    columns, depth, current = [], 0, []
+    for char in body:
+        if char in '(<':
+            depth += 1
+        elif char in ')>':
+            depth -= 1
+        if char == ',' and depth == 0:
+            columns.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    columns.append(''.join(current))
+    return [column.strip() for column in columns if column.strip()]
+
+def _parse_ddl(ddl):
+    """
+    Yields (table, columns) for every CREATE TABLE statement of ddl. Types
+    are reduced to their base name (NUMERIC(10, 2) -> NUMERIC).
+    """
+    for match in _CREATE_TABLE.finditer(ddl):
+        depth, end = 1, match.end()
+        while depth and end < len(ddl):
+            depth += {'(': 1, ')': -1}.get(ddl[end], 0)
+            end += 1
+        columns = []
+        for column in _split_columns(ddl[match.end():end - 1]):
+            if re.match(r'(PRIMARY|FOREIGN|CONSTRAINT)\b', column, re.I):
+                continue
+            name, bq_type = column.split()[:2]
+            base_type = re.match(r'\w+', bq_type).group(0).upper()
+            columns.append((name.strip('`'), base_type, 'NOT NULL' not in column.upper()))
+        yield match.group(1), columns
+
+class SchemaRegistry:
+    """
+    Table schemas parsed from the *.sql files under path (a local directory
+    or a gs:// prefix), keyed by dataset.table. Files are read in name order
+    and, as with CREATE TABLE IF NOT EXISTS, the first definition of a table
+    wins.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tables = {}
+        for file_path, _ in utils._list_files(path):
+            if not file_path.endswith('.sql'):
+                continue
+            for table, columns in _parse_ddl(utils._read_bytes(file_path).decode("utf-8")):
+                if table in self.tables:
+                    LOGGER.warning(f"{file_path} defines {table} again, keeping the first definition")
+                    continue
+                self.tables[table] = TableSchema(table, columns)
+
+    def get(self, table):
+        if table not in self.tables:
+            raise ValueError(f"No schema for {table} in {self.path}")
+        return self.tables[table]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def _schemas_path(project=None):
+    if os.path.isdir(LOCAL_SCHEMAS_PATH) or project is None:
+        return os.path.normpath(LOCAL_SCHEMAS_PATH)
+    return f'gs://{project}-datalake/resources/bigquery'
+
+def _get_registry(path=None, project=None):
+    # One registry per path and process, the DDL is parsed once.
+    path = path or _schemas_path(project)
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = SchemaRegistry(path)
+        return _registries[path]
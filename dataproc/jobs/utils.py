@@ -1,23 +1,538 @@
 import argparse
+import math
 import requests
 import json
+import os
+import shutil
+import uuid
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def _get_currency(url_currency):  
-    return requests.get(url_currency).json()
+SUNAT_URL = 'https://api.apis.net.pe/v1/tipo-cambio-sunat'
+# (connect, read) timeout in seconds for every API call
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 5
+# Retries sleep backoff_factor * 2 ** (retry - 1) seconds: 0.5, 1, 2, 4...
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_MAX_WORKERS = 8
+# Seconds a cached rate for the current (or a future) day stays valid, past
+# days never change once published and are cached forever.
+CACHE_TODAY_TTL = 15 * 60
+# Batches up to this many rows are written without starting a SparkSession
+# when the backend is "auto".
+LOCAL_BACKEND_MAX_ROWS = 50000
+PARQUET_COMPRESSION = 'zstd'
+# Streaming mode: micro-batch interval and the most landed files per batch
+STREAM_TRIGGER_SECONDS = 5
+STREAM_MAX_FILES_PER_TRIGGER = 100
+# Compacted output: target size of each written object, and rough ratio of
+# the written (compressed) bytes to Spark's in-memory size estimate.
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+OUTPUT_SIZE_RATIO = {"json": 0.2, "parquet": 0.1}
+# Hive-style partition directory written for partitioned layouts (dt=YYYY-MM-DD)
+PARTITION_COLUMN = 'dt'
+
+# Single-feed and streaming arguments that --config feeds do not take.
+CONFIG_IGNORED_ARGS = ('api_url', 'cache_path', 'use_cache', 'show', 'local_max_rows',
+                       'ingestion_mode', 'write_mode', 'rejected_table', 'control_table',
+                       'control_counts', 'apply_rules', 'layout', 'target_file_mb',
+                       'max_workers', 'landing_path', 'checkpoint_path', 'trigger_seconds',
+                       'max_files_per_trigger', 'available_now')
+
+_storage_client = None
+_bigquery_clients = {}
+
+def _currency_url(process_date, base_url=SUNAT_URL, date_param='fecha'):
+    return f'{base_url}?{date_param}={process_date}'
+
+def _build_session(pool_size=HTTP_MAX_WORKERS, retries=HTTP_RETRIES,
+                   backoff_factor=HTTP_BACKOFF_FACTOR):
+    # Connections are reused across calls and bounded by pool_size, throttled
+    # (429) and transient 5xx responses are retried with exponential backoff.
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _get_currency(url_currency, session=None, timeout=HTTP_TIMEOUT):
+    response = (session or requests).get(url_currency, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def _map(function, iterables, max_workers=HTTP_MAX_WORKERS, executor=None):
+    # executor.map over a shared executor when given (its size bounds the
+    # calls of every caller), otherwise over one of max_workers threads.
+    if executor is not None:
+        return list(executor.map(function, *iterables))
+    with ThreadPoolExecutor(max_workers=max_workers) as own_executor:
+        return list(own_executor.map(function, *iterables))
+
+def _get_currencies(urls_currency, max_workers=HTTP_MAX_WORKERS, session=None, executor=None):
+    # At most max_workers requests are in flight, results keep the order of
+    # urls_currency.
+    own_session = session is None
+    if own_session:
+        session = _build_session(pool_size=max_workers)
+    try:
+        return _map(lambda url: _get_currency(url, session), [urls_currency],
+                    max_workers=max_workers, executor=executor)
+    finally:
+        if own_session:
+            session.close()
+
+def _get_currencies_by_date(process_dates, base_url=SUNAT_URL,
+                            max_workers=HTTP_MAX_WORKERS, cache=None,
+                            date_param='fecha', session=None, executor=None):
+    # Only dates missing from the cache go to the API.
+    urls = lambda dates: [_currency_url(process_date, base_url, date_param) for process_date in dates]
+    if cache is None:
+        return _get_currencies(urls(process_dates), max_workers=max_workers,
+                               session=session, executor=executor)
+    cached = dict(zip(process_dates, _map(cache.get, [process_dates],
+                                          max_workers=max_workers, executor=executor)))
+    missing = [process_date for process_date in process_dates if cached[process_date] is None]
+    if missing:
+        fetched = _get_currencies(urls(missing), max_workers=max_workers,
+                                  session=session, executor=executor)
+        _map(cache.put, [missing, fetched], max_workers=max_workers, executor=executor)
+        cached.update(zip(missing, fetched))
+    return [cached[process_date] for process_date in process_dates]
+
+class CurrencyCache:
+    """
+    Exchange rate responses keyed by date, stored as one JSON object per day
+    under root (a local directory or a gs://bucket/prefix).
+    """
+    def __init__(self, root, today_ttl=CACHE_TODAY_TTL):
+        self.root = root.rstrip('/')
+        self.today_ttl = today_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, process_date):
+        return f'{self.root}/{process_date}.json'
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, process_date):
+        data = _read_bytes(self._path(process_date))
+        entry = json.loads(data) if data is not None else None
+        if entry is not None:
+            cached_day = datetime.fromtimestamp(entry["cached_at"]).strftime('%Y-%m-%d')
+            # A rate cached on or before its own date may still change that day.
+            if process_date >= cached_day and time.time() - entry["cached_at"] > self.today_ttl:
+                entry = None
+        self._count(entry is not None)
+        return entry["payload"] if entry is not None else None
+
+    def put(self, process_date, payload):
+        entry = {"cached_at": time.time(), "payload": payload}
+        _write_bytes(self._path(process_date), json.dumps(entry).encode("utf-8"))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+class LoadManifest:
+    """
+    Dates already loaded into a table, kept as a single JSON object at path (a
+    local file or a gs:// uri) so a run checks them with one read. Only days
+    before the one they were loaded on are final, the current day may still
+    change and is loaded again.
+    """
+    def __init__(self, path):
+        self.path = path
+        data = _read_bytes(path)
+        self.dates = json.loads(data)["dates"] if data is not None else {}
+
+    def is_loaded(self, process_date):
+        entry = self.dates.get(process_date)
+        return entry is not None and process_date < entry["loaded_at"][:10]
+
+    def missing(self, process_dates):
+        return [process_date for process_date in process_dates if not self.is_loaded(process_date)]
+
+    def watermark(self):
+        # Latest final loaded date.
+        final = [process_date for process_date in self.dates if self.is_loaded(process_date)]
+        return max(final) if final else None
+
+    def mark_loaded(self, process_dates):
+        loaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for process_date in process_dates:
+            self.dates[process_date] = {"loaded_at": loaded_at}
+        manifest = {"watermark": self.watermark(), "dates": self.dates}
+        _write_bytes(self.path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+                     content_type="application/json")
+
+def _get_storage_client():
+    global _storage_client
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client()
+    return _storage_client
+
+def _split_gcs_path(path):
+    bucket, _, name = path[len('gs://'):].partition('/')
+    return bucket, name
+
+def _read_bytes(path):
+    # Returns None when the object does not exist.
+    if path.startswith('gs://'):
+        bucket, name = _split_gcs_path(path)
+        blob = _get_storage_client().bucket(bucket).get_blob(name)
+        return blob.download_as_bytes() if blob is not None else None
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _write_bytes(path, data, content_type=None):
+    if path.startswith('gs://'):
+        bucket, name = _split_gcs_path(path)
+        _get_storage_client().bucket(bucket).blob(name).upload_from_string(data, content_type=content_type)
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Write then rename so concurrent readers never see a partial file.
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _process_dates(process_date=None, start_date=None, end_date=None):
+    # A backfill range is fetched and loaded as a single batch, a single
+    # process_date is just a range of one day.
+    if start_date and end_date:
+        return _date_range(start_date, end_date)
+    return _date_range(process_date, process_date)
+
+def _dates_label(process_dates):
+    # YYYYMMDD of a single day, YYYYMMDD_YYYYMMDD of a range.
+    first = datetime.strptime(process_dates[0], '%Y-%m-%d').strftime('%Y%m%d')
+    if len(process_dates) == 1:
+        return first
+    return f"{first}_{datetime.strptime(process_dates[-1], '%Y-%m-%d').strftime('%Y%m%d')}"
+
+def _list_files(prefix):
+    # (path, size) of every file below prefix, sorted by path.
+    if prefix.startswith('gs://'):
+        bucket, name = _split_gcs_path(prefix)
+        blobs = _get_storage_client().list_blobs(bucket, prefix=f"{name.rstrip('/')}/")
+        return sorted((f'gs://{bucket}/{blob.name}', blob.size) for blob in blobs)
+    files = []
+    for directory, _, names in os.walk(prefix):
+        files.extend((os.path.join(directory, name), os.path.getsize(os.path.join(directory, name)))
+                     for name in names)
+    return sorted(files)
+
+def _move(source, destination):
+    if source.startswith('gs://'):
+        source_bucket, source_name = _split_gcs_path(source)
+        bucket, name = _split_gcs_path(destination)
+        client = _get_storage_client()
+        blob = client.bucket(source_bucket).blob(source_name)
+        client.bucket(source_bucket).copy_blob(blob, client.bucket(bucket), name)
+        blob.delete()
+        return
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    os.replace(source, destination)
+
+def _delete_tree(prefix):
+    if prefix.startswith('gs://'):
+        for path, _ in _list_files(prefix):
+            bucket, name = _split_gcs_path(path)
+            _get_storage_client().bucket(bucket).blob(name).delete()
+        return
+    shutil.rmtree(prefix, ignore_errors=True)
+
+def _manifest_path(path):
+    return f'{path}.manifest.json'
+
+def _write_manifest(path, objects, file_format):
+    """
+    Writes the manifest of a compacted output: the objects produced for path
+    with their sizes, so readers get them without listing the bucket.
+    """
+    manifest = {
+        "path": path,
+        "format": file_format,
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "objects": [{"path": object_path, "bytes": size} for object_path, size in objects],
+    }
+    _write_bytes(_manifest_path(path), json.dumps(manifest, indent=2).encode("utf-8"),
+                 content_type="application/json")
+    return objects
+
+def _read_manifest(path):
+    # Object paths of a compacted output, None when it has no manifest.
+    data = _read_bytes(_manifest_path(path))
+    if data is None:
+        return None
+    return [entry["path"] for entry in json.loads(data)["objects"]]
+
+def _compacted_names(path, extension, n_objects):
+    # path itself for a single object, <path>-00000<extension>... otherwise.
+    stem = path[:-len(extension)] if path.endswith(extension) else path
+    if n_objects == 1:
+        return [f'{stem}{extension}']
+    return [f'{stem}-{index:05d}{extension}' for index in range(n_objects)]
+
+def _date_range(start_date, end_date):
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if end < start:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    return [(start + timedelta(days=offset)).strftime('%Y-%m-%d')
+            for offset in range((end - start).days + 1)]
+
+def _write_once(df, sinks, metrics=None, fallback=None):
+    """
+    Runs every sink over df while computing its lineage only once: the frame is
+    persisted, the first sink materializes it and the others read the cached
+    blocks. Returns the metrics (name -> aggregate Column, a row count by
+    default) observed during that first write. On Spark versions without
+    DataFrame.observe (< 3.3) they are fallback() or, without one, the same
+    aggregates over the persisted frame.
+    """
+    from pyspark import StorageLevel
+    from pyspark.sql.functions import count, lit
+    metrics = metrics or {"rows": count(lit(1))}
+    observation = None
+    try:
+        from pyspark.sql import Observation
+        observation = Observation("write_metrics")
+        df = df.observe(observation, *[column.alias(name) for name, column in metrics.items()])
+    except ImportError:
+        pass
+    aggregated = {}
+    if observation is None and fallback is None:
+        sinks = list(sinks) + [lambda df: aggregated.update(
+            df.agg(*[column.alias(name) for name, column in metrics.items()]).first().asDict())]
+    df = df.persist(StorageLevel.MEMORY_AND_DISK)
+    try:
+        for sink in sinks:
+            sink(df)
+    finally:
+        df.unpersist()
+    if observation is None:
+        return fallback() if fallback is not None else aggregated
+    return observation.get
+
+def _count_by(df, columns):
+    """
+    Rows of df per value of columns, keyed by tuples of column values. Run as
+    a _write_once sink it aggregates the persisted frame; unlike an
+    accumulator updated by the tasks, a retried task can not count its rows
+    twice.
+    """
+    return {tuple(row[:-1]): row[-1] for row in df.groupBy(*columns).count().collect()}
+
+def _control_records(counts, keys, process_datetime):
+    # Rows of a control-count table (keys..., total_reg, process_datetime).
+    return [dict(zip(keys, key), total_reg=float(total), process_datetime=process_datetime)
+            for key, total in sorted(counts.items(), key=lambda item: tuple(map(str, item[0])))]
 
 def _load_bigquery(df, project, dataset, table):
     temporary_bucket_name = f'{project}-datalake'
     table_path = f'{project}.{dataset}.{table}'
-    (df.write.format("bigquery") 
+    (df.write.format("bigquery")
             .option("table", table_path)
             .option("temporaryGcsBucket", temporary_bucket_name)
             .mode("append").save())
+
+def _get_bigquery_client(project):
+    if project not in _bigquery_clients:
+        from google.cloud import bigquery
+        _bigquery_clients[project] = bigquery.Client(project=project)
+    return _bigquery_clients[project]
+
+def _file_writer(df, file_format, partition_by=None, overwrite=False):
+    writer = df.write.format(file_format)
+    if overwrite:
+        writer = writer.mode("overwrite")
+    if partition_by:
+        # Only the partitions present in df are replaced, so a rerun of a day
+        # overwrites it and leaves the other days alone.
+        writer = (writer.partitionBy(partition_by).mode("overwrite")
+                  .option("partitionOverwriteMode", "dynamic"))
+    return writer
+
+def _output_partitions(df, file_format, target_bytes):
+    """
+    Number of objects of about target_bytes for df, from the optimizer's size
+    estimate so no job runs for it. None when the plan has no estimate.
+    """
+    try:
+        size = int(df._jdf.queryExecution().optimizedPlan().stats().sizeInBytes().toString())
+    except Exception:
+        return None
+    return max(1, math.ceil(size * OUTPUT_SIZE_RATIO[file_format] / target_bytes))
+
+def _save_files(df, path, file_format, extension, partition_by=None, overwrite=False,
+                target_bytes=None, options=None):
+    """
+    Saves df as file_format under path, Spark's usual directory of part
+    files. With target_bytes (flat outputs only) the frame is resized to
+    objects of about that size, written to a temporary directory and moved to
+    properly named objects next to a manifest listing them; returns their
+    paths.
+    """
+    if not target_bytes or partition_by:
+        _file_writer(df, file_format, partition_by, overwrite).options(**(options or {})).save(path)
+        return None
+    n_objects = _output_partitions(df, file_format, target_bytes)
+    if n_objects is not None:
+        if n_objects < df.rdd.getNumPartitions():
+            df = df.coalesce(n_objects)
+        else:
+            df = df.repartition(n_objects)
+    tmp_path = f'{path}._tmp_{uuid.uuid4().hex[:8]}'
+    _file_writer(df, file_format).options(**(options or {})).save(tmp_path)
+    try:
+        parts = [(part, size) for part, size in _list_files(tmp_path)
+                 if os.path.basename(part).startswith('part-')]
+        objects = []
+        for (part, size), name in zip(parts, _compacted_names(path, extension, len(parts))):
+            _move(part, name)
+            objects.append((name, size))
+    finally:
+        _delete_tree(tmp_path)
+    return [name for name, _ in _write_manifest(path, objects, file_format)]
+
+def _load_gcs_parquet(df, path, partition_by=None, overwrite=False, target_bytes=None):
+    return _save_files(df, path, "parquet", ".parquet", partition_by, overwrite, target_bytes,
+                       {"compression": PARQUET_COMPRESSION})
+
 #"gs://bucket-name/path/to/destination/data.json.gz"
-def _load_gcs(df,path):
-    df.write.format("json").option("compression", "gzip").save(path)
+def _load_gcs(df, path, partition_by=None, overwrite=False, target_bytes=None):
+    return _save_files(df, path, "json", ".json.gz", partition_by, overwrite, target_bytes,
+                       {"compression": "gzip"})
 
 def _parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "process_date", help="The date that should start the reprocessing")
-    return vars(parser.parse_args())
\ No newline at end of file
+        "process_date", nargs="?", help="The date that should start the reprocessing")
+    parser.add_argument(
+        "--start-date", dest="start_date", help="First date (YYYY-MM-DD) of a backfill range")
+    parser.add_argument(
+        "--end-date", dest="end_date", help="Last date (YYYY-MM-DD) of a backfill range, inclusive")
+    parser.add_argument(
+        "--api-url", dest="api_url", default=SUNAT_URL,
+        help="Exchange rate endpoint, override to point the job at a local stub server")
+    parser.add_argument(
+        "--cache-path", dest="cache_path",
+        help="Local directory or gs:// prefix for cached API responses, defaults to the datalake path")
+    parser.add_argument(
+        "--no-cache", dest="use_cache", action="store_false",
+        help="Always call the API, bypassing the response cache")
+    parser.add_argument(
+        "--show", dest="show", action="store_true",
+        help="Print the ingested rows, this runs an extra Spark action")
+    parser.add_argument(
+        "--backend", dest="backend", choices=["auto", "spark", "local"], default="auto",
+        help="Execution backend, auto uses the local (pandas) writer for small batches")
+    parser.add_argument(
+        "--local-max-rows", dest="local_max_rows", type=int, default=LOCAL_BACKEND_MAX_ROWS,
+        help="Largest batch the auto backend writes without Spark")
+    parser.add_argument(
+        "--ingestion-mode", dest="ingestion_mode", choices=["direct", "parquet"], default="direct",
+        help="direct writes BigQuery and gzip JSON separately, parquet stages one zstd "
+             "Parquet file in GCS and loads BigQuery from it")
+    parser.add_argument(
+        "--write-mode", dest="write_mode", choices=["append", "upsert"], default="append",
+        help="upsert stages the batch and merges it on (fecha, moneda) so reruns never duplicate rows")
+    parser.add_argument(
+        "--warehouse", dest="warehouse",
+        help="sqlite://<directory> loads a local SQLite stand-in instead of BigQuery")
+    parser.add_argument(
+        "--rejected-table", dest="rejected_table", default="tb_currency_rejected",
+        help="raw_sales table receiving the rows that fail the ingestion rules")
+    parser.add_argument(
+        "--control-table", dest="control_table", default="tb_currency_cc",
+        help="raw_sales table receiving the per fecha/moneda row counts of each load")
+    parser.add_argument(
+        "--no-control-counts", dest="control_counts", action="store_false",
+        help="Skip recording the control counts")
+    parser.add_argument(
+        "--no-rules", dest="apply_rules", action="store_false",
+        help="Load every row as accepted, skipping the ingestion rules")
+    parser.add_argument(
+        "--layout", dest="layout", choices=["flat", "partitioned"], default="flat",
+        help="partitioned loads raw_sales.tb_currency_daily (DATE partitioned, clustered by moneda) "
+             "and writes dt=YYYY-MM-DD object paths")
+    parser.add_argument(
+        "--state-path", dest="state_path",
+        help="Local directory or gs:// prefix of the loaded-dates manifests, defaults to "
+             "<datalake-path>/state")
+    parser.add_argument(
+        "--force", dest="force", action="store_true",
+        help="Load every requested date, even the ones the manifest lists as loaded")
+    parser.add_argument(
+        "--schemas-path", dest="schemas_path",
+        help="Directory or gs:// prefix of the CREATE TABLE files the DataFrame schemas come from, "
+             "defaults to the repository schemas/ or the uploaded resources/bigquery copy")
+    parser.add_argument(
+        "--target-file-mb", dest="target_file_mb", type=int,
+        help="Compact each flat output into objects of about this size, properly named and "
+             "listed in a <path>.manifest.json, instead of a directory of part files")
+    parser.add_argument(
+        "--datalake-path", dest="datalake_path",
+        help="Root for the ingested files, defaults to gs://<project>-datalake (a local "
+             "directory stands in for GCS)")
+    parser.add_argument(
+        "--metrics-path", dest="metrics_path",
+        help="Local directory the run's JSON metrics record is written to, defaults to ./metrics")
+    parser.add_argument(
+        "--metrics-uri", dest="metrics_uri",
+        help="gs:// prefix the metrics record is also uploaded to, to compare runs over time")
+    parser.add_argument(
+        "--config", dest="config",
+        help="YAML file of feeds (endpoint -> dataset.table) loaded together in one SparkSession")
+    parser.add_argument(
+        "--landing-path", dest="landing_path",
+        help="Local directory or gs:// prefix of landed rate payloads, runs the job in streaming mode")
+    parser.add_argument(
+        "--checkpoint-path", dest="checkpoint_path",
+        help="Streaming checkpoint location, defaults to <datalake-path>/checkpoints/<table>")
+    parser.add_argument(
+        "--trigger-seconds", dest="trigger_seconds", type=int, default=STREAM_TRIGGER_SECONDS,
+        help="Streaming micro-batch interval")
+    parser.add_argument(
+        "--max-files-per-trigger", dest="max_files_per_trigger", type=int,
+        default=STREAM_MAX_FILES_PER_TRIGGER,
+        help="Most landed files read by one micro-batch")
+    parser.add_argument(
+        "--available-now", dest="available_now", action="store_true",
+        help="Process the files already landed and stop instead of streaming continuously")
+    parser.add_argument(
+        "--max-workers", dest="max_workers", type=int, default=HTTP_MAX_WORKERS,
+        help="Maximum number of concurrent API requests")
+    args = parser.parse_args()
+    if args.config:
+        # Every feed of the config sets these itself, a flag would be ignored.
+        options = {action.dest: action.option_strings[0] for action in parser._actions
+                   if action.option_strings}
+        ignored = [options[dest] for dest in CONFIG_IGNORED_ARGS
+                   if getattr(args, dest) != parser.get_default(dest)]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} can not be combined with --config, "
+                         f"set them on the feeds of {args.config} instead")
+    if bool(args.start_date) != bool(args.end_date):
+        parser.error("--start-date and --end-date must be given together")
+    if not args.process_date and not args.start_date and not args.landing_path:
+        parser.error("either process_date, --start-date/--end-date or --landing-path is required")
+    return vars(args)
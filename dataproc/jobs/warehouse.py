@@ -0,0 +1,226 @@
+import io
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import utils
+
+class BigQueryWarehouse:
+    """
+    Load, staging and MERGE operations against BigQuery tables of one project.
+    """
+    name = "bigquery"
+
+    def __init__(self, project):
+        self.project = project
+
+    def table_path(self, dataset, table):
+        return f'{self.project}.{dataset}.{table}'
+
+    def _job_config(self, source_format, write_disposition):
+        from google.cloud import bigquery
+        return bigquery.LoadJobConfig(source_format=source_format,
+                                      write_disposition=write_disposition)
+
+    def load_json(self, payload, dataset, table, write_disposition="WRITE_APPEND"):
+        # Load job from newline delimited JSON bytes, the Spark-free
+        # counterpart of utils._load_bigquery.
+        job = utils._get_bigquery_client(self.project).load_table_from_file(
+            io.BytesIO(payload), self.table_path(dataset, table),
+            job_config=self._job_config("NEWLINE_DELIMITED_JSON", write_disposition))
+        job.result()
+        return job.output_rows
+
+    def load_files(self, uris, dataset, table, source_format="PARQUET",
+                   write_disposition="WRITE_APPEND"):
+        # gs:// uris (wildcards allowed) go in one load job, local files are
+        # uploaded one load job each.
+        client = utils._get_bigquery_client(self.project)
+        job_config = self._job_config(source_format, write_disposition)
+        table_path = self.table_path(dataset, table)
+        gcs_uris = [uri for uri in uris if uri.startswith('gs://')]
+        jobs = []
+        if gcs_uris:
+            jobs.append(client.load_table_from_uri(gcs_uris, table_path, job_config=job_config))
+        for uri in uris:
+            if not uri.startswith('gs://'):
+                with open(uri, 'rb') as f:
+                    jobs.append(client.load_table_from_file(f, table_path, job_config=job_config))
+        rows = 0
+        for job in jobs:
+            job.result()
+            rows += job.output_rows or 0
+        return rows
+
+    def query(self, sql):
+        return list(utils._get_bigquery_client(self.project).query(sql).result())
+
+    def create_staging(self, dataset, table):
+        # Empty copy of the target schema that BigQuery drops by itself if the
+        # job dies before cleaning it up.
+        staging = f'{table}_staging_{uuid.uuid4().hex[:8]}'
+        self.query(f"CREATE TABLE `{self.table_path(dataset, staging)}` "
+                   f"LIKE `{self.table_path(dataset, table)}` "
+                   f"OPTIONS(expiration_timestamp=TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 1 DAY))")
+        return staging
+
+    def drop(self, dataset, table):
+        self.query(f"DROP TABLE IF EXISTS `{self.table_path(dataset, table)}`")
+
+    def columns(self, dataset, table):
+        table_ref = utils._get_bigquery_client(self.project).get_table(self.table_path(dataset, table))
+        return [field.name for field in table_ref.schema]
+
+    def merge(self, dataset, staging, table, keys, order_by="process_datetime"):
+        """
+        Upserts the staging rows into table keyed on keys. When the staging
+        table holds the same key more than once the row with the latest
+        order_by wins, so a rerun never duplicates a key.
+        """
+        columns = self.columns(dataset, table)
+        on = " AND ".join(f"T.{key} = S.{key}" for key in keys)
+        update = ", ".join(f"{column} = S.{column}" for column in columns if column not in keys)
+        insert = ", ".join(columns)
+        values = ", ".join(f"S.{column}" for column in columns)
+        self.query(f"""
+            MERGE `{self.table_path(dataset, table)}` T
+            USING (
+                SELECT * FROM `{self.table_path(dataset, staging)}` WHERE TRUE
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY {", ".join(keys)} ORDER BY {order_by} DESC) = 1
+            ) S
+            ON {on}
+            WHEN MATCHED THEN UPDATE SET {update}
+            WHEN NOT MATCHED THEN INSERT ({insert}) VALUES ({values})
+        """)
+
+    def insert_missing(self, dataset, staging, table, keys):
+        """
+        Appends the staging rows whose keys table does not hold yet. Unlike
+        merge, rows sharing a key within staging are all kept; loading the
+        same staging rows again inserts nothing.
+        """
+        columns = ", ".join(self.columns(dataset, table))
+        missing = " AND ".join(f"T.{key} = S.{key}" for key in keys)
+        self.query(f"""
+            INSERT INTO `{self.table_path(dataset, table)}` ({columns})
+            SELECT {columns} FROM `{self.table_path(dataset, staging)}` S
+            WHERE NOT EXISTS (SELECT 1 FROM `{self.table_path(dataset, table)}` T WHERE {missing})
+        """)
+
+class SqliteWarehouse:
+    """
+    Local stand-in for BigQueryWarehouse. Each dataset is an attached SQLite
+    database so the same dataset.table names work, in memory by default or as
+    <directory>/<dataset>.db files.
+    """
+    name = "sqlite"
+
+    def __init__(self, directory=None, project="local"):
+        self.project = project
+        self.directory = directory
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._datasets = set()
+        self._lock = threading.Lock()
+
+    def table_path(self, dataset, table):
+        return f'{dataset}.{table}'
+
+    def attach(self, dataset):
+        with self._lock:
+            if dataset not in self._datasets:
+                database = ":memory:"
+                if self.directory:
+                    os.makedirs(self.directory, exist_ok=True)
+                    database = os.path.join(self.directory, f'{dataset}.db')
+                self.connection.execute(f"ATTACH DATABASE ? AS {dataset}", (database,))
+                self._datasets.add(dataset)
+
+    def query(self, sql, parameters=()):
+        # Datasets referenced by sql must have been attached first, the
+        # methods below attach the ones they use.
+        with self._lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+            self.connection.commit()
+        return rows
+
+    def execute_script(self, dataset, sql):
+        self.attach(dataset)
+        with self._lock:
+            self.connection.executescript(sql)
+
+    def columns(self, dataset, table):
+        self.attach(dataset)
+        return [row[1] for row in self.query(f"PRAGMA {dataset}.table_info({table})")]
+
+    def insert_records(self, records, dataset, table, write_disposition="WRITE_APPEND"):
+        if not records:
+            return 0
+        columns = self.columns(dataset, table)
+        if not columns:
+            columns = list(records[0])
+            self.query(f"CREATE TABLE {dataset}.{table} ({', '.join(columns)})")
+        elif write_disposition == "WRITE_TRUNCATE":
+            self.query(f"DELETE FROM {dataset}.{table}")
+        placeholders = ", ".join("?" for _ in columns)
+        with self._lock:
+            self.connection.executemany(
+                f"INSERT INTO {dataset}.{table} ({', '.join(columns)}) VALUES ({placeholders})",
+                [tuple(record.get(column) for column in columns) for record in records])
+            self.connection.commit()
+        return len(records)
+
+    def load_json(self, payload, dataset, table, write_disposition="WRITE_APPEND"):
+        records = [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+        return self.insert_records(records, dataset, table, write_disposition)
+
+    def load_files(self, uris, dataset, table, source_format="PARQUET",
+                   write_disposition="WRITE_APPEND"):
+        import glob
+        import pyarrow.parquet as pq
+        paths = [path for uri in uris for path in sorted(glob.glob(uri))]
+        records = [record for path in paths for record in pq.read_table(path).to_pylist()]
+        return self.insert_records(records, dataset, table, write_disposition)
+
+    def create_staging(self, dataset, table):
+        # Without a target table yet the staging table takes its columns from
+        # the first load.
+        staging = f'{table}_staging_{uuid.uuid4().hex[:8]}'
+        if self.columns(dataset, table):
+            self.query(f"CREATE TABLE {dataset}.{staging} AS SELECT * FROM {dataset}.{table} WHERE 0")
+        return staging
+
+    def drop(self, dataset, table):
+        self.attach(dataset)
+        self.query(f"DROP TABLE IF EXISTS {dataset}.{table}")
+
+    def merge(self, dataset, staging, table, keys, order_by="process_datetime"):
+        # SQLite has no MERGE: the same upsert as an UPDATE ... FROM followed
+        # by an INSERT of the keys that are still missing.
+        if not self.columns(dataset, table):
+            self.query(f"CREATE TABLE {dataset}.{table} AS SELECT * FROM {dataset}.{staging} WHERE 0")
+        columns = self.columns(dataset, table)
+        latest = (f"(SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY {', '.join(keys)} "
+                  f"ORDER BY {order_by} DESC) AS rn FROM {dataset}.{staging}) WHERE rn = 1)")
+        on = " AND ".join(f"{table}.{key} = S.{key}" for key in keys)
+        update = ", ".join(f"{column} = S.{column}" for column in columns if column not in keys)
+        missing = " AND ".join(f"T.{key} = S.{key}" for key in keys)
+        self.query(f"UPDATE {dataset}.{table} SET {update} FROM {latest} AS S WHERE {on}")
+        self.query(f"INSERT INTO {dataset}.{table} ({', '.join(columns)}) "
+                   f"SELECT {', '.join(f'S.{column}' for column in columns)} FROM {latest} AS S "
+                   f"WHERE NOT EXISTS (SELECT 1 FROM {dataset}.{table} T WHERE {missing})")
+
+    def insert_missing(self, dataset, staging, table, keys):
+        if not self.columns(dataset, table):
+            self.query(f"CREATE TABLE {dataset}.{table} AS SELECT * FROM {dataset}.{staging} WHERE 0")
+        columns = ", ".join(self.columns(dataset, table))
+        missing = " AND ".join(f"T.{key} = S.{key}" for key in keys)
+        self.query(f"INSERT INTO {dataset}.{table} ({columns}) SELECT {columns} FROM {dataset}.{staging} S "
+                   f"WHERE NOT EXISTS (SELECT 1 FROM {dataset}.{table} T WHERE {missing})")
+
+def _get_warehouse(project, uri=None):
+    # uri "sqlite://<directory>" (or "sqlite://" for in memory) selects the
+    # local stand-in, anything else is BigQuery.
+    if uri and uri.startswith("sqlite://"):
+        return SqliteWarehouse(uri[len("sqlite://"):] or None, project=project)
+    return BigQueryWarehouse(project)
@@ -0,0 +1,162 @@
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+import emulator
+import utils
+
+job = importlib.import_module('01_ingest_currency')
+
+# Phases reported as their own columns, in the order the job runs them.
+REPORTED_PHASES = ("fetch", "dataframe", "bigquery_write", "gcs_write", "bigquery_load", "merge",
+                   "control_counts")
+
+def _date_range(days, end_date):
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return (end - timedelta(days=days - 1)).strftime('%Y-%m-%d'), end_date
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+def run_case(root, url, days, end_date, repeat, warm=False, **job_kwargs):
+    """
+    Runs run_job repeat times over the days up to end_date and returns the
+    latency and throughput summary. Every run starts from an empty datalake
+    and warehouse (nothing cached or already loaded) unless warm, then only
+    the first one does and the others read the response cache.
+    """
+    start_date, end_date = _date_range(days, end_date)
+    latencies, phases, rows = [], {}, 0
+    environment = emulator.LocalEnvironment(os.path.join(root, f'{days}d'))
+    for attempt in range(repeat):
+        if attempt == 0 or not warm:
+            shutil.rmtree(environment.root, ignore_errors=True)
+        started = time.perf_counter()
+        job.run_job('local', start_date=start_date, end_date=end_date, api_url=url,
+                    force=True, **environment.job_kwargs(), **job_kwargs)
+        latencies.append(time.perf_counter() - started)
+        record = json.loads(open(max(glob.glob(f'{environment.metrics_path}/*.json'),
+                                     key=os.path.getmtime)).read())
+        rows = record["counters"].get("rows_written", 0)
+        for name, entry in record["phases"].items():
+            phases.setdefault(name, []).append(entry["wall_s"])
+    return {
+        "days": days,
+        "runs": repeat,
+        "rows": rows,
+        "latency_p50_s": statistics.median(latencies),
+        "latency_p95_s": _percentile(latencies, 95),
+        "latency_min_s": min(latencies),
+        "latency_max_s": max(latencies),
+        "rows_per_s": rows / statistics.median(latencies),
+        "phases_p50_s": {name: statistics.median(values) for name, values in phases.items()},
+    }
+
+def run_fetch_case(server, days, end_date, repeat, max_workers):
+    """
+    Times only the API calls of the days up to end_date (no cache, nothing
+    written) against the stub server and returns the requests per second the
+    pooled, bounded fetch sustains with max_workers.
+    """
+    start_date, end_date = _date_range(days, end_date)
+    process_dates = utils._date_range(start_date, end_date)
+    latencies = []
+    requests = server.requests
+    for _ in range(repeat):
+        started = time.perf_counter()
+        utils._get_currencies_by_date(process_dates, server.url, max_workers=max_workers)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "days": days,
+        "runs": repeat,
+        "max_workers": max_workers,
+        # Retried 503s are requests too.
+        "requests": (server.requests - requests) / repeat,
+        "latency_p50_s": statistics.median(latencies),
+        "latency_p95_s": _percentile(latencies, 95),
+        "requests_per_s": (server.requests - requests) / sum(latencies),
+    }
+
+def _print_fetch_report(results):
+    header = ["days", "workers", "requests", "p50 s", "p95 s", "requests/s"]
+    print(" ".join(f'{column:>14}' for column in header))
+    for result in results:
+        values = [result["days"], result["max_workers"], f'{result["requests"]:.0f}',
+                  f'{result["latency_p50_s"]:.4f}', f'{result["latency_p95_s"]:.4f}',
+                  f'{result["requests_per_s"]:.1f}']
+        print(" ".join(f'{value:>14}' for value in values))
+
+def _print_report(results):
+    header = ["days", "rows", "p50 s", "p95 s", "rows/s"] + list(REPORTED_PHASES)
+    print(" ".join(f'{column:>14}' for column in header))
+    for result in results:
+        values = [result["days"], result["rows"], f'{result["latency_p50_s"]:.4f}',
+                  f'{result["latency_p95_s"]:.4f}', f'{result["rows_per_s"]:.1f}']
+        values += [f'{result["phases_p50_s"][name]:.4f}' if name in result["phases_p50_s"] else "-"
+                   for name in REPORTED_PHASES]
+        print(" ".join(f'{value:>14}' for value in values))
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Runs run_job end to end against the local emulators (stub rate API, local "
+                    "filesystem for GCS, SQLite for BigQuery) and reports latency and throughput")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 30, 365],
+                        help="Date range sizes to benchmark, each ending at --end-date")
+    parser.add_argument("--end-date", dest="end_date", default="2024-12-31")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per date range")
+    parser.add_argument("--warm", action="store_true",
+                        help="Keep the response cache between the runs of a range")
+    parser.add_argument("--backend", default="local", choices=["auto", "local", "spark"])
+    parser.add_argument("--ingestion-mode", dest="ingestion_mode", default="direct",
+                        choices=["direct", "parquet"])
+    parser.add_argument("--layout", default="flat", choices=["flat", "partitioned"])
+    parser.add_argument("--write-mode", dest="write_mode", default="append", choices=["append", "upsert"])
+    parser.add_argument("--max-workers", dest="max_workers", type=int, default=8)
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=0.0,
+                        help="Delay of every stub API response")
+    parser.add_argument("--failure-rate", dest="failure_rate", type=float, default=0.0,
+                        help="Share of stub API responses that are a retried 503")
+    parser.add_argument("--workdir", help="Directory for the emulated datalake and warehouse, "
+                                          "a temporary one removed afterwards by default")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--fetch-only", dest="fetch_only", action="store_true",
+                        help="Only time the API calls and report requests per second")
+    parser.add_argument("--verbose", action="store_true", help="Keep the job's own logging")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = _parse_args()
+    if not args.verbose:
+        logging.getLogger("dataproc_processor").setLevel(logging.ERROR)
+    root = args.workdir or tempfile.mkdtemp(prefix="ingest_benchmark_")
+    results = []
+    try:
+        with emulator.RateServer(latency=args.latency_ms / 1000, failure_rate=args.failure_rate) as server:
+            for days in args.days:
+                if args.fetch_only:
+                    results.append(run_fetch_case(server, days, args.end_date, args.repeat,
+                                                  args.max_workers))
+                    continue
+                results.append(run_case(root, server.url, days, args.end_date, args.repeat, warm=args.warm,
+                                        backend=args.backend, ingestion_mode=args.ingestion_mode,
+                                        layout=args.layout, write_mode=args.write_mode,
+                                        max_workers=args.max_workers))
+            print(f'{server.requests} stub API requests served')
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    if args.fetch_only:
+        _print_fetch_report(results)
+    else:
+        _print_report(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
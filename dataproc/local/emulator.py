@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The job modules import each other as top-level modules, as they run on
+# Dataproc.
+JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jobs')
+if JOBS_PATH not in sys.path:
+    sys.path.insert(0, JOBS_PATH)
+
+import warehouse
+
+def synthetic_rate(process_date, currency="USD"):
+    """
+    Exchange rate payload shaped like the SUNAT API response. Values are
+    derived from the date, every run and server serve the same rates.
+    """
+    seed = int(hashlib.sha256(f'{currency}{process_date}'.encode("utf-8")).hexdigest()[:8], 16)
+    compra = round(3.5 + (seed % 5000) / 10000, 3)
+    return {"fecha": process_date, "moneda": currency, "compra": compra,
+            "venta": round(compra + 0.002 + (seed % 7) / 1000, 3), "origen": "SUNAT"}
+
+class _RateHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        if server.latency:
+            time.sleep(server.latency)
+        # Left before answering, the client can only reuse its pool slot once
+        # the response is sent.
+        with server.lock:
+            server.in_flight -= 1
+        # Transient failures exercise the job's retries.
+        if server.failure_rate and server.random.random() < server.failure_rate:
+            self._send(503, {"error": "unavailable"})
+            return
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        # The first query parameter is the date, whatever the feed calls it.
+        values = [value[0] for value in query.values()]
+        try:
+            process_date = datetime.strptime(values[0], '%Y-%m-%d').strftime('%Y-%m-%d')
+        except (IndexError, ValueError):
+            self._send(400, {"error": f"invalid date in {self.path}"})
+            return
+        self._send(200, synthetic_rate(process_date, server.currency))
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _RateHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops the connections of a wider fetch
+    # pool, which the client retries after a second: benchmarks would time
+    # the stub's backlog instead of the job.
+    request_queue_size = 128
+    daemon_threads = True
+
+class RateServer:
+    """
+    Local stand-in for the SUNAT exchange rate API on 127.0.0.1, serving
+    synthetic_rate for the date of every request. latency (seconds) delays
+    each response and failure_rate answers that share of the requests with a
+    503.
+    """
+    def __init__(self, port=0, latency=0.0, failure_rate=0.0, currency="USD", seed=0):
+        self.server = _RateHTTPServer(("127.0.0.1", port), _RateHandler)
+        self.server.latency = latency
+        self.server.failure_rate = failure_rate
+        self.server.currency = currency
+        self.server.random = random.Random(seed)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1/tipo-cambio-sunat'
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def max_in_flight(self):
+        # Most requests served at the same time, bounded by the client's pool
+        return self.server.max_in_flight
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class LocalEnvironment:
+    """
+    Directory layout standing in for the cloud resources of a run_job call:
+    <root>/datalake for the gs://<project>-datalake paths (the storage
+    helpers write local paths to disk) and <root>/warehouse for the SQLite
+    databases replacing the BigQuery datasets.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.datalake_path = os.path.join(root, 'datalake')
+        self.warehouse_path = os.path.join(root, 'warehouse')
+        self.metrics_path = os.path.join(root, 'metrics')
+
+    @property
+    def warehouse_uri(self):
+        return f'sqlite://{self.warehouse_path}'
+
+    def job_kwargs(self):
+        # Keyword arguments pointing run_job at this environment.
+        return {"datalake_path": self.datalake_path, "warehouse_uri": self.warehouse_uri,
+                "metrics_path": self.metrics_path}
+
+    def row_count(self, dataset, table):
+        sink = warehouse.SqliteWarehouse(self.warehouse_path)
+        sink.attach(dataset)
+        return sink.query(f'SELECT COUNT(*) FROM {dataset}.{table}')[0][0]
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Serves synthetic exchange rates until interrupted")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", dest="failure_rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = RateServer(args.port, args.latency_ms / 1000, args.failure_rate)
+    print(f'serving {server.url}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
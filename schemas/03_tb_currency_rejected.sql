@@ -5,5 +5,6 @@ CREATE TABLE IF NOT EXISTS raw_sales.tb_currency_rejected(
     venta FLOAT64,
     origen STRING,
     process_datetime STRING,
-    mensaje_rejected STRING
+    mensaje_rejected STRING,
+    raw_record STRING
 )
\ No newline at end of file
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS raw_sales.tb_currency_daily(
+    fecha DATE,
+    moneda STRING,
+    compra FLOAT64,
+    venta FLOAT64,
+    origen STRING,
+    process_datetime TIMESTAMP
+)
+PARTITION BY fecha
+CLUSTER BY moneda
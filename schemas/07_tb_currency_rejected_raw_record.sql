@@ -0,0 +1 @@
+ALTER TABLE raw_sales.tb_currency_rejected ADD COLUMN IF NOT EXISTS raw_record STRING
\ No newline at end of file
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def _prepend(monkeypatch, directory):
+    # dataproc/jobs and data_quality_tests both have a top-level utils
+    # module, the one cached from the other directory is hidden until the
+    # test ends.
+    path = os.path.join(ROOT, directory)
+    monkeypatch.syspath_prepend(path)
+    cached = sys.modules.get("utils")
+    if cached is not None and os.path.dirname(os.path.abspath(cached.__file__)) != path:
+        monkeypatch.delitem(sys.modules, "utils")
+
+@pytest.fixture
+def jobs_path(monkeypatch):
+    _prepend(monkeypatch, os.path.join('dataproc', 'jobs'))
+
+@pytest.fixture
+def data_quality_path(monkeypatch):
+    _prepend(monkeypatch, 'data_quality_tests')
+
+@pytest.fixture
+def local_path(jobs_path, monkeypatch):
+    # The local emulator and benchmark, next to the job modules they import
+    _prepend(monkeypatch, os.path.join('dataproc', 'local'))
@@ -0,0 +1,123 @@
+import json
+import pytest
+
+pytestmark = pytest.mark.usefixtures("jobs_path")
+
+pytest.importorskip("pandas")
+
+KEYS = ("fecha", "moneda")
+RECORDS = [
+    {"fecha": "2024-01-02", "moneda": "USD", "compra": 3.7, "venta": 3.8,
+     "origen": "SUNAT", "process_datetime": "2024-01-02 10:00:00"},
+    {"fecha": "2024-01-02", "moneda": "EUR", "compra": "abc", "venta": 4.1,
+     "origen": "SUNAT", "process_datetime": "2024-01-02 10:00:00"},
+]
+
+def _write(tmp_path, records=RECORDS, backend="local", sink=None, write_mode="append"):
+    import backends
+    import rules
+    import schema_registry
+    import warehouse
+    sink = sink or warehouse.SqliteWarehouse()
+    schema = schema_registry._get_registry().get("raw_sales.tb_currency")
+    written = backends._select_backend(backend, len(records), sink).write(
+        records, "raw_sales", "tb_currency", str(tmp_path / "out"), ingestion_mode="parquet",
+        write_mode=write_mode, keys=KEYS, rules=rules.CURRENCY_RULES,
+        rejected_table="tb_currency_rejected", count_by=KEYS, schema=schema)
+    return sink, written
+
+def test_rejected_rows_keep_raw_record(tmp_path):
+    sink, written = _write(tmp_path)
+    assert (written["rows"], written["rejected"]) == (1, 1)
+    columns = sink.columns("raw_sales", "tb_currency_rejected")
+    [row] = [dict(zip(columns, row)) for row in sink.query("SELECT * FROM raw_sales.tb_currency_rejected")]
+    # The FLOAT64 column can not hold "abc", the raw record keeps it.
+    assert row["compra"] is None
+    assert row["mensaje_rejected"].startswith("compra nula o no positiva")
+    assert json.loads(row["raw_record"])["compra"] == "abc"
+
+def test_backends_write_the_same_rejected_rows(tmp_path):
+    pytest.importorskip("pyspark")
+    query = "SELECT * FROM raw_sales.tb_currency_rejected"
+    local_sink, local_written = _write(tmp_path / "local")
+    spark_sink, spark_written = _write(tmp_path / "spark", backend="spark")
+    assert spark_sink.query(query) == local_sink.query(query)
+    assert spark_written["counts"] == local_written["counts"]
+
+def test_upsert_rerun_replaces_control_counts(tmp_path):
+    import backends
+    import warehouse
+    sink = warehouse.SqliteWarehouse()
+    for run in range(2):
+        _, written = _write(tmp_path / str(run), RECORDS[:1], sink=sink, write_mode="upsert")
+        backends._load_control_counts(sink, written["counts"], KEYS, "raw_sales", "tb_currency_cc",
+                                      f"2024-01-02 1{run}:00:00", "upsert")
+    assert sink.query("SELECT COUNT(*) FROM raw_sales.tb_currency") == [(1,)]
+    assert sink.query("SELECT fecha, moneda, total_reg, process_datetime FROM raw_sales.tb_currency_cc") == [
+        ("2024-01-02", "USD", 1.0, "2024-01-02 11:00:00")]
+
+def test_upsert_rerun_keeps_rejected_rows_once(tmp_path):
+    sink = None
+    for run in range(2):
+        # A rerun stamps the same payload with a new process_datetime
+        records = [dict(record, process_datetime=f"2024-01-02 1{run}:00:00") for record in RECORDS]
+        sink, written = _write(tmp_path / str(run), records, sink=sink, write_mode="upsert")
+        assert written["rejected"] == 1
+    assert sink.query("SELECT COUNT(*) FROM raw_sales.tb_currency_rejected") == [(1,)]
+    assert sink.query("SELECT COUNT(*) FROM raw_sales.tb_currency") == [(1,)]
+
+def test_insert_missing_loads_a_replayed_batch_once():
+    import warehouse
+    sink = warehouse.SqliteWarehouse()
+    rows = [{"raw_record": '{"compra": "abc"}', "mensaje_rejected": "compra nula o no positiva"}] * 2
+    for _ in range(2):
+        sink.insert_records(rows, "raw_sales", "staging")
+        sink.insert_missing("raw_sales", "staging", "rejected", ("raw_record",))
+        sink.drop("raw_sales", "staging")
+    # Both rows of the first load are kept, the replay adds none.
+    assert sink.query("SELECT COUNT(*) FROM raw_sales.rejected") == [(2,)]
+
+def test_parquet_uris_of_unknown_partitions():
+    import backends
+    assert backends._parquet_uris("gs://b/t") == ["gs://b/t/*.parquet"]
+    assert backends._parquet_uris("gs://b/t", partitioned=True) == ["gs://b/t/dt=*"]
+    assert backends._parquet_uris("gs://b/t", {"2024-01-02"}, partitioned=True) == [
+        "gs://b/t/dt=2024-01-02/*.parquet"]
+
+class _SparkBackend:
+    name = "spark"
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+
+@pytest.mark.parametrize("name, n_rows, expected", [
+    ("auto", 10, "local"), ("auto", 11, "spark"), ("local", 11, "local"), ("spark", 10, "spark")])
+def test_select_backend_by_row_threshold(monkeypatch, name, n_rows, expected):
+    import backends
+    # No JVM is started to pick the Spark backend
+    monkeypatch.setattr(backends, "SparkBackend", _SparkBackend)
+    backend = backends._select_backend(name, n_rows, None, local_max_rows=10)
+    assert backend.name == expected
+
+def test_select_backend_rejects_unknown_names():
+    import backends
+    with pytest.raises(ValueError):
+        backends._select_backend("dask", 10, None)
+
+def test_parquet_write_loads_only_its_own_part_files(tmp_path):
+    import backends
+    import warehouse
+    pq = pytest.importorskip("pyarrow.parquet")
+    sink = warehouse.SqliteWarehouse()
+    loads = []
+    load_files = sink.load_files
+    sink.load_files = lambda uris, *args, **kwargs: loads.append(uris) or load_files(uris, *args, **kwargs)
+    backend = backends.LocalBackend(sink)
+    for day in ("2024-01-02", "2024-01-03"):
+        backend.write([dict(RECORDS[0], fecha=day)], "raw_sales", "tb_currency", str(tmp_path / "out"),
+                      ingestion_mode="parquet", partition_by="fecha")
+    # The second load leaves the partition of the first day out
+    assert loads[-1] == [str(tmp_path / "out" / "dt=2024-01-03" / "part-00000-c000.zstd.parquet")]
+    assert pq.read_metadata(loads[-1][0]).row_group(0).column(0).compression == "ZSTD"
+    assert sink.query("SELECT fecha FROM raw_sales.tb_currency ORDER BY fecha") == [
+        ("2024-01-02",), ("2024-01-03",)]
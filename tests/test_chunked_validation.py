@@ -0,0 +1,87 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pd = pytest.importorskip("pandas")
+
+def _config(kind, meta=None, **kwargs):
+    return {"type": kind, "kwargs": kwargs, "meta": meta or {}}
+
+def test_unsupported_expectation_is_rejected():
+    from chunked_validation import ChunkedValidator
+    with pytest.raises(ValueError, match="expect_column_values_to_be_of_type"):
+        ChunkedValidator([_config("expect_table_row_count_to_equal", value=3),
+                          _config("expect_column_values_to_be_of_type", column="compra", type_="float64")],
+                         "currency")
+
+def _validate(configs, df, chunk_size=None, exact=False):
+    from chunked_validation import ChunkedValidator
+    chunks = [df] if chunk_size is None else [df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
+    return ChunkedValidator(configs, "suite", exact=exact).validate(chunks, list(df.columns))["results"]
+
+def _unexpected(configs, df):
+    # Unexpected counts, the same whole and in chunks of two rows
+    whole, chunked = _validate(configs, df), _validate(configs, df, chunk_size=2)
+    assert [entry["result"] for entry in whole] == [entry["result"] for entry in chunked]
+    return [entry["result"]["unexpected_count"] for entry in whole]
+
+def test_regex_and_like_patterns():
+    df = pd.DataFrame({"moneda": ["USD", "EUR", "usd", None]})
+    configs = [
+        _config("expect_column_values_to_match_regex", column="moneda", regex="^[A-Z]{3}$"),
+        _config("expect_column_values_to_not_match_regex", column="moneda", regex="^U"),
+        _config("expect_column_values_to_match_regex_list", column="moneda", regex_list=["^U", "^E"]),
+        _config("expect_column_values_to_match_regex_list", column="moneda", regex_list=["^U", "D$"],
+                match_on="all"),
+        _config("expect_column_values_to_match_like_pattern", column="moneda", like_pattern="U%"),
+        _config("expect_column_values_to_not_match_like_pattern_list", column="moneda",
+                like_pattern_list=["_S_", "E%"]),
+    ]
+    assert _unexpected(configs, df) == [1, 1, 1, 2, 2, 2]
+
+def test_value_lengths():
+    df = pd.DataFrame({"moneda": ["USD", "EURO", None, "S"]})
+    configs = [_config("expect_column_value_lengths_to_equal", column="moneda", value=3),
+               _config("expect_column_value_lengths_to_be_between", column="moneda", min_value=2, max_value=3)]
+    assert _unexpected(configs, df) == [2, 2]
+
+def test_compound_and_within_record_uniqueness():
+    df = pd.DataFrame({"a": ["x", "x", "y", None], "b": [1, 1, 1, 2], "c": [2, 3, 1, None]})
+    configs = [_config("expect_compound_columns_to_be_unique", column_list=["a", "b"]),
+               _config("expect_select_column_values_to_be_unique_within_record", column_list=["a", "b", "c"])]
+    # The two (x, 1) rows; (y, 1, 1) and (None, 2, None) repeat a value
+    assert _unexpected(configs, df) == [2, 2]
+
+def test_pair_equality_and_multicolumn_sum():
+    df = pd.DataFrame({"a": [1, 2, None, None], "b": [1, 3, None, 4]})
+    configs = [_config("expect_column_pair_values_to_be_equal", column_A="a", column_B="b"),
+               _config("expect_multicolumn_sum_to_equal", column_list=["a", "b"], sum_total=2)]
+    results = _validate(configs, df)
+    # Rows missing both values are ignored, a single missing value is unexpected
+    assert [entry["result"]["missing_count"] for entry in results] == [1, 1]
+    assert _unexpected(configs, df) == [2, 2]
+
+def test_exact_median_and_quantiles_match_pandas():
+    values = pd.Series([5, 1, 4, 2, 100, 3, 8, 7])
+    configs = [_config("expect_column_median_to_be_between", column="x", min_value=0, max_value=10),
+               _config("expect_column_quantile_values_to_be_between", column="x",
+                       quantile_ranges={"quantiles": [0.1, 0.5, 0.95], "value_ranges": [[0, 10]] * 3}),
+               _config("expect_column_quantile_values_to_be_between", column="x", allow_relative_error="linear",
+                       quantile_ranges={"quantiles": [0.5], "value_ranges": [[0, 10]]})]
+    median, nearest, linear = _validate(configs, pd.DataFrame({"x": values}), exact=True)
+    assert median["result"] == {"observed_value": values.median()} == {"observed_value": 4.5}
+    assert nearest["result"]["observed_value"]["values"] == values.quantile(
+        [0.1, 0.5, 0.95], interpolation="nearest").tolist()
+    assert not nearest["success"] and nearest["result"]["details"]["success_details"] == [True, True, False]
+    assert linear["result"]["observed_value"]["values"] == [4.5]
+
+@pytest.mark.parametrize("allow_relative_error, rank_error", [
+    (0.005, 0.005), ("0.005", 0.005), (0, None), ("nearest", None)])
+def test_quantile_rank_error_given_as_any_number(allow_relative_error, rank_error):
+    from chunked_validation import ChunkedValidator
+    from sketches import KLLSketch
+    config = _config("expect_column_median_to_be_between", column="x", min_value=0,
+                     allow_relative_error=allow_relative_error)
+    [state] = ChunkedValidator([config], "suite").new_states(["x"])
+    expected = KLLSketch.k_for_rank_error(rank_error) if rank_error else KLLSketch().k
+    assert state.sketch.k == expected
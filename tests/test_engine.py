@@ -0,0 +1,85 @@
+import sys
+import pytest
+
+pytestmark = pytest.mark.usefixtures("local_path")
+
+pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+yaml = pytest.importorskip("yaml")
+
+DATES = ["2024-01-02", "2024-01-03", "2024-01-04"]
+
+def _feeds(url):
+    return [
+        {"name": "tipo-cambio-sunat", "url": url, "table": "tb_currency",
+         "schema": "raw_sales.tb_currency", "keys": ["fecha", "moneda"], "rules": "currency",
+         "rejected_table": "tb_currency_rejected", "control_table": "tb_currency_cc"},
+        {"name": "tipo-cambio-sunat-diario", "url": url, "table": "tb_currency_daily",
+         "schema": "raw_sales.tb_currency", "keys": ["fecha", "moneda"], "partition_by": "fecha",
+         "column_types": {"fecha": "date", "process_datetime": "timestamp"},
+         "ingestion_mode": "parquet", "write_mode": "upsert"},
+    ]
+
+def _config(tmp_path, feeds, **settings):
+    path = tmp_path / "feeds.yaml"
+    path.write_text(yaml.safe_dump({"settings": dict({"backend": "local", "use_cache": False}, **settings),
+                                    "feeds": feeds}))
+    return str(path)
+
+def test_load_config_applies_defaults(tmp_path):
+    import engine
+    settings, feeds = engine._load_config(_config(tmp_path, _feeds("http://stub")))
+    assert settings["max_concurrent_feeds"] == engine.ENGINE_DEFAULTS["max_concurrent_feeds"]
+    assert settings["backend"] == "local"
+    assert [feed["dataset"] for feed in feeds] == ["raw_sales", "raw_sales"]
+    assert feeds[0]["write_mode"] == "append" and feeds[1]["write_mode"] == "upsert"
+
+@pytest.mark.parametrize("feeds, error", [
+    ([{"name": "a", "url": "http://stub"}], "missing table"),
+    ([{"name": "a", "url": "http://stub", "table": "t", "rules": "unknown"}], "unknown rule set"),
+    ([{"name": "a", "url": "http://stub", "table": "t"}] * 2, "Duplicated feed names"),
+    ([], "No feeds"),
+])
+def test_load_config_rejects_invalid_feeds(tmp_path, feeds, error):
+    import engine
+    with pytest.raises(ValueError, match=error):
+        engine._load_config(_config(tmp_path, feeds))
+
+def test_engine_runs_two_feeds(tmp_path):
+    import engine
+    from emulator import LocalEnvironment, RateServer
+    env = LocalEnvironment(str(tmp_path))
+    with RateServer() as server:
+        config_path = _config(tmp_path, _feeds(server.url))
+        for _ in range(2):
+            engine.run_engine("local", config_path, DATES, **env.job_kwargs())
+        # The second run finds every date in the loaded-dates manifests
+        assert server.requests == 2 * len(DATES)
+    assert env.row_count("raw_sales", "tb_currency") == len(DATES)
+    assert env.row_count("raw_sales", "tb_currency_cc") == len(DATES)
+    assert env.row_count("raw_sales", "tb_currency_daily") == len(DATES)
+
+def test_engine_reloads_with_force_without_duplicating_upserts(tmp_path):
+    import engine
+    from emulator import LocalEnvironment, RateServer
+    env = LocalEnvironment(str(tmp_path))
+    with RateServer() as server:
+        config_path = _config(tmp_path, _feeds(server.url)[1:])
+        for _ in range(2):
+            engine.run_engine("local", config_path, DATES, force=True, **env.job_kwargs())
+    assert env.row_count("raw_sales", "tb_currency_daily") == len(DATES)
+
+@pytest.mark.parametrize("flag", [["--write-mode", "upsert"], ["--api-url", "http://stub"], ["--show"]])
+def test_single_feed_flags_are_rejected_with_config(monkeypatch, capsys, flag):
+    import utils
+    monkeypatch.setattr(sys, "argv", ["01_ingest_currency.py", "2024-01-02", "--config", "feeds.yaml"] + flag)
+    with pytest.raises(SystemExit):
+        utils._parse_args()
+    assert "can not be combined with --config" in capsys.readouterr().err
+
+def test_config_with_shared_flags_is_accepted(monkeypatch):
+    import utils
+    monkeypatch.setattr(sys, "argv", ["01_ingest_currency.py", "2024-01-02", "--config", "feeds.yaml",
+                                      "--backend", "local", "--force"])
+    args = utils._parse_args()
+    assert (args["config"], args["backend"], args["force"]) == ("feeds.yaml", "local", True)
@@ -0,0 +1,33 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("local_path")
+
+pytest.importorskip("requests")
+
+DATES = [f"2024-01-{day:02d}" for day in range(1, 31)]
+
+def test_transient_errors_are_retried_within_the_pool_bound():
+    import utils
+    from emulator import RateServer, synthetic_rate
+    # Eight fetch threads share a session of two connections
+    session = utils._build_session(pool_size=2, retries=10, backoff_factor=0)
+    with RateServer(latency=0.01, failure_rate=0.3, seed=1) as server:
+        try:
+            rates = utils._get_currencies_by_date(DATES, server.url, max_workers=8, session=session)
+        finally:
+            session.close()
+        assert server.requests > len(DATES)
+        assert server.max_in_flight == 2
+    assert rates == [synthetic_rate(date) for date in DATES]
+
+def test_retries_give_up_with_the_last_error():
+    import requests
+    import utils
+    from emulator import RateServer
+    session = utils._build_session(pool_size=1, retries=2, backoff_factor=0)
+    with RateServer(failure_rate=1.0) as server:
+        with pytest.raises(requests.HTTPError):
+            utils._get_currencies_by_date(DATES[:1], server.url, max_workers=1, session=session)
+        session.close()
+        # The first call and its two retries
+        assert server.requests == 3
@@ -0,0 +1,63 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("great_expectations")
+pytest.importorskip("gcsfs")
+
+FILE_CONFIG = {"type": "file"}
+
+def _geutils():
+    import ge_utils
+    return ge_utils.geutils(*[{} for _ in range(9)], None)
+
+def _csv(tmp_path, rows=10):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"id": range(rows), "name": [f"n{i}" for i in range(rows)]}).to_csv(path, index=False)
+    return str(path)
+
+def test_row_count_only_suite_chunked_matches_in_memory(tmp_path):
+    from suite_compiler import build_suite, referenced_columns
+    path = _csv(tmp_path)
+    suite = build_suite("row_count", [
+        {"type": "expect_table_row_count_to_equal", "kwargs": {"value": 10}, "meta": {}}])
+    columns, needs_rows = referenced_columns(suite)
+    assert (columns, needs_rows) == (set(), True)
+    geutils = _geutils()
+    chunked, _ = geutils.run_chunked_validation(FILE_CONFIG, suite, path, columns=columns,
+                                                chunk_size=3, needs_rows=needs_rows)
+    in_memory, _ = geutils.run_native_validation(FILE_CONFIG, suite, path, columns=columns,
+                                                 needs_rows=needs_rows)
+    assert chunked["success"] and in_memory["success"]
+    assert chunked["results"][0]["result"] == in_memory["results"][0]["result"]
+
+def _expectation(type, **kwargs):
+    return {"type": type, "kwargs": kwargs, "meta": {}}
+
+@pytest.mark.parametrize("configs, expected", [
+    ([_expectation("expect_column_values_to_not_be_null", column="id"),
+      _expectation("expect_column_pair_values_to_be_equal", column_A="id", column_B="code"),
+      _expectation("expect_compound_columns_to_be_unique", column_list=["id", "name"])],
+     ({"id", "code", "name"}, True)),
+    ([_expectation("expect_column_to_exist", column="id"),
+      _expectation("expect_table_columns_to_match_set", column_set=["id", "name"])], (set(), False)),
+    ([_expectation("expect_column_to_exist", column="name"),
+      _expectation("expect_column_max_to_be_between", column="id", max_value=20)], ({"id"}, True)),
+    ([_expectation("expect_column_values_to_not_be_null", column="id"),
+      _expectation("expect_table_row_count_to_equal_other_table", other_table_name="t")], ({"id"}, True)),
+])
+def test_referenced_columns(configs, expected):
+    from suite_compiler import build_suite, referenced_columns
+    assert referenced_columns(build_suite("columns", configs)) == expected
+
+def test_read_dataframe_keeps_the_header_of_unread_columns(tmp_path):
+    path = _csv(tmp_path)
+    geutils = _geutils()
+    df = geutils.read_dataframe(FILE_CONFIG, path, columns={"name"})
+    # id is not read, its placeholder holds no data in the header position
+    assert list(df.columns) == ["id", "name"]
+    assert isinstance(df["id"].dtype, pd.SparseDtype) and df["id"].isna().all()
+    assert list(df["name"]) == [f"n{i}" for i in range(10)]
+    header_only = geutils.read_dataframe(FILE_CONFIG, path, columns=set(), needs_rows=False)
+    assert list(header_only.columns) == ["id", "name"] and len(header_only) == 0
@@ -0,0 +1,118 @@
+import glob
+import importlib
+import os
+import pytest
+
+pytestmark = pytest.mark.usefixtures("local_path")
+
+pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+def _job():
+    return importlib.import_module("01_ingest_currency")
+
+def _run(env, server, **kwargs):
+    kwargs = dict({"use_cache": False, "backend": "local"}, **kwargs)
+    return _job().run_job("local", api_url=server.url, **env.job_kwargs(), **kwargs)
+
+@pytest.fixture
+def env(tmp_path):
+    from emulator import LocalEnvironment
+    return LocalEnvironment(str(tmp_path))
+
+@pytest.fixture
+def server():
+    from emulator import RateServer
+    with RateServer() as rate_server:
+        yield rate_server
+
+def test_process_dates_of_a_day_and_a_range():
+    import utils
+    assert utils._process_dates("2024-01-31") == ["2024-01-31"]
+    assert utils._process_dates(start_date="2024-01-30", end_date="2024-02-02") == [
+        "2024-01-30", "2024-01-31", "2024-02-01", "2024-02-02"]
+    assert utils._dates_label(["2024-01-31"]) == "20240131"
+    assert utils._dates_label(["2024-01-30", "2024-02-02"]) == "20240130_20240202"
+    with pytest.raises(ValueError):
+        utils._date_range("2024-02-02", "2024-01-30")
+
+def test_backfill_range_is_loaded_in_a_single_write(env, server):
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-10")
+    assert server.requests == 10
+    assert env.row_count("raw_sales", "tb_currency") == 10
+    assert env.row_count("raw_sales", "tb_currency_cc") == 10
+    # One output directory for the whole range, holding one part file
+    [output] = glob.glob(os.path.join(env.datalake_path, "ingested", "transactions", "json", "*", "*"))
+    assert output.split(os.sep)[-2] == "20240101_20240110"
+    assert len(glob.glob(os.path.join(output, "part-*.json.gz"))) == 1
+
+@pytest.mark.parametrize("write_mode, rows", [("append", 6), ("upsert", 3)])
+def test_forced_rerun_duplicates_only_appends(env, server, write_mode, rows):
+    for _ in range(2):
+        _run(env, server, start_date="2024-01-01", end_date="2024-01-03", write_mode=write_mode, force=True)
+    assert server.requests == 6
+    assert env.row_count("raw_sales", "tb_currency") == rows
+
+def _files(root):
+    return sorted(os.path.relpath(path, root) for path in glob.glob(os.path.join(root, "**", "*"), recursive=True)
+                  if os.path.isfile(path))
+
+@pytest.mark.parametrize("ingestion_mode, part", [
+    ("direct", "part-00000-c000.json.gz"), ("parquet", "part-00000-c000.zstd.parquet")])
+def test_partitioned_layout_writes_one_part_per_day(env, server, ingestion_mode, part):
+    file_format = "parquet" if ingestion_mode == "parquet" else "json"
+    root = os.path.join(env.datalake_path, "ingested", "transactions", file_format, "tb_currency_daily")
+    for _ in range(2):
+        _run(env, server, start_date="2024-01-01", end_date="2024-01-02", layout="partitioned",
+             ingestion_mode=ingestion_mode, write_mode="upsert", force=True)
+    # A rerun replaces each day's part file instead of adding another one
+    assert _files(root) == ["_SUCCESS", os.path.join("dt=2024-01-01", part), os.path.join("dt=2024-01-02", part)]
+    assert env.row_count("raw_sales", "tb_currency_daily") == 2
+
+@pytest.mark.parametrize("ingestion_mode, file_format", [("direct", "json"), ("parquet", "parquet")])
+def test_compacted_output_is_listed_in_its_manifest(env, server, ingestion_mode, file_format):
+    import json
+    import utils
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-03", ingestion_mode=ingestion_mode,
+         target_file_mb=64)
+    [manifest_path] = glob.glob(os.path.join(env.datalake_path, "**", "*.manifest.json"), recursive=True)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    path = manifest_path[:-len(".manifest.json")]
+    assert (manifest["path"], manifest["format"]) == (path, file_format)
+    # A local batch is a single object named after the output path
+    assert manifest["objects"] == [{"path": path, "bytes": os.path.getsize(path)}]
+    assert utils._read_manifest(path) == [path]
+    assert env.row_count("raw_sales", "tb_currency") == 3
+
+def test_loaded_dates_are_skipped_unless_forced(env, server):
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-03")
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-03")
+    assert server.requests == 3
+    # Only the day past the watermark is fetched
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-04")
+    assert server.requests == 4
+    _run(env, server, start_date="2024-01-01", end_date="2024-01-04", force=True)
+    assert server.requests == 8
+    assert env.row_count("raw_sales", "tb_currency") == 8
+
+def _metrics_records(env):
+    import json
+    records = []
+    for path in sorted(glob.glob(os.path.join(env.metrics_path, "01_ingest_currency_*.json"))):
+        with open(path) as f:
+            records.append(json.load(f))
+    return records
+
+def test_metrics_record_of_a_succeeded_and_a_failed_run(env, server):
+    _run(env, server, process_date="2024-01-02")
+    with pytest.raises(ValueError):
+        _run(env, server, process_date="2024-01-02", layout="hourly")
+    succeeded, failed = sorted(_metrics_records(env), key=lambda record: record["status"], reverse=True)
+    assert (succeeded["status"], succeeded["error"]) == ("succeeded", None)
+    assert {"fetch", "gcs_write"} <= set(succeeded["phases"])
+    assert succeeded["params"]["process_date"] == "2024-01-02"
+    # The failed run still emits its record, with the error raised
+    assert failed["status"] == "failed"
+    assert failed["error"] == "ValueError('Not supported layout: hourly')"
+    assert failed["params"]["layout"] == "hourly"
@@ -0,0 +1,124 @@
+import sqlite3
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pytest.importorskip("pandas")
+pytest.importorskip("great_expectations")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("gcsfs")
+pytest.importorskip("ndjson")
+pytest.importorskip("google.cloud.storage")
+
+SUITE = {"expectations": {
+    "missingness_expectations": {"ExpectColumnValuesToNotBeNull": [["moneda", 1]]},
+    "volume": {"ExpectTableRowCountToEqual": [3]}}}
+
+def _config(tmp_path, engine="native"):
+    return {"global": {"engine": engine, "suite_cache_path": str(tmp_path / "suites")},
+            "expectation_suites": {"currency": SUITE}}
+
+def _sqlite_source(tmp_path, tables=("tb_currency",)):
+    path = tmp_path / "source.db"
+    with sqlite3.connect(path) as connection:
+        for table in tables:
+            connection.execute(f"CREATE TABLE {table} (moneda TEXT, compra REAL)")
+            connection.executemany(f"INSERT INTO {table} VALUES (?, ?)",
+                                   [("USD", 3.7), ("EUR", 4.1), ("GBP", 4.8)])
+    return {"type": "db",
+            "credentials": {"database_type": "sqlite", "database": str(path), "schema_database": None},
+            "datasets": [{"table_name": table, "expectations_suite": "currency"} for table in tables]}
+
+def _validate(tmp_path, config, source_config):
+    from CreateExpectations import CreateExpectations
+    from run_validations import run_validation_dataset
+    from utils import Utils
+    return run_validation_dataset(
+        config, source_config, source_config["datasets"][0], Utils(), CreateExpectations(),
+        sources={"database_source": source_config}, project="dq", sub_project="currency",
+        stage="ingesta", path_logs=str(tmp_path / "logs"), data_source_info={}, expectations={},
+        parallelize=True, method="ProcessPoolExecutor")
+
+@pytest.mark.parametrize("engine", ["native", None])
+def test_sqlite_dataset_end_to_end(tmp_path, engine):
+    result = _validate(tmp_path, _config(tmp_path, engine), _sqlite_source(tmp_path))
+    assert result is not False
+    file_name, table = result
+    assert file_name == "tb_currency"
+    assert list(table["SourceName"].unique()) == ["tb_currency"]
+    assert len(table) == 2 and table["Status"].eq(1).all()
+
+def test_unsupported_dialect_falls_back_to_great_expectations(tmp_path, monkeypatch):
+    import sql_compiler
+    monkeypatch.delitem(sql_compiler.DIALECTS, "sqlite")
+    file_name, table = _validate(tmp_path, _config(tmp_path), _sqlite_source(tmp_path))
+    assert file_name == "tb_currency"
+    assert len(table) == 2 and table["Status"].eq(1).all()
+
+@pytest.fixture
+def local_logs(data_quality_path, monkeypatch):
+    # Logs are saved under path_logs instead of GCS
+    from utils import Utils
+    monkeypatch.setattr(Utils, "save_processed_log", Utils.save_processed_log_local)
+
+def _run_parallel(tmp_path, method):
+    from CreateExpectations import CreateExpectations
+    from ge_workers import ValidationWorkerPool
+    from utils import Utils
+    import run_validations
+    sources = {"database_source": _sqlite_source(tmp_path, tables=("tb_currency", "tb_currency_hist"))}
+    args = dict(sources=sources, config=_config(tmp_path), utils=Utils(),
+                create_expectations_instance=CreateExpectations(), project="dq",
+                sub_project="currency", stage="ingesta", path_logs=str(tmp_path / "logs"),
+                data_source_info={}, expectations={}, parallelize=True, method=method)
+    if method == "ThreadPoolExecutor":
+        run_validations.thread_parallel_validation(**args)
+        return
+    with ValidationWorkerPool(processes=2) as pool:
+        results = run_validations.processes_parallel_validation(**args, pool=pool)
+    assert sorted(file_name for file_name, _ in results) == ["tb_currency", "tb_currency_hist"]
+
+@pytest.mark.usefixtures("local_logs")
+@pytest.mark.parametrize("method", ["ThreadPoolExecutor", "ProcessPoolExecutor"])
+def test_parallel_validation_of_two_datasets(tmp_path, method):
+    import pandas as pd
+    _run_parallel(tmp_path, method)
+    logs = pd.read_csv(tmp_path / "logs" / "csv" / "dq_ingesta")
+    assert sorted(logs["SourceName"].unique()) == ["tb_currency", "tb_currency_hist"]
+    assert len(logs) == 4 and logs["Status"].eq(1).all()
+
+def test_chunked_suite_with_unsupported_expectation_falls_back(tmp_path):
+    import pandas as pd
+    path = tmp_path / "tb_currency.csv"
+    pd.DataFrame({"moneda": ["USD", "EUR", "GBP"], "compra": [3.7, 4.1, 4.8]}).to_csv(path, index=False)
+    config = _config(tmp_path)
+    config["global"]["chunk_size"] = 2
+    config["expectation_suites"]["currency"] = {"expectations": dict(
+        SUITE["expectations"], schema={"ExpectColumnValuesToBeOfType": [["compra", "float64"]]})}
+    source_config = {"type": "file", "datasets": [
+        {"name": "tb_currency", "path": str(path), "expectations_suite": "currency"}]}
+    file_name, table = _validate(tmp_path, config, source_config)
+    assert file_name == "tb_currency.csv"
+    assert len(table) == 3 and table["Status"].eq(1).all()
+
+class _FailingPool:
+    processes = 1
+    terminated = False
+
+    def apply_async(self, function, args):
+        raise RuntimeError("worker lost")
+
+    def terminate(self):
+        self.terminated = True
+
+def test_failure_leaves_a_callers_pool_to_its_owner(tmp_path):
+    from CreateExpectations import CreateExpectations
+    from utils import Utils
+    import run_validations
+    pool = _FailingPool()
+    with pytest.raises(RuntimeError):
+        run_validations.processes_parallel_validation(
+            {"database_source": _sqlite_source(tmp_path)}, _config(tmp_path), Utils(), CreateExpectations(),
+            "dq", "currency", "ingesta", str(tmp_path / "logs"), {}, {}, True, "ProcessPoolExecutor",
+            pool=pool)
+    assert not pool.terminated
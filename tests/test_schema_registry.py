@@ -0,0 +1,47 @@
+from datetime import date
+import pytest
+
+pytestmark = pytest.mark.usefixtures("jobs_path")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS `raw_sales.tb_prices` (
+    `fecha` DATE NOT NULL,
+    precio NUMERIC(10, 2),
+    cantidad INT64 not null,
+    PRIMARY KEY (fecha) NOT ENFORCED
+);
+CREATE TABLE raw_sales.tb_stores (tienda STRING, CONSTRAINT fk FOREIGN KEY (tienda) REFERENCES x(y) NOT ENFORCED);
+"""
+
+def test_parse_ddl_reduces_types_and_skips_constraints():
+    from schema_registry import _parse_ddl
+    assert list(_parse_ddl(DDL)) == [
+        ("raw_sales.tb_prices", [("fecha", "DATE", False), ("precio", "NUMERIC", True),
+                                 ("cantidad", "INT64", False)]),
+        ("raw_sales.tb_stores", [("tienda", "STRING", True)])]
+
+def test_first_definition_of_a_table_wins(tmp_path):
+    from schema_registry import SchemaRegistry
+    (tmp_path / "01_prices.sql").write_text(DDL)
+    (tmp_path / "02_prices.sql").write_text("CREATE TABLE raw_sales.tb_prices (fecha STRING);")
+    (tmp_path / "README.md").write_text("CREATE TABLE raw_sales.tb_readme (a STRING);")
+    registry = SchemaRegistry(str(tmp_path))
+    assert sorted(registry.tables) == ["raw_sales.tb_prices", "raw_sales.tb_stores"]
+    assert registry.get("raw_sales.tb_prices").names == ["fecha", "precio", "cantidad"]
+    with pytest.raises(ValueError):
+        registry.get("raw_sales.tb_readme")
+
+def test_conform_converts_values_and_nulls_the_rest():
+    from schema_registry import _parse_ddl, TableSchema
+    [(table, columns)] = _parse_ddl(DDL.split(";")[0])
+    schema = TableSchema(table, columns + [("nota", "STRING", True)])
+    assert schema.conform([{"fecha": "2024-01-02", "cantidad": "3", "nota": 1, "otro": "x"},
+                           {"fecha": "02/01/2024", "cantidad": "abc"}]) == [
+        (date(2024, 1, 2), None, 3, "1"), (None, None, None, None)]
+
+def test_repository_schema_of_the_currency_table():
+    from schema_registry import _get_registry
+    schema = _get_registry().get("raw_sales.tb_currency")
+    assert schema.columns == [("fecha", "STRING", True), ("moneda", "STRING", True),
+                              ("compra", "FLOAT64", True), ("venta", "FLOAT64", True),
+                              ("origen", "STRING", True), ("process_datetime", "STRING", True)]
@@ -0,0 +1,62 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pd = pytest.importorskip("pandas")
+np = pytest.importorskip("numpy")
+
+@pytest.mark.parametrize("distinct", [1000, 200000])
+def test_hyperloglog_estimate_within_its_error_bound(distinct):
+    from sketches import HyperLogLog
+    sketch = HyperLogLog(0.01)
+    sketch.update(pd.Series(np.arange(distinct)).repeat(2))
+    assert sketch.relative_standard_error <= 0.01
+    # Three standard errors
+    assert abs(sketch.estimate() - distinct) <= 3 * sketch.relative_standard_error * distinct
+
+def test_hyperloglog_merge_matches_a_single_pass():
+    from sketches import HyperLogLog
+    values = pd.Series([f"id-{i}" for i in range(50000)])
+    single, merged, other = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    single.update(values)
+    merged.update(values[:20000])
+    other.update(values[15000:])
+    merged.merge(other)
+    assert (merged.registers == single.registers).all()
+    assert merged.estimate() == single.estimate()
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(0.1))
+
+def _rank_errors(sketch, values, quantiles):
+    # Distance between each asked quantile and the true rank of the answer
+    ordered = np.sort(values)
+    answers = sketch.quantiles(quantiles)
+    return [abs(np.searchsorted(ordered, answer, side="right") / len(ordered) - quantile)
+            for answer, quantile in zip(answers, quantiles)]
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+def test_kll_rank_error_within_bound():
+    from sketches import KLLSketch
+    values = np.random.default_rng(7).permutation(100000).astype(float)
+    sketch = KLLSketch()
+    sketch.update(pd.Series(values))
+    assert sketch.count == len(values)
+    assert sum(len(level) for level in sketch.levels) < 4 * sketch.k
+    assert max(_rank_errors(sketch, values, QUANTILES)) <= sketch.rank_error()
+    assert sketch.quantiles([0, 1]) == [values.min(), values.max()]
+
+def test_kll_merged_chunks_match_a_single_pass():
+    from sketches import KLLSketch
+    values = np.random.default_rng(11).normal(size=60000)
+    single, merged = KLLSketch(), KLLSketch()
+    single.update(pd.Series(values))
+    for chunk in np.array_split(values, 6):
+        other = KLLSketch()
+        other.update(pd.Series(chunk))
+        merged.merge(other)
+    assert (merged.count, merged.min, merged.max) == (single.count, single.min, single.max)
+    for sketch in (single, merged):
+        assert max(_rank_errors(sketch, values, QUANTILES)) <= sketch.rank_error()
+    with pytest.raises(ValueError):
+        merged.merge(KLLSketch(50))
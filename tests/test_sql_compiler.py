@@ -0,0 +1,50 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pd = pytest.importorskip("pandas")
+
+APPROXIMATE_UNIQUE = {"type": "expect_column_unique_value_count_to_be_between",
+                      "kwargs": {"column": "id", "min_value": 1}, "meta": {"approximate": {"method": "hyperloglog", "relative_error": 0.01}}}
+
+def test_approximate_distinct_count_reports_its_error_bound():
+    from chunked_validation import ChunkedValidator
+    from sql_compiler import SqlSuiteCompiler
+    compiler = SqlSuiteCompiler([APPROXIMATE_UNIQUE], "suite", "bigquery")
+    answers = {"APPROX_COUNT_DISTINCT(`id`)": 1000, "COUNT(`id`)": 1200}
+    row = {alias: answers[sql] for sql, alias in compiler.aggregates.items()}
+    [sql_result] = compiler.results(row)
+    chunked = ChunkedValidator([APPROXIMATE_UNIQUE], "suite").validate(
+        [pd.DataFrame({"id": range(1000)})], ["id"])
+    [chunked_result] = chunked["results"]
+    details = sql_result["result"]["details"]
+    assert set(details) == set(chunked_result["result"]["details"])
+    assert details["registers"] == 2 ** 15
+    assert details["relative_standard_error"] == pytest.approx(0.0057, abs=1e-4)
+
+def _statistic(kind, column, min_value, max_value):
+    return {"type": f"expect_column_{kind}_to_be_between",
+            "kwargs": {"column": column, "min_value": min_value, "max_value": max_value}, "meta": {}}
+
+def test_min_and_max_of_text_and_date_columns():
+    import sqlite3
+    from datetime import date
+    from sql_compiler import SqlSuiteCompiler
+    configs = [_statistic("min", "fecha", "2024-01-01", "2024-01-31"),
+               _statistic("max", "moneda", "A", "Z")]
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE tb_currency (fecha TEXT, moneda TEXT)")
+    connection.executemany("INSERT INTO tb_currency VALUES (?, ?)",
+                           [("2024-01-03", "USD"), ("2024-01-02", "EUR")])
+
+    def execute(sql, params):
+        cursor = connection.execute(sql, params)
+        return dict(zip([column[0] for column in cursor.description], cursor.fetchone()))
+
+    result = SqlSuiteCompiler(configs, "suite", "sqlite").validate(execute, table="tb_currency")
+    assert [entry["result"]["observed_value"] for entry in result["results"]] == ["2024-01-02", "USD"]
+    assert result["success"]
+    # A DATE column comes back as a date, compared with ISO text bounds
+    compiler = SqlSuiteCompiler(configs[:1], "suite", "bigquery")
+    [entry] = compiler.results({alias: date(2024, 2, 1) for alias in compiler.aggregates.values()})
+    assert entry["result"]["observed_value"] == date(2024, 2, 1) and not entry["success"]
@@ -0,0 +1,57 @@
+import copy
+import json
+import pytest
+
+pytestmark = pytest.mark.usefixtures("data_quality_path")
+
+pytest.importorskip("great_expectations")
+pytest.importorskip("gcsfs")
+
+SUITE_CONFIG = {"expectations": {
+    "missingness_expectations": {"ExpectColumnValuesToNotBeNull": [["moneda", 1], ["moneda", 1]]},
+    "volume": {"ExpectTableRowCountToEqual": [3]}}}
+METADATA = dict(project="dq", sub_project="currency", stage="ingesta", source="file")
+
+@pytest.fixture
+def builds(data_quality_path, monkeypatch):
+    # Names of the suites built by the expectation builder, not loaded
+    from ge_utils import geutils
+    built = []
+    add_expectations_to_suite = geutils.add_expectations_to_suite
+    def counted(self, **kwargs):
+        built.append(kwargs["suite"].name)
+        return add_expectations_to_suite(self, **kwargs)
+    monkeypatch.setattr(geutils, "add_expectations_to_suite", counted)
+    return built
+
+def _compile(cache_path, suite_config=SUITE_CONFIG):
+    from CreateExpectations import CreateExpectations
+    from ge_utils import geutils
+    from suite_compiler import SuiteCompiler
+    expectations = suite_config["expectations"]
+    ge_utils_instance = geutils(expectations["missingness_expectations"], {}, {}, {}, {}, {}, {},
+                                expectations["volume"], {}, CreateExpectations())
+    return SuiteCompiler(str(cache_path)).compile(
+        ge_utils_instance, "currency", suite_config,
+        create_expectations_instance=CreateExpectations(), **METADATA)
+
+def test_second_compile_loads_the_cached_suite(tmp_path, builds):
+    from suite_compiler import expectation_configs
+    built, key = _compile(tmp_path)
+    cached, cached_key = _compile(tmp_path)
+    assert builds == [key] and cached_key == key
+    with open(tmp_path / f"{key}.json") as f:
+        stored = json.load(f)["expectations"]
+    # The duplicated not-null expectation is stored once
+    assert [config["type"] for config in stored] == [
+        "expect_column_values_to_not_be_null", "expect_table_row_count_to_equal"]
+    # Stored configurations round-trip through ExpectationConfiguration.to_domain_obj
+    assert expectation_configs(cached) == expectation_configs(built) == stored
+    assert cached.name == key
+
+def test_changed_configuration_misses_the_cache(tmp_path, builds):
+    _, key = _compile(tmp_path)
+    changed = copy.deepcopy(SUITE_CONFIG)
+    changed["expectations"]["volume"]["ExpectTableRowCountToEqual"] = [4]
+    _, changed_key = _compile(tmp_path, changed)
+    assert changed_key != key and builds == [key, changed_key]
@@ -0,0 +1,87 @@
+import json
+from datetime import date
+import pytest
+
+pytestmark = pytest.mark.usefixtures("jobs_path")
+
+TTL = 60
+
+def _age(cache, process_date, seconds):
+    # Move an entry's cached_at back as if it had been cached earlier
+    path = cache._path(process_date)
+    with open(path) as f:
+        entry = json.load(f)
+    entry["cached_at"] -= seconds
+    with open(path, "w") as f:
+        json.dump(entry, f)
+
+def test_current_day_rate_expires_after_ttl(tmp_path):
+    from utils import CurrencyCache
+    today = date.today().isoformat()
+    cache = CurrencyCache(str(tmp_path), today_ttl=TTL)
+    cache.put(today, {"compra": 3.7})
+    assert cache.get(today) == {"compra": 3.7}
+    _age(cache, today, TTL + 1)
+    assert cache.get(today) is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_past_day_rate_never_expires(tmp_path):
+    from utils import CurrencyCache
+    cache = CurrencyCache(str(tmp_path), today_ttl=TTL)
+    cache.put("2024-01-31", {"compra": 3.7})
+    _age(cache, "2024-01-31", 365 * 24 * 3600)
+    assert cache.get("2024-01-31") == {"compra": 3.7}
+    assert cache.get("2024-02-01") is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_load_manifest_keeps_the_current_day_open(tmp_path):
+    from utils import LoadManifest
+    today = date.today().isoformat()
+    path = str(tmp_path / "raw_sales.tb_currency.json")
+    LoadManifest(path).mark_loaded(["2024-01-01", "2024-01-02", today])
+    manifest = LoadManifest(path)
+    assert manifest.watermark() == "2024-01-02"
+    assert manifest.missing(["2024-01-01", "2024-01-02", "2024-01-03", today]) == ["2024-01-03", today]
+    with open(path) as f:
+        assert json.load(f)["watermark"] == "2024-01-02"
+
+@pytest.fixture
+def spark():
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+    return SparkSession.builder.master("local[1]").getOrCreate()
+
+def _sinks(calls):
+    return [lambda df: calls.append(("json", df.count())), lambda df: calls.append(("bigquery", df.count()))]
+
+@pytest.mark.parametrize("observe", [True, False])
+def test_write_once_observes_or_aggregates_the_rows(spark, monkeypatch, observe):
+    import pyspark.sql
+    from utils import _write_once
+    if not observe:
+        # Spark < 3.3 has no DataFrame.observe
+        monkeypatch.delattr(pyspark.sql, "Observation")
+    calls = []
+    stats = _write_once(spark.range(3), _sinks(calls))
+    assert stats == {"rows": 3}
+    assert calls == [("json", 3), ("bigquery", 3)]
+
+def test_write_once_without_observe_uses_the_fallback(spark, monkeypatch):
+    import pyspark.sql
+    from utils import _write_once
+    monkeypatch.delattr(pyspark.sql, "Observation")
+    calls = []
+    stats = _write_once(spark.range(3), _sinks(calls), fallback=lambda: {"rows": 3, "rejected": 0})
+    assert stats == {"rows": 3, "rejected": 0}
+    assert calls == [("json", 3), ("bigquery", 3)]
+
+def test_compacted_names_keep_the_output_path_for_one_object():
+    from utils import _compacted_names
+    assert _compacted_names("gs://b/t/20240102/tb_currency_ab12.parquet", ".parquet", 1) == [
+        "gs://b/t/20240102/tb_currency_ab12.parquet"]
+    assert _compacted_names("gs://b/t/20240102/tb_currency_ab12.json.gz", ".json.gz", 2) == [
+        "gs://b/t/20240102/tb_currency_ab12-00000.json.gz", "gs://b/t/20240102/tb_currency_ab12-00001.json.gz"]
+
+def test_missing_manifest_reads_as_none(tmp_path):
+    from utils import _read_manifest
+    assert _read_manifest(str(tmp_path / "out.parquet")) is None